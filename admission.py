@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+
+# =============================================================================
+#   Очередь допуска к открытию кейса
+# =============================================================================
+#
+#   Зритель попадает в очередь после !open и выходит из неё, когда оверлей
+#   открыл ему кейс. Пока он в очереди, повторные !open не добавляют его
+#   второй раз. Глубина ограничена: при переполнении новые зрители либо
+#   молча отбрасываются ("drop"), либо получают ответ в чат ("notify").
+
+OVERFLOW_DROP = "drop"
+OVERFLOW_NOTIFY = "notify"
+
+
+class AdmissionQueue:
+    """
+    Потокобезопасная очередь с номерами событий для SSE.
+    Все операции — O(1), кроме выборки «после номера N» для потока событий:
+    она идёт с конца и останавливается на первом уже отданном событии.
+    """
+
+    def __init__(self, max_depth=500, overflow=OVERFLOW_DROP):
+        self.max_depth = max_depth
+        self.overflow = overflow
+
+        self.cond = threading.Condition()       # защищает очередь и будит потоки SSE
+        self._entries = OrderedDict()           # {номер события: запись}
+        self._ids_by_key = {}                   # {ключ зрителя: номер события}
+        # Номер последнего выданного события. Начинаем с текущего времени в мс,
+        # чтобы номера росли и между перезапусками сервера — иначе оверлей,
+        # запомнивший старый номер, пропускал бы новые события.
+        self.last_event_id = int(time.time() * 1000)
+
+        self.admitted = 0
+        self.duplicates = 0
+        self.overflowed = 0
+        self.completed = 0
+        self._wait_total = 0.0
+        self.max_wait = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def admit(self, key, username, user_id=None):
+        """
+        Пытается поставить зрителя в очередь.
+        Возвращает (запись, None) или (None, причина): "duplicate" / "overflow".
+        Потоки SSE будятся отдельным notify() — irc_listener зовёт его
+        один раз на пачку строк чата.
+        """
+        with self.cond:
+            if key in self._ids_by_key:
+                self.duplicates += 1
+                return None, "duplicate"
+            if len(self._entries) >= self.max_depth:
+                self.overflowed += 1
+                return None, "overflow"
+
+            self.last_event_id += 1
+            entry = {"id": self.last_event_id, "username": username, "user_id": user_id,
+                     "key": key, "queued_at": time.time()}
+            self._entries[entry["id"]] = entry
+            self._ids_by_key[key] = entry["id"]
+            self.admitted += 1
+            return entry, None
+
+    def notify(self):
+        """Будит подключённые потоки событий"""
+        with self.cond:
+            self.cond.notify_all()
+
+    def since(self, last_id):
+        """Записи с номером события больше last_id (в порядке очереди)"""
+        with self.cond:
+            newer = []
+            for entry in reversed(self._entries.values()):
+                if entry["id"] <= last_id:
+                    break
+                newer.append(self.public(entry))
+            newer.reverse()
+            return newer
+
+    def pop_next(self):
+        """Забирает первого в очереди (для опроса /api/get_pending)"""
+        with self.cond:
+            if not self._entries:
+                return None
+            _, entry = self._entries.popitem(last=False)
+            self._ids_by_key.pop(entry["key"], None)
+            return self.public(entry)
+
+    def complete(self, key):
+        """Убирает зрителя из очереди после открытия кейса и учитывает время ожидания"""
+        with self.cond:
+            event_id = self._ids_by_key.pop(key, None)
+            if event_id is None:
+                return
+            entry = self._entries.pop(event_id, None)
+            if entry is None:
+                return
+            wait = time.time() - entry["queued_at"]
+            self.completed += 1
+            self._wait_total += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    @staticmethod
+    def public(entry):
+        """Запись в том виде, в каком её получает оверлей"""
+        return {"id": entry["id"], "username": entry["username"], "user_id": entry["user_id"]}
+
+    def stats(self):
+        """Глубина очереди и время ожидания"""
+        with self.cond:
+            oldest = next(iter(self._entries.values()), None)
+            return {
+                "depth": len(self._entries),
+                "max_depth": self.max_depth,
+                "overflow_policy": self.overflow,
+                "admitted": self.admitted,
+                "duplicates": self.duplicates,
+                "overflowed": self.overflowed,
+                "completed": self.completed,
+                "oldest_wait_sec": round(time.time() - oldest["queued_at"], 1) if oldest else 0.0,
+                "avg_wait_sec": round(self._wait_total / self.completed, 1) if self.completed else 0.0,
+                "max_wait_sec": round(self.max_wait, 1),
+            }
@@ -1,16 +1,53 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
+import atexit
+import copy
+import gzip
+import hashlib
+import importlib.util
 import json
 import os
 import random
-import webbrowser
 import socket
 import time
 import threading
 
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_file, send_from_directory
 from flask_cors import CORS
 
+from admission import OVERFLOW_NOTIFY, AdmissionQueue
+from catalog import dump_items, load_items
+from droptable import DropTable
+from cooldowns import CooldownTable
+from dropstats import WINDOWS as STATS_WINDOWS, DropStats
+from simulator import simulate
+from imagecache import ImageCache, url_key
+from locks import StripedLock
+from metrics import Registry
+from scheduler import DelayQueue
+from shared import (
+    COOLDOWN_PURGE_INTERVAL, PUMP_INTERVAL, ROLE_MASTER, ROLE_WORKER, SharedAdmissionQueue, SharedCooldowns, SharedDb,
+    SharedDropStats,
+)
+from storage import CooldownJournal, WriteBehind, atomic_write_text, open_inventory_store
+from twitch_irc import (
+    CHAT_RATE_LIMIT, MAX_MESSAGE_CHARS, TWITCH_IRC_HOST, TWITCH_IRC_PORT, ChatNotices, ChatWriter, IrcLineReader,
+    parse_irc_line,
+)
+
+# waitress — WSGI-сервер для serve --workers (работает и на Windows).
+# Без него обработчики используют сервер из Werkzeug
+HAS_WAITRESS = importlib.util.find_spec("waitress") is not None
+
+# tkinter нужен только окну настроек и импортируется в App, чтобы сервер
+# без окна (python -m ricase serve) запускался без дисплея и быстрее
+tk = ttk = messagebox = filedialog = None
+
+
+def _import_gui():
+    global tk, ttk, messagebox, filedialog
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+
+
 # =============================================================================
 #   Инициализация Flask и константы
 # =============================================================================
@@ -18,14 +55,50 @@ from flask_cors import CORS
 app = Flask(__name__, static_folder='static')
 CORS(app)
 
-SETTINGS_FILE    = "settings.json"
-INVENTORY_FILE   = "inventory.json"
-COOLDOWNS_FILE   = "cooldowns.json"
+SETTINGS_FILE    = os.environ.get("RICASE_CONFIG", "settings.json")   # --config у python -m ricase
+CHANNEL_SETTINGS_FILE = "settings.json"   # свои предметы канала в channels/<имя>/ (--config не влияет)
+INVENTORY_FILE   = "inventory.json"       # старый формат, переносится в inventory.db
+INVENTORY_DB     = "inventory.db"
+COOLDOWNS_FILE   = "cooldowns.json"       # сжатый снимок кулдаунов
+COOLDOWNS_JOURNAL = "cooldowns.journal"   # дописываемый журнал открытий
+DROP_STATS_FILE  = "drop_stats.json"      # счётчики выпадений для проверки шансов
+SHARED_DB        = "shared.db"            # очередь и кулдауны для serve --workers
+IMAGE_CACHE_DIR  = "image_cache"          # уменьшенные картинки предметов
 
 # Глобальные переменные
-pending_users = []              # очередь пользователей, ждущих открытия кейса
-last_open_time = {}             # {username: timestamp последнего открытия}
 COOLDOWN_SECONDS = 3600         # 1 час = 3600 секунд
+SSE_KEEPALIVE_SECONDS = 15      # как часто слать пустой комментарий в открытый поток событий
+QUEUE_MAX_DEPTH = 500           # сколько зрителей может ждать открытия (queue_max_depth в настройках)
+USER_LOCK_STRIPES = 64          # блокировок на канал для атомарного открытия кейса
+GZIP_MIN_BYTES = 1024           # ответы меньше этого не сжимаем
+IMAGE_CACHE_MB = 64             # предел кеша картинок (image_cache_mb в настройках)
+IMAGE_MAX_AGE = 365 * 24 * 3600 # сколько браузер хранит картинку из кеша, сек
+PERSIST_INTERVAL = 1.0          # как часто дропы и кулдауны сбрасываются на диск, сек (persist_interval_sec)
+WORKER_THREADS = 16             # потоков на процесс-обработчик в serve --workers
+
+# Роль процесса при serve --workers: "master" (чат) или "worker" (HTTP);
+# без переменной — обычный режим, всё состояние в памяти одного процесса
+SHARED_ROLE = os.environ.get("RICASE_SHARED_ROLE") or None
+
+# Ключи настроек, которые никогда не уходят в браузер
+SECRET_SETTINGS = ("oauth_token",)
+# Каталог (предметы и редкости) отдаётся отдельно — /api/items
+CATALOG_SETTINGS = ("items", "rarities")
+
+# Темп анимации оверлея (раздел "animation" в настройках). Оверлей сокращает
+# прокрутку, чтобы разобрать очередь примерно за drain_target_sec, а при
+# очереди от burst_threshold показывает результаты пачками по burst_size
+ANIMATION_DEFAULTS = {
+    "spin_ms": 6200,
+    "hold_ms": 2150,
+    "fade_ms": 1000,
+    "gap_ms": 800,
+    "drain_target_sec": 300,
+    "min_scale": 0.25,
+    "burst_threshold": 15,
+    "burst_size": 4,
+    "burst_hold_ms": 4000,
+}
 
 # Дефолтные настройки (используются, если settings.json отсутствует или повреждён)
 DEFAULT_SETTINGS = {
@@ -66,8 +139,7 @@ DEFAULT_SETTINGS = {
 def load_settings():
     """Загружает настройки из файла или создаёт дефолтные"""
     if not os.path.exists(SETTINGS_FILE):
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(DEFAULT_SETTINGS, f, ensure_ascii=False, indent=2)
+        save_settings(DEFAULT_SETTINGS)
         return DEFAULT_SETTINGS.copy()
 
     try:
@@ -75,66 +147,378 @@ def load_settings():
             return json.load(f)
     except Exception as e:
         print(f"Ошибка чтения settings.json: {e}")
+        # Испорченный файл не затираем следующим сохранением — откладываем в сторону
+        try:
+            os.replace(SETTINGS_FILE, SETTINGS_FILE + ".broken")
+            print(f"Испорченный файл сохранён как {SETTINGS_FILE}.broken")
+        except OSError:
+            pass
         print("Используются дефолтные настройки")
         return DEFAULT_SETTINGS.copy()
 
 
 def save_settings(data):
-    """Сохраняет переданные настройки в файл"""
+    """
+    Сохраняет переданные настройки в файл. Запись атомарная: при сбое
+    на диске остаётся старый или новый settings.json, но не обрезанный.
+    """
     try:
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        atomic_write_text(SETTINGS_FILE, json.dumps(data, ensure_ascii=False, indent=2))
         return True
     except Exception as e:
         print(f"Ошибка сохранения настроек: {e}")
         return False
 
 
-# Загружаем настройки при старте
-settings = load_settings()
-
-
 # =============================================================================
-#   Кулдауны пользователей
+#   Каналы: очередь, кулдауны, инвентарь и таблица дропа каждого канала
 # =============================================================================
+#
+#   Основной канал ("channel") хранит файлы в папке программы, как раньше.
+#   Дополнительные каналы ("extra_channels") — каждый в channels/<канал>/,
+#   там же может лежать свой settings.json с предметами и редкостями
+#   (всё, чего в нём нет, берётся из основных настроек).
+#   Оверлей основного канала — http://127.0.0.1:5000/,
+#   дополнительного — http://127.0.0.1:5000/c/<канал>/
+
+CHANNELS_DIR = "channels"
+
+
+class CachedPayload:
+    """Сериализованный JSON-ответ: тело, сжатое тело и ETag по содержимому"""
+
+    def __init__(self, body):
+        self.raw = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = hashlib.blake2b(self.raw, digest_size=10).hexdigest()
+        self.gzipped = gzip.compress(self.raw, 6) if len(self.raw) >= GZIP_MIN_BYTES else None
+
+    def response(self):
+        """Ответ на текущий запрос: 304 по If-None-Match, иначе JSON (сжатый, если браузер умеет)"""
+        use_gzip = self.gzipped is not None and "gzip" in request.accept_encodings
+        etag = self.etag + "-gz" if use_gzip else self.etag
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            resp = Response(self.gzipped if use_gzip else self.raw, mimetype="application/json")
+            if use_gzip:
+                resp.headers["Content-Encoding"] = "gzip"
+        resp.set_etag(etag)
+        # Браузер хранит ответ, но каждый раз сверяет ETag — правки видны сразу
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["Vary"] = "Accept-Encoding"
+        return resp
 
-def load_cooldowns():
-    """Загружает время последнего открытия кейса каждым пользователем"""
-    global last_open_time
-    if os.path.exists(COOLDOWNS_FILE):
-        try:
-            with open(COOLDOWNS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                last_open_time = {k: float(v) for k, v in data.items()}
-        except Exception:
-            last_open_time = {}
-    else:
-        last_open_time = {}
 
+# Картинки предметов скачиваются один раз и отдаются оверлею с /img/<ключ>.
+# С --workers качает и чистит кеш только главный процесс, обработчики читают
+image_cache = ImageCache(
+    IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MB * 1024 * 1024, readonly=SHARED_ROLE == ROLE_WORKER
+)
 
-def save_cooldowns():
-    """Сохраняет кулдауны в файл"""
-    try:
-        with open(COOLDOWNS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({k: str(v) for k, v in last_open_time.items()}, f, indent=2)
-    except Exception as e:
-        print(f"Ошибка сохранения cooldowns: {e}")
+
+def public_item(item):
+    """Предмет для оверлея: с локальной ссылкой на картинку, если она есть в каталоге"""
+    url = (item.get("image_url") or "").strip()
+    if not url.startswith(("http://", "https://")):
+        return item
+    return {**item, "image_local": f"/img/{url_key(url)}"}
+
+
+def normalize_channel(name):
+    """Имя канала без # и @, в нижнем регистре"""
+    return (name or "").strip().lstrip("#@").lower()
+
+
+class ChannelSnapshot:
+    """
+    Настройки канала одной версии и всё, что из них вычислено: таблица
+    дропа, названия редкостей, готовые ответы /api/settings и /api/items.
+    Собирается целиком при сохранении настроек и подменяется одним
+    присваиванием; после этого не меняется, поэтому запрос, взявший
+    снимок, видит одну версию от начала до конца без блокировок.
+    """
+    __slots__ = ("version", "settings", "drop_table", "rarity_names", "payloads")
+
+    def __init__(self, version, data, drop_table):
+        self.version = version
+        self.settings = data
+        self.drop_table = drop_table
+        self.rarity_names = {k: v.get("name", k) for k, v in data.get("rarities", {}).items()}
+        # JSON и его gzip — один раз на версию, а не в первом запросе после сохранения
+        items = {
+            "items": [public_item(it) for it in data.get("items", [])],
+            "rarities": data.get("rarities", {}),
+            "version": version,
+        }
+        public = {k: v for k, v in data.items() if k not in SECRET_SETTINGS + CATALOG_SETTINGS}
+        public["version"] = version
+        self.payloads = {"items": CachedPayload(items), "settings": CachedPayload(public)}
+
+
+class ChannelState:
+    """Всё состояние одного канала"""
+
+    def __init__(self, name, data_dir, storage_backend):
+        self.name = name
+        self.data_dir = data_dir
+        if data_dir:
+            os.makedirs(data_dir, exist_ok=True)
+
+        self.snapshot = None                    # ChannelSnapshot текущей версии настроек
+
+        self.user_locks = StripedLock(USER_LOCK_STRIPES)   # один зритель — одно открытие за раз
+        self.inventory_store = open_inventory_store(
+            storage_backend, self.path(INVENTORY_FILE), self.path(INVENTORY_DB), writer=persistence,
+            shared=shared_db is not None
+        )
+        self.cooldown_journal = CooldownJournal(
+            self.path(COOLDOWNS_FILE), self.path(COOLDOWNS_JOURNAL), COOLDOWN_SECONDS, writer=persistence
+        )
+        if shared_db is None:
+            self.queue = AdmissionQueue()       # очередь !open → оверлей
+            # {ключ кулдауна: timestamp последнего открытия} — только за последний кулдаун
+            self.cooldowns = CooldownTable(COOLDOWN_SECONDS)
+        else:
+            # Несколько процессов: очередь и кулдауны в shared.db, канал в ней —
+            # по папке (у основного "", так что переименование его не теряет)
+            self.queue = SharedAdmissionQueue(shared_db, data_dir)
+            self.cooldowns = SharedCooldowns(shared_db, data_dir, COOLDOWN_SECONDS)
+        self.load_cooldowns()
+        if SHARED_ROLE == ROLE_WORKER:
+            self.drop_stats = SharedDropStats(shared_db, data_dir, self.path(DROP_STATS_FILE))
+        else:
+            self.drop_stats = DropStats(self.path(DROP_STATS_FILE), writer=persistence)
+
+    def path(self, filename):
+        return os.path.join(self.data_dir, filename) if self.data_dir else filename
+
+    def close(self):
+        """Канал убрали из настроек: дописать и закрыть его файлы и базу"""
+        for store in (self.inventory_store, self.cooldown_journal, self.drop_stats):
+            try:
+                store.close()
+            except Exception as e:
+                print(f"Ошибка закрытия данных #{self.name}: {e}")
+
+    # ------------------------------------------------------------------
+    #   Настройки и таблица дропа
+    # ------------------------------------------------------------------
+
+    # Для чтения одного поля. Если нужно несколько — взять ch.snapshot
+    # один раз, чтобы не смешать две версии
+    @property
+    def settings(self):
+        return self.snapshot.settings
+
+    @property
+    def settings_version(self):
+        return self.snapshot.version if self.snapshot else 0
+
+    @property
+    def drop_table(self):
+        return self.snapshot.drop_table
+
+    def apply_settings(self, base):
+        """Собирает настройки канала поверх основных и публикует новый снимок"""
+        data = dict(base)
+        own_file = self.path(CHANNEL_SETTINGS_FILE) if self.data_dir else None
+        if own_file and os.path.exists(own_file):
+            try:
+                with open(own_file, "r", encoding="utf-8") as f:
+                    data.update(json.load(f))
+            except Exception as e:
+                print(f"Ошибка чтения {own_file}: {e}")
+        data["channel"] = self.name
+        data["animation"] = {**ANIMATION_DEFAULTS, **(data.get("animation") or {})}
+
+        names = [it["name"] for it in data.get("items", [])]
+        table = DropTable(data, self.inventory_store.item_indices(names))
+        self.snapshot = ChannelSnapshot(self.settings_version + 1, data, table)
+
+        self.drop_stats.configure(table.rarity_chances, data.get("rarities", {}), data.get("items", []))
+        self.queue.max_depth = int(data.get("queue_max_depth", QUEUE_MAX_DEPTH))
+        self.queue.overflow = data.get("queue_overflow", "drop")
+        self.queue.notify()     # открытые потоки событий сообщат оверлею о новой версии
+
+    def payload(self, name):
+        """Готовый ответ для /api/settings ("settings") или /api/items ("items") текущей версии"""
+        return self.snapshot.payloads[name]
+
+    # ------------------------------------------------------------------
+    #   Кулдауны
+    # ------------------------------------------------------------------
+
+    def load_cooldowns(self):
+        """
+        Загружает время последнего открытия кейса: снимок + проигрывание журнала.
+        С --workers их переносит в shared.db главный процесс.
+        """
+        if SHARED_ROLE == ROLE_WORKER:
+            return
+        try:
+            self.cooldowns.load(self.cooldown_journal.load())
+        except Exception as e:
+            print(f"Ошибка загрузки кулдаунов #{self.name}: {e}")
+            self.cooldowns.clear()
+
+    def save_cooldowns(self):
+        """Сохраняет все кулдауны одним снимком (с очисткой журнала)"""
+        self.cooldown_journal.compact(self.cooldowns.snapshot)
+
+    def record_cooldown(self, key, timestamp):
+        """
+        Запоминает время открытия и дописывает одну строку в журнал.
+        Полный снимок пишется в фоне, только когда журнал вырастет.
+        С --workers журнал дописывает shared_pump по записям из shared.db.
+        """
+        self.cooldowns.set(key, timestamp)
+        if shared_db is None:
+            self.cooldown_journal.append(key, timestamp, self.cooldowns.snapshot)
+
+    def reset_cooldowns(self):
+        self.cooldowns.clear()
+        self.cooldown_journal.reset()
+
+    def can_user_open(self, key):
+        """
+        Проверяет, прошёл ли кулдаун у пользователя (key — из cooldown_key).
+        Возвращает: (можно_открыть: bool, оставшееся_времени_сек: int)
+        """
+        opened_at = self.cooldowns.get(key)
+        if opened_at is None:
+            return True, 0
+        elapsed = time.time() - opened_at
+        if elapsed >= COOLDOWN_SECONDS:
+            return True, 0
+        return False, COOLDOWN_SECONDS - int(elapsed)
+
+
+# Дропы и кулдауны всех каналов пишутся на диск фоновым потоком пачками.
+# При штатном выходе (в том числе по SIGTERM у python -m ricase serve)
+# всё накопленное сбрасывается; при сбое питания теряется не больше
+# последнего интервала, но файлы остаются целыми
+persistence = WriteBehind(PERSIST_INTERVAL)
+atexit.register(persistence.flush)
+
+# Одно общее подключение для /api/send_chat и ответов слушателя в чат.
+# Адрес и лимит (chat_rate_limit = 100, если бот — модератор канала)
+# задаёт set_settings; подключается при первой отправке
+chat_writer = ChatWriter()
+
+# serve --workers: общее для процессов состояние (см. shared.py)
+shared_db = SharedDb(SHARED_DB, SHARED_ROLE) if SHARED_ROLE else None
+if SHARED_ROLE == ROLE_MASTER:
+    shared_db.start_event_ids()
+
+channels = {}               # {имя канала: ChannelState}; при смене настроек подменяется целиком
+primary_channel = None      # основной канал (файлы в папке программы)
+settings_version = 0        # растёт при каждом set_settings
+_settings_lock = threading.Lock()   # окно настроек и перечитывание по сигналу не пересекаются
+
+
+def all_channels():
+    """Основной канал и все дополнительные"""
+    return [primary_channel] + [ch for ch in channels.values() if ch is not primary_channel]
+
+
+def get_channel(name=None):
+    """Канал по имени из URL; None — основной. Неизвестный канал → None"""
+    if name is None:
+        return primary_channel
+    return channels.get(normalize_channel(name))
+
+
+def set_settings(data):
+    """
+    Делает переданные настройки текущими и пересобирает всё, что из них
+    вычисляется: список каналов и таблицы дропа. Вызывать после загрузки и сохранения.
+
+    Работает на горячую: всё новое собирается в стороне и подменяется
+    присваиваниями (снимок каждого канала, словарь каналов, settings), так
+    что запросы и слушатель чата видят старую или новую версию, но не
+    половину. Очереди, кулдауны и подключение к чату остаются; слушатель
+    сам зайдёт в новые каналы и выйдет из убранных.
+    """
+    global settings, primary_channel, channels, settings_version
+    data = copy.deepcopy(data)      # опубликованные настройки никто не меняет на месте
+    backend = data.get("storage", "sqlite")
+
+    with _settings_lock:
+        persistence.interval = float(data.get("persist_interval_sec", PERSIST_INTERVAL))
+
+        if primary_channel is None:
+            primary_channel = ChannelState(normalize_channel(data.get("channel")), "", backend)
+        primary_channel.name = normalize_channel(data.get("channel"))
+
+        wanted = {primary_channel.name: primary_channel} if primary_channel.name else {}
+        for name in data.get("extra_channels", []):
+            name = normalize_channel(name)
+            if name and name not in wanted:
+                # Основной канал уже переименован выше: если его прежнее имя
+                # стало дополнительным каналом, у того свои папка и очередь
+                ch = channels.get(name)
+                if ch is None or ch is primary_channel:
+                    ch = ChannelState(name, os.path.join(CHANNELS_DIR, name), backend)
+                wanted[name] = ch
+
+        for ch in set(wanted.values()) | {primary_channel}:
+            ch.apply_settings(data)
+
+        # Убранные каналы закрываем здесь же, под блокировкой: если канал
+        # вернут следующим сохранением, он откроет файлы уже после закрытия
+        for ch in set(channels.values()) - set(wanted.values()) - {primary_channel}:
+            ch.close()
+
+        channels = wanted
+        settings = data
+        settings_version += 1
+        if SHARED_ROLE == ROLE_MASTER:
+            shared_db.publish_settings(data, settings_version)
+
+    # Адрес чата и лимит отправки: при смене адреса подключение пересоздаётся
+    chat_writer.set_server(
+        data.get("irc_host", TWITCH_IRC_HOST), int(data.get("irc_port", TWITCH_IRC_PORT)),
+        data.get("chat_rate_limit", CHAT_RATE_LIMIT),
+    )
+
+    # Новые ссылки на картинки начинают скачиваться в фоне сразу после сохранения
+    image_cache.max_bytes = int(data.get("image_cache_mb", IMAGE_CACHE_MB)) * 1024 * 1024
+    image_cache.register(
+        it.get("image_url", "") for ch in all_channels() for it in ch.settings.get("items", [])
+    )
+
+
+# Загружаем настройки при старте. Обработчик (--workers) берёт те, что
+# опубликовал главный процесс: с его --channel и последним перечитыванием
+settings = None
+_shared_settings_version = 0
+
+
+def follow_shared_settings():
+    """Обработчик: применяет настройки, если главный процесс опубликовал новую версию"""
+    global _shared_settings_version
+    version = shared_db.settings_version()
+    if version == _shared_settings_version:
+        return False
+    version, data = shared_db.settings()
+    _shared_settings_version = version
+    if data is not None:
+        set_settings(data)
+    return data is not None
 
 
-load_cooldowns()
+if SHARED_ROLE != ROLE_WORKER or not follow_shared_settings():
+    set_settings(load_settings())
+if SHARED_ROLE == ROLE_WORKER:
+    shared_db.on_change(follow_shared_settings)
 
 
-def can_user_open(username):
+def cooldown_key(username, user_id=None):
     """
-    Проверяет, прошёл ли кулдаун у пользователя.
-    Возвращает: (можно_открыть: bool, оставшееся_времени_сек: int)
+    Ключ кулдауна: Twitch user-id из тегов IRCv3, если он известен
+    (не меняется при смене ника), иначе — ник
     """
-    if username not in last_open_time:
-        return True, 0
-    elapsed = time.time() - last_open_time[username]
-    if elapsed >= COOLDOWN_SECONDS:
-        return True, 0
-    return False, COOLDOWN_SECONDS - int(elapsed)
+    return f"id:{user_id}" if user_id else username
 
 
 def format_remaining(seconds):
@@ -153,174 +537,400 @@ def format_remaining(seconds):
     return " ".join(parts)
 
 
+# =============================================================================
+#   Метрики (/api/metrics)
+# =============================================================================
+#
+#   Всегда включены: запись — одно сложение под блокировкой. Глубина очередей
+#   и счётчики ChatWriter снимаются в момент запроса метрик.
+
+metrics = Registry()
+
+REQUEST_SECONDS = metrics.histogram(
+    "ricase_request_seconds", "Время обработки запросов API")
+STORAGE_WRITE_SECONDS = metrics.histogram(
+    "ricase_storage_write_seconds", "Время записи дропа и кулдауна в запросе (на диск — отложенно)")
+IRC_LINES = metrics.counter(
+    "ricase_irc_lines_total", "Строк IRC разобрано слушателем чата", rate_window=60)
+OPEN_COMMANDS = metrics.counter(
+    "ricase_open_commands_total", "Команды !open по результату (queued, duplicate, overflow, cooldown)")
+IRC_RECONNECTS = metrics.counter(
+    "ricase_irc_reconnects_total", "Переподключения слушателя чата")
+IRC_PING_LAG_SECONDS = metrics.histogram(
+    "ricase_irc_ping_lag_seconds", "Время от нашего PING до PONG от Twitch",
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+CHAT_ENQUEUED = metrics.counter(
+    "ricase_chat_enqueued_total", "Сообщения в чат по результату постановки в очередь (queued, rejected)")
+
+
+def _per_channel(stat):
+    return lambda: [({"channel": ch.name}, ch.queue.stats()[stat]) for ch in all_channels()]
+
+
+def _chat_stat(stat):
+    return lambda: float(chat_writer.stats()[stat])
+
+
+metrics.gauge("ricase_queue_depth", "Зрителей в очереди на открытие", _per_channel("depth"))
+metrics.gauge("ricase_queue_oldest_wait_seconds", "Сколько ждёт первый в очереди", _per_channel("oldest_wait_sec"))
+metrics.gauge("ricase_queue_overflowed_total", "Отброшено из-за переполнения очереди",
+              _per_channel("overflowed"), kind="counter")
+metrics.gauge("ricase_irc_ping_lag_last_seconds", "Последняя задержка PING → PONG",
+              lambda: irc_status["ping_lag_sec"])
+metrics.gauge("ricase_irc_connected", "Слушатель чата подключён (1/0)",
+              lambda: float(irc_status["connected"]))
+metrics.gauge("ricase_chat_connected", "Подключение для отправки в чат активно (1/0)", _chat_stat("connected"))
+metrics.gauge("ricase_chat_queued", "Сообщений ждут отправки в чат", _chat_stat("queued"))
+metrics.gauge("ricase_chat_sent_total", "Отправлено сообщений в чат", _chat_stat("sent"), kind="counter")
+metrics.gauge("ricase_chat_failed_total", "Сообщения, которые не удалось отправить", _chat_stat("failed"), kind="counter")
+metrics.gauge("ricase_chat_dropped_total", "Сообщения, отброшенные из-за полной очереди отправки",
+              _chat_stat("dropped"), kind="counter")
+metrics.gauge("ricase_chat_reconnects_total", "Переподключения для отправки в чат",
+              _chat_stat("reconnects"), kind="counter")
+metrics.gauge("ricase_chat_send_latency_avg_seconds", "Средняя задержка от постановки в очередь до отправки",
+              lambda: chat_writer.stats()["avg_latency_ms"] / 1000)
+metrics.gauge("ricase_chat_notices_pending", "Ответы зрителям (кулдаун, переполнение), ждущие отправки",
+              lambda: float(chat_notices.stats()["pending"]))
+metrics.gauge("ricase_chat_notices_lag_seconds", "Сколько ждёт самый старый неотправленный ответ зрителю",
+              lambda: chat_notices.stats()["lag_sec"])
+metrics.gauge("ricase_chat_notices_total", "Ответы зрителям по судьбе (mentions — ушли в чат)",
+              lambda: [({"result": k}, chat_notices.stats()[k]) for k in ("mentions", "stale", "dropped")],
+              kind="counter")
+metrics.gauge("ricase_chat_notice_messages_total", "Строк чата, в которые склеены ответы зрителям",
+              lambda: float(chat_notices.stats()["messages"]), kind="counter")
+metrics.gauge("ricase_announce_pending", "Результаты открытий, ждущие объявления в чат",
+              lambda: float(announcements.stats()["pending"]))
+metrics.gauge("ricase_announce_total", "Результаты открытий, объявленные в чат сервером",
+              lambda: float(announcements.stats()["fired"]), kind="counter")
+metrics.gauge("ricase_announce_late_max_seconds", "Самое большое опоздание объявления от момента показа",
+              lambda: announcements.stats()["max_late_ms"] / 1000)
+
+metrics.gauge("ricase_settings_version", "Сколько раз применялись настройки с запуска",
+              lambda: float(settings_version))
+metrics.gauge("ricase_cooldown_entries", "Зрителей с действующим кулдауном (в памяти)",
+              lambda: [({"channel": ch.name}, len(ch.cooldowns)) for ch in all_channels()])
+metrics.gauge("ricase_persist_pending", "Дропов ждут записи на диск",
+              lambda: float(sum(ch.inventory_store.pending_count() for ch in all_channels())))
+metrics.gauge("ricase_persist_flush_last_seconds", "Длительность последнего сброса на диск",
+              lambda: persistence.stats()["last_flush_ms"] / 1000)
+metrics.gauge("ricase_persist_flush_max_seconds", "Самый долгий сброс на диск",
+              lambda: persistence.stats()["max_flush_ms"] / 1000)
+metrics.gauge("ricase_persist_errors_total", "Ошибки записи на диск", lambda: float(persistence.errors), kind="counter")
+
+# Состояние слушателя чата (заполняет irc_listener)
+irc_status = {"connected": False, "ping_lag_sec": 0.0}
+
+
 # =============================================================================
 #   Отправка сообщений в чат Twitch
 # =============================================================================
 
-def send_chat_message(message):
+
+def render_notice(kind, entries):
     """
-    Отправляет сообщение в чат Twitch через IRC.
-    Использует сохранённый oauth-токен и канал из настроек.
+    Текст склеенного ответа зрителям. entries — [(ник, конец кулдауна)];
+    для одного зрителя текст тот же, что раньше уходил отдельной строкой.
     """
-    token = settings.get("oauth_token", "").strip()
-    channel = settings.get("channel", "").strip().lstrip("#")
-    bot_username = "bot_user"
+    now = time.time()
+    if kind == "cooldown":
+        if len(entries) == 1:
+            username, until = entries[0]
+            return f"@{username} подожди ещё {format_remaining(int(until - now))}"
+        return ", ".join(
+            f"@{username} {format_remaining(int(until - now))}" for username, until in entries
+        ) + " — кулдаун ещё не прошёл"
+    mentions = " ".join(f"@{username}" for username, _ in entries)
+    return f"{mentions} очередь переполнена, {'попробуй' if len(entries) == 1 else 'попробуйте'} чуть позже"
+
+
+# Ответы зрителям на !open (кулдаун, переполнение) склеиваются по каналу
+chat_notices = ChatNotices(chat_writer, render_notice)
+
+
+def _chat_target(channel):
+    """
+    Канал для отправки (по умолчанию основной) с настроенным ChatWriter
+    или None, если токена или канала нет.
+    """
+    current = settings
+    token = current.get("oauth_token", "").strip()
+    channel = normalize_channel(channel or current.get("channel", ""))
+    bot_username = current.get("bot_username", "").strip().lower() or "bot_user"
 
     if not token.startswith("oauth:") or not channel:
         print("Нет валидного токена или канала → сообщение не отправлено")
+        return None
+    chat_writer.configure(token, bot_username)
+    return channel
+
+
+def send_chat_notice(kind, username, channel=None, until=None):
+    """
+    Ответ зрителю, который можно склеить с такими же ("cooldown" или
+    "overflow"). Только ставит в память — слушатель чата не ждёт отправки.
+    until — когда ответ теряет смысл (конец кулдауна).
+    """
+    channel = _chat_target(channel)
+    if channel is None:
         return False
+    chat_notices.notify(channel, kind, username, until)
+    return True
 
-    try:
-        sock = socket.socket()
-        sock.connect(("irc.chat.twitch.tv", 6667))
-        sock.send(f"PASS {token}\r\n".encode("utf-8"))
-        sock.send(f"NICK {bot_username}\r\n".encode("utf-8"))
-        sock.send(f"JOIN #{channel}\r\n".encode("utf-8"))
-        sock.send(f"PRIVMSG #{channel} :{message}\r\n".encode("utf-8"))
-        sock.close()
-        print(f"[CHAT] Отправлено: {message}")
+
+def send_chat_message(message, channel=None):
+    """
+    Ставит сообщение в очередь на отправку в чат Twitch.
+    Отправкой занимается фоновый ChatWriter через одно постоянное подключение
+    с учётом лимита Twitch. Возвращает True, если сообщение принято в очередь.
+    channel — канал, куда писать (по умолчанию основной).
+    """
+    channel = _chat_target(channel)
+    if channel is None:
+        return False
+    if SHARED_ROLE == ROLE_WORKER:
+        shared_db.post_chat(channel, message)       # отправит главный процесс
         return True
-    except Exception as e:
-        print(f"Ошибка отправки в чат: {e}")
+    queued = chat_writer.send(message, channel)
+    CHAT_ENQUEUED.inc(result="queued" if queued else "rejected")
+    if not queued:
+        print(f"Очередь чата переполнена → сообщение отброшено: {message}")
+        return False
+    return True
+
+
+# =============================================================================
+#   Объявление результатов в чат
+# =============================================================================
+#
+#   Результат открытия объявляет сервер, а не оверлей: /api/open ставит
+#   строку в DelayQueue на момент, когда оверлей покажет предмет
+#   (announce_in_ms в запросе). Так не нужен второй запрос на каждое
+#   открытие, и объявление не теряется, если оверлей перезагрузили посреди
+#   прокрутки. Результаты пачки созревают почти одновременно и уходят
+#   одной строкой. /api/send_chat остаётся для оверлеев, которые срок
+#   показа не присылают.
+
+ANNOUNCE_MAX_DELAY = 120        # сек — дальше оверлей явно ошибся со сроком
+ANNOUNCE_SEPARATOR = " · "
+
+
+def announce_text(username, item_name, rarity_name, already_have):
+    """Та же строка, что раньше отправлял оверлей"""
+    return f"@{username} → {item_name} ({rarity_name})" + (" (уже есть)" if already_have else "")
+
+
+def _send_announcements(batch):
+    """batch — [(канал, текст)], созревшие вместе; склеиваются по каналу в строки до лимита Twitch"""
+    by_channel = {}
+    for channel, text in batch:
+        by_channel.setdefault(channel, []).append(text)
+    for channel, texts in by_channel.items():
+        line = ""
+        for text in texts:
+            if line and len(line) + len(ANNOUNCE_SEPARATOR) + len(text) > MAX_MESSAGE_CHARS:
+                send_chat_message(line, channel)
+                line = ""
+            line = f"{line}{ANNOUNCE_SEPARATOR}{text}" if line else text
+        send_chat_message(line, channel)
+
+
+announcements = DelayQueue(_send_announcements, name="announcements")
+
+
+def schedule_announcement(ch, text, delay):
+    """
+    Объявить text в чат канала через delay секунд. False — токена нет,
+    объявлять некуда (оверлей тогда тоже промолчит).
+    """
+    channel = _chat_target(ch.name)
+    if channel is None:
         return False
+    delay = min(max(0.0, delay), ANNOUNCE_MAX_DELAY)
+    if SHARED_ROLE == ROLE_WORKER:
+        shared_db.post_chat(channel, text, delay)   # главный процесс поставит в свою очередь
+    else:
+        announcements.put(delay, (channel, text))
+    return True
 
 
 # =============================================================================
 #   Логика выбора редкости и предмета
 # =============================================================================
 
-def get_weighted_rarity():
+def get_weighted_rarity(channel=None):
     """
     Выбирает редкость по вероятностям (взвешенный рандом).
     Учитывает только те редкости, для которых есть хотя бы один предмет.
+    Таблица дропа собирается заранее, так что выбор — O(1).
     """
-    rarities = settings.get("rarities", {})
-    all_items = settings.get("items", [])
-
-    # Считаем, сколько предметов есть в каждой редкости
-    rarity_counts = {}
-    for item in all_items:
-        r = item.get("rarity")
-        if r:
-            rarity_counts[r] = rarity_counts.get(r, 0) + 1
-
-    # Только редкости с предметами и ненулевым шансом
-    valid_rarities = [
-        (key, info["chance"])
-        for key, info in rarities.items()
-        if info.get("chance", 0) > 0 and rarity_counts.get(key, 0) > 0
-    ]
+    return (channel or primary_channel).drop_table.pick_rarity()
+
 
-    if not valid_rarities:
-        return "common"
+def open_case(ch, username, user_key):
+    """
+    Одно открытие кейса: проверка кулдауна → редкость → предмет → запись.
+    Вызывать под ch.user_locks.hold(user_key), иначе два параллельных
+    запроса одного зрителя оба пройдут проверку кулдауна.
+    Возвращает (редкость, предмет, уже_был, снимок настроек) или None,
+    если кулдаун не прошёл.
+    """
+    if shared_db is not None:
+        # user_locks действуют только внутри процесса, поэтому с --workers
+        # кулдаун сначала занимается в shared.db (проверка и запись одним
+        # шагом), а если открыть кейс не вышло — освобождается
+        with STORAGE_WRITE_SECONDS.time(op="cooldown"):
+            if not ch.cooldowns.claim(user_key, time.time()):
+                return None
+        try:
+            return roll_case(ch, username)
+        except Exception:
+            ch.cooldowns.release(user_key)
+            raise
+
+    can, _ = ch.can_user_open(user_key)
+    if not can:
+        return None
+    result = roll_case(ch, username)
+
+    # Обновляем время последнего открытия
+    with STORAGE_WRITE_SECONDS.time(op="cooldown"):
+        ch.record_cooldown(user_key, time.time())
+    return result
+
+
+def roll_case(ch, username):
+    """Редкость → предмет → запись в инвентарь и статистику (кулдаун уже проверен)"""
+    # Выбираем редкость (таблица — из снимка, взятого один раз)
+    snap = ch.snapshot
+    table = snap.drop_table
+    rarity_key = table.pick_rarity()
+
+    # Предпочитаем предметы, которых у пользователя ещё нет
+    # (по битовой маске владения — без обхода инвентаря и каталога)
+    owned_bits = ch.inventory_store.owned_bits(username)
+    chosen_item = table.pick_unowned(rarity_key, owned_bits)
+
+    if chosen_item is not None:
+        already_have = False
+    else:
+        chosen_item = table.pick_item(rarity_key)
+        already_have = True
 
-    total_weight = sum(weight for _, weight in valid_rarities)
-    if total_weight == 0:
-        return random.choice([k for k, _ in valid_rarities])
+    # Сохраняем предмет, если он новый. Запись атомарная: если этот же
+    # предмет успел записать параллельный запрос — он уже есть
+    if not already_have:
+        with STORAGE_WRITE_SECONDS.time(op="record_drop"):
+            already_have = not ch.inventory_store.record_drop(username, chosen_item)
 
-    rnd = random.uniform(0, total_weight)
-    cumulative = 0
-    for key, weight in valid_rarities:
-        cumulative += weight
-        if rnd <= cumulative:
-            return key
-    return valid_rarities[-1][0]
+    ch.drop_stats.record(rarity_key, chosen_item["name"], already_have)
+    return rarity_key, chosen_item, already_have, snap
 
 
 # =============================================================================
 #   Flask маршруты (API)
 # =============================================================================
 
-@app.route("/")
-def index():
+def channel_route(rule, **options):
+    """
+    Регистрирует маршрут для основного канала (/api/...) и для
+    дополнительных (/c/<канал>/api/...). Функция получает ChannelState.
+    """
+    def decorator(fn):
+        def view(channel=None):
+            ch = get_channel(channel)
+            if ch is None:
+                return jsonify({"error": "unknown channel"}), 404
+            with REQUEST_SECONDS.time(endpoint=fn.__name__, channel=ch.name):
+                return fn(ch)
+        view.__name__ = fn.__name__
+        view.__doc__ = fn.__doc__
+        app.add_url_rule(rule, view_func=view, **options)
+        app.add_url_rule(f"/c/<channel>{rule}", view_func=view, **options)
+        return view
+    return decorator
+
+
+def _parse_event_id(value):
+    """Номер события из заголовка Last-Event-ID или параметра ?last_id="""
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+@channel_route("/")
+def index(ch):
     """Отдаёт главную страницу оверлея"""
     return send_from_directory("static", "index.html")
 
 
-@app.route("/api/settings")
-def api_settings():
-    """Возвращает текущие настройки (нужны фронтенду)"""
-    return jsonify(settings)
+@channel_route("/api/settings")
+def api_settings(ch):
+    """
+    Настройки канала для оверлея — без токена и без каталога предметов.
+    Ответ кешируется до следующего сохранения настроек и сверяется по ETag.
+    """
+    return ch.payload("settings").response()
+
+
+@channel_route("/api/items")
+def api_items(ch):
+    """Каталог канала: предметы и редкости (тоже с ETag — оверлей перечитывает его на лету)"""
+    return ch.payload("items").response()
 
 
-@app.route("/api/open", methods=["POST"])
-def api_open():
+@channel_route("/api/open", methods=["POST"])
+def api_open(ch):
     """
     Основной эндпоинт — открытие кейса для пользователя.
     Проверяет кулдаун → выбирает редкость → выбирает предмет → сохраняет.
+    С announce_in_ms в запросе результат объявляется в чат через столько
+    миллисекунд (в ответе "announced": true).
+    Всё это идёт под блокировкой зрителя: параллельные запросы одного
+    зрителя выполняются по очереди, разные зрители — одновременно.
     """
     try:
         data = request.get_json()
         username = data.get("username")
         if not username:
             return jsonify({"error": "username required"}), 400
+        user_key = cooldown_key(username, data.get("user_id"))
 
-        can, remaining = can_user_open(username)
-        if not can:
+        try:
+            with ch.user_locks.hold(user_key):
+                result = open_case(ch, username, user_key)
+        finally:
+            # Из очереди зритель уходит при любом исходе (кейс, кулдаун, ошибка),
+            # иначе его следующий !open навсегда считался бы повтором
+            ch.queue.complete(user_key)
+        if result is None:
+            _, remaining = ch.can_user_open(user_key)
             return jsonify({
                 "success": False,
                 "error": "cooldown",
                 "remaining": remaining,
                 "message": f"Подожди ещё {format_remaining(remaining)}"
             }), 429
+        rarity_key, chosen_item, already_have, snap = result
 
-        # Выбираем редкость
-        rarity_key = get_weighted_rarity()
-
-        # Все предметы выбранной редкости
-        items_in_rarity = [
-            i for i in settings.get("items", [])
-            if i.get("rarity") == rarity_key
-        ]
-
-        # Если по какой-то причине нет — берём все предметы
-        if not items_in_rarity:
-            items_in_rarity = settings.get("items", [])
-
-        # Загружаем инвентарь
-        inventory = {}
-        if os.path.exists(INVENTORY_FILE):
-            try:
-                with open(INVENTORY_FILE, "r", encoding="utf-8") as f:
-                    inventory = json.load(f)
-            except Exception:
-                pass
+        rarity_name = snap.rarity_names.get(rarity_key, rarity_key)
 
-        user_items = inventory.get(username, [])
-        user_item_names = {it["name"] for it in user_items}
-
-        # Предпочитаем предметы, которых у пользователя ещё нет
-        available_items = [
-            it for it in items_in_rarity
-            if it["name"] not in user_item_names
-        ]
-
-        if available_items:
-            chosen_item = random.choice(available_items)
-            already_have = False
-        else:
-            chosen_item = random.choice(items_in_rarity)
-            already_have = True
-
-        # Сохраняем предмет, если он новый
-        if not already_have:
-            inventory.setdefault(username, []).append(chosen_item)
-            with open(INVENTORY_FILE, "w", encoding="utf-8") as f:
-                json.dump(inventory, f, ensure_ascii=False, indent=2)
-
-        # Обновляем время последнего открытия
-        last_open_time[username] = time.time()
-        save_cooldowns()
-
-        rarity_name = settings["rarities"].get(rarity_key, {}).get("name", rarity_key)
+        # Оверлей сообщает, через сколько покажет предмет — тогда объявит сервер
+        announced = False
+        announce_in = data.get("announce_in_ms")
+        if isinstance(announce_in, (int, float)):
+            announced = schedule_announcement(
+                ch, announce_text(username, chosen_item["name"], rarity_name, already_have), announce_in / 1000)
 
         return jsonify({
             "success": True,
             "username": username,
-            "item": chosen_item,
+            "item": public_item(chosen_item),
             "rarity_key": rarity_key,
             "rarity_name": rarity_name,
-            "already_have": already_have
+            "already_have": already_have,
+            "announced": announced,
+            "queue_depth": len(ch.queue)
         })
 
     except Exception as e:
@@ -328,8 +938,8 @@ def api_open():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/send_chat", methods=["POST"])
-def api_send_chat():
+@channel_route("/api/send_chat", methods=["POST"])
+def api_send_chat(ch):
     """Позволяет фронтенду отправить сообщение в чат (запасной вариант)"""
     try:
         data = request.get_json()
@@ -337,106 +947,352 @@ def api_send_chat():
         if not message:
             return jsonify({"error": "message required"}), 400
 
-        if send_chat_message(message):
-            return jsonify({"success": True})
+        if send_chat_message(message, ch.name):
+            return jsonify({"success": True, "queued": True})
         return jsonify({"success": False, "error": "failed to send"}), 500
     except Exception as e:
         print(f"Ошибка /api/send_chat: {e}")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/get_pending", methods=["GET"])
-def api_get_pending():
-    """Фронтенд забирает следующего пользователя из очереди"""
-    global pending_users
-    if pending_users:
-        user = pending_users.pop(0)
-        return jsonify({"success": True, "username": user})
+@channel_route("/api/get_pending", methods=["GET"])
+def api_get_pending(ch):
+    """Фронтенд забирает следующего пользователя из очереди (запасной вариант без SSE)"""
+    entry = ch.queue.pop_next()
+    if entry:
+        return jsonify({"success": True, **entry})
     return jsonify({"success": False})
 
 
+@channel_route("/api/queue")
+def api_queue(ch):
+    """Состояние очереди: глубина, ожидание, сколько отброшено дублей и переполнений"""
+    return jsonify(ch.queue.stats())
+
+
+@channel_route("/api/stats")
+def api_stats(ch):
+    """
+    Статистика дропа: сколько выпало каждой редкости и предмета против
+    настроенных шансов, с 95% интервалами и проверкой хи-квадрат.
+    ?window=all (с последней смены шансов), 24h или 1h.
+    """
+    window = request.args.get("window", "all")
+    if window not in STATS_WINDOWS:
+        return jsonify({"error": f"window: {', '.join(STATS_WINDOWS)}"}), 400
+    return jsonify(ch.drop_stats.report(window))
+
+
+@app.route("/img/<key>")
+def cached_image(key):
+    """
+    Картинка предмета из локального кеша (уменьшенная до плитки рулетки).
+    Адрес зависит только от ссылки, поэтому браузер может хранить её сколько угодно.
+    """
+    found = image_cache.get(key)
+    if found is None:
+        return jsonify({"error": "image not available"}), 404
+    path, mimetype = found
+    resp = send_file(os.path.abspath(path), mimetype=mimetype, max_age=IMAGE_MAX_AGE)
+    resp.headers["Cache-Control"] = f"public, max-age={IMAGE_MAX_AGE}, immutable"
+    # Файл с чужого сайта: открытый напрямую, он не должен исполняться как наша страница
+    resp.headers["Content-Security-Policy"] = "sandbox"
+    resp.headers["X-Content-Type-Options"] = "nosniff"
+    return resp
+
+
+@app.route("/api/images")
+def api_images():
+    """Состояние кеша картинок: сколько скачано и какие ссылки не загрузились"""
+    return jsonify(image_cache.status())
+
+
+@app.route("/api/metrics")
+def api_metrics():
+    """
+    Метрики всех каналов: текстовый формат Prometheus по умолчанию,
+    JSON — с ?format=json или заголовком Accept: application/json.
+    """
+    wants_json = request.args.get("format") == "json" or (
+        request.accept_mimetypes.best_match(["text/plain", "application/json"]) == "application/json"
+    )
+    if wants_json:
+        return jsonify(metrics.render_json())
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@channel_route("/api/events")
+def api_events(ch):
+    """
+    Поток событий (SSE) для оверлея вместо постоянного опроса /api/get_pending.
+    Одно событие может содержать сразу несколько пользователей.
+    Событие settings сообщает, что настройки или каталог сохранили заново.
+    После переподключения браузер присылает Last-Event-ID, а после перезагрузки
+    страницы оверлей передаёт ?last_id= — отдаём всех, кто ещё ждёт в очереди после него.
+    """
+    last_id = _parse_event_id(
+        request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    )
+
+    def stream():
+        cursor = last_id
+        seen_version = ch.settings_version
+        yield "retry: 2000\n\n"
+        while True:
+            with ch.queue.cond:
+                batch = ch.queue.since(cursor)
+                if not batch and ch.settings_version == seen_version:
+                    ch.queue.cond.wait(timeout=SSE_KEEPALIVE_SECONDS)
+                    batch = ch.queue.since(cursor)
+            # Настройки сохранили — оверлей перечитает /api/settings и /api/items
+            # (событие без id, чтобы не сбить Last-Event-ID очереди)
+            if ch.settings_version != seen_version:
+                seen_version = ch.settings_version
+                yield f"event: settings\ndata: {json.dumps({'version': seen_version})}\n\n"
+            if not batch:
+                yield ": keepalive\n\n"
+                continue
+            cursor = batch[-1]["id"]
+            payload = json.dumps({"users": batch, "depth": len(ch.queue)}, ensure_ascii=False)
+            yield f"id: {cursor}\nevent: pending\ndata: {payload}\n\n"
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # =============================================================================
 #   Слушатель сообщений в чате Twitch (фоновая задача)
 # =============================================================================
 
+IRC_JOIN_BATCH = 20             # анонимно Twitch разрешает 20 JOIN за 10 секунд
+IRC_JOIN_INTERVAL = 10.5
+IRC_PING_INTERVAL = 30          # как часто мерить задержку до Twitch своим PING
+
+
+def handle_open_command(ch, username, user_id):
+    """
+    Обрабатывает !open в канале. Возвращает True, если зритель встал в очередь.
+    Кулдаун → ответ в чат; уже в очереди → молча игнорируем повтор;
+    очередь полна → отбрасываем (или отвечаем в чат, если queue_overflow = "notify").
+    """
+    key = cooldown_key(username, user_id)
+    can, remaining = ch.can_user_open(key)
+    if not can:
+        OPEN_COMMANDS.inc(channel=ch.name, result="cooldown")
+        send_chat_notice("cooldown", username, ch.name, until=time.time() + remaining)
+        print(f"[#{ch.name}] Кулдаун для {username}: {remaining} сек")
+        return False
+
+    entry, reason = ch.queue.admit(key, username, user_id)
+    OPEN_COMMANDS.inc(channel=ch.name, result=reason or "queued")
+    if reason == "overflow" and ch.queue.overflow == OVERFLOW_NOTIFY:
+        send_chat_notice("overflow", username, ch.name)
+        print(f"[#{ch.name}] Очередь переполнена, {username} не добавлен")
+    if entry is None:
+        return False
+    print(f"[#{ch.name}] Добавлен в очередь !open: {username}")
+    return True
+
+
 def irc_listener():
     """
     Подключается к чату Twitch как анонимный пользователь (justinfan...)
-    Слушает команду !open и добавляет пользователя в очередь.
+    и одним соединением заходит во все каналы (основной + extra_channels).
+    Слушает команду !open и добавляет пользователя в очередь его канала.
     Если кулдаун не прошёл — сразу пишет в чат сообщение.
+    Поток читается построчно через IrcLineReader: строки, разорванные между
+    recv(), склеиваются, на каждый PING отвечаем, теги IRCv3 дают user-id.
+    Каналы, добавленные, убранные или переименованные в настройках,
+    подхватываются на лету — без переподключения и с сохранением очереди.
     """
-    global settings, pending_users
-    channel = settings.get("channel", "").strip().lstrip("#")
-    if not channel:
-        print("Канал не указан → IRC-слушатель не запущен")
-        return
+    if not channels:
+        print("Канал не указан → IRC-слушатель подключится, когда его укажут в настройках")
+    while not channels:
+        time.sleep(1)
 
+    connected_before = False
     while True:
         try:
+            if connected_before:
+                IRC_RECONNECTS.inc()
+            connected_before = True
             sock = socket.socket()
-            sock.connect(("irc.chat.twitch.tv", 6667))
+            # irc_host / irc_port в настройках — для локального тестового сервера (bench/)
+            sock.connect((settings.get("irc_host", TWITCH_IRC_HOST), int(settings.get("irc_port", TWITCH_IRC_PORT))))
+            sock.settimeout(1)
+            sock.send(b"CAP REQ :twitch.tv/tags twitch.tv/commands\r\n")
             sock.send(f"NICK justinfan{random.randint(10000,99999)}\r\n".encode())
-            sock.send(f"JOIN #{channel}\r\n".encode())
-            print(f"IRC слушатель подключён к #{channel}")
+            reader = IrcLineReader()
+            joined = set()
+            next_join_at = 0
+            next_ping_at = time.monotonic() + 5
+            ping_sent_at = None
+            irc_status["connected"] = True
 
             while True:
-                data = sock.recv(2048).decode("utf-8", errors="ignore")
-                if not data:
-                    break
+                # Заходим в новые каналы пачками (с учётом лимита), выходим из убранных
+                wanted = set(channels)
+                if wanted - joined and time.monotonic() >= next_join_at:
+                    batch = sorted(wanted - joined)[:IRC_JOIN_BATCH]
+                    sock.send(("JOIN " + ",".join(f"#{c}" for c in batch) + "\r\n").encode())
+                    joined.update(batch)
+                    next_join_at = time.monotonic() + IRC_JOIN_INTERVAL
+                    print(f"IRC слушатель подключён к {', '.join('#' + c for c in batch)}")
+                if joined - wanted:
+                    sock.send(("PART " + ",".join(f"#{c}" for c in joined - wanted) + "\r\n").encode())
+                    joined &= wanted
+
+                # Свой PING с меткой: ответный PONG даёт задержку до сервера
+                now = time.monotonic()
+                if now >= next_ping_at:
+                    sock.send(b"PING :ricase-lag\r\n")
+                    ping_sent_at = now
+                    next_ping_at = now + IRC_PING_INTERVAL
 
-                if data.startswith("PING"):
-                    sock.send(b"PONG :tmi.twitch.tv\r\n")
+                try:
+                    data = sock.recv(4096)
+                except socket.timeout:
                     continue
+                if not data:
+                    break
 
-                lines = data.split("\r\n")
+                updated = set()     # каналы, в чью очередь кто-то добавился
+                lines = reader.feed(data)
+                IRC_LINES.inc(len(lines))
                 for line in lines:
-                    if not line or "PRIVMSG" not in line:
-                        continue
+                    msg = parse_irc_line(line)
 
-                    parts = line.split(":", 2)
-                    if len(parts) < 3:
+                    if msg.command == "PONG" and msg.text == "ricase-lag" and ping_sent_at is not None:
+                        lag = time.monotonic() - ping_sent_at
+                        irc_status["ping_lag_sec"] = round(lag, 4)
+                        IRC_PING_LAG_SECONDS.observe(lag)
+                        ping_sent_at = None
                         continue
-
-                    user_part = parts[1].split("!")
-                    if len(user_part) < 2:
+                    if msg.command == "PING":
+                        sock.send(f"PONG :{msg.text}\r\n".encode("utf-8"))
+                        continue
+                    if msg.command == "RECONNECT":
+                        raise ConnectionError("Twitch попросил переподключиться")
+                    if msg.command != "PRIVMSG" or len(msg.params) < 2:
                         continue
 
-                    username = user_part[0].strip()
-                    message = parts[2].strip()
+                    ch = channels.get(normalize_channel(msg.params[0]))
+                    username = msg.nick.strip()
+                    message = msg.text.strip()
+                    if ch is None or not username:
+                        continue
 
                     if message == "!open":
-                        can, remaining = can_user_open(username)
-                        if can:
-                            pending_users.append(username)
-                            print(f"Добавлен в очередь !open: {username}")
-                        else:
-                            msg = f"@{username} подожди ещё {format_remaining(remaining)}"
-                            send_chat_message(msg)
-                            print(f"Кулдаун для {username}: {remaining} сек")
+                        if handle_open_command(ch, username, msg.tags.get("user-id") or None):
+                            updated.add(ch)
+
+                # Все принятые из этой пачки строк уходят оверлеям одним событием на канал
+                for ch in updated:
+                    ch.queue.notify()
+            sock.close()
+            irc_status["connected"] = False
         except Exception as e:
+            irc_status["connected"] = False
             print(f"Ошибка IRC-слушателя: {e}")
             time.sleep(15)  # переподключение через 15 секунд
 
 
-def run_server():
-    """Запускает Flask-сервер и IRC-слушатель в фоне"""
+def run_server(host="0.0.0.0", port=5000, open_browser=None):
+    """
+    Запускает Flask-сервер и IRC-слушатель в фоне.
+    open_browser=None — как в настройках (open_browser_on_start).
+    Без окна настроек ошибка запуска пробрасывается наружу.
+    """
     try:
         threading.Thread(target=irc_listener, daemon=True).start()
-        print("\nСервер запущен → http://127.0.0.1:5000/")
-        if settings.get("open_browser_on_start", True):
-            webbrowser.open_new("http://127.0.0.1:5000/")
-        app.run(host="0.0.0.0", port=5000, debug=False, use_reloader=False, threaded=True)
+        print(f"\nСервер запущен → http://127.0.0.1:{port}/")
+        for name, ch in channels.items():
+            if ch is not primary_channel:
+                print(f"  оверлей #{name} → http://127.0.0.1:{port}/c/{name}/")
+        if open_browser is None:
+            open_browser = settings.get("open_browser_on_start", True)
+        if open_browser:
+            import webbrowser
+            webbrowser.open_new(f"http://127.0.0.1:{port}/")
+        app.run(host=host, port=port, debug=False, use_reloader=False, threaded=True)
     except Exception as e:
         print(f"Ошибка запуска сервера: {e}")
+        if messagebox is None:
+            raise
         messagebox.showerror("Ошибка", f"Не удалось запустить сервер:\n{str(e)}")
 
 
+# =============================================================================
+#   Несколько процессов (python -m ricase serve --workers N)
+# =============================================================================
+#
+#   Главный процесс держит сокет, слушает чат и пишет в него; обработчики
+#   (отдельные процессы) принимают соединения на том же сокете и отвечают
+#   на HTTP. Всё общее — в shared.db (см. shared.py).
+
+def shared_pump():
+    """
+    Главный процесс: строки чата и выпадения от обработчиков, кулдауны —
+    в cooldowns.journal (его читает обычный режим), чистка истёкших
+    """
+    next_purge = 0.0
+    while True:
+        time.sleep(PUMP_INTERVAL)
+        try:
+            now = time.time()
+            for channel, text, due in shared_db.take_chat():
+                announcements.put(due - now, (channel, text))
+            by_scope = {ch.data_dir: ch for ch in all_channels()}
+            for scope, rarity, item, duplicate in shared_db.take_drops():
+                ch = by_scope.get(scope)
+                if ch is not None:
+                    ch.drop_stats.record(rarity, item, bool(duplicate))
+            for scope, key, timestamp in shared_db.take_cooldowns():
+                ch = by_scope.get(scope)
+                if ch is not None:
+                    ch.cooldown_journal.append(key, timestamp, ch.cooldowns.snapshot)
+            if now >= next_purge:
+                for ch in all_channels():
+                    ch.cooldowns.purge()
+                next_purge = now + COOLDOWN_PURGE_INTERVAL
+        except Exception as e:
+            print(f"Ошибка переноса данных обработчиков: {e}")
+
+
+def run_shared_master():
+    """Главный процесс: слушатель чата и работа за обработчиков, без HTTP"""
+    threading.Thread(target=irc_listener, daemon=True).start()
+    threading.Thread(target=shared_pump, name="shared-pump", daemon=True).start()
+
+
+def serve_worker(sock, threads=WORKER_THREADS):
+    """Обработчик: HTTP на сокете, открытом главным процессом (waitress, если установлен)"""
+    if HAS_WAITRESS:
+        import waitress
+        waitress.serve(app, sockets=[sock], threads=threads)
+        return
+    from werkzeug.serving import make_server
+    host, port = sock.getsockname()[:2]
+    make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+
+
 # =============================================================================
 #   GUI — окно настроек (Tkinter)
 # =============================================================================
 
+ALL_RARITIES = "Все редкости"   # пункт фильтра предметов без отбора по редкости
+ITEM_ROW_HEIGHT = 34            # = rowheight в стиле Treeview
+ITEM_HEADER_HEIGHT = 30         # заголовок таблицы предметов
+ITEM_ROWS_INITIAL = 12          # до первого <Configure> с настоящей высотой
+ITEM_FILTER_DELAY_MS = 200
+
+
 class App:
     def __init__(self):
+        _import_gui()
         self.root = tk.Tk()
         self.root.title("RICASE")
         self.root.geometry("1020x720")
@@ -452,13 +1308,16 @@ class App:
         self.channel_var = tk.StringVar(value=settings.get("channel", ""))
         self.token_var = tk.StringVar(value=settings.get("oauth_token", ""))
         self.open_browser_var = tk.BooleanVar(value=settings.get("open_browser_on_start", True))
+        self.extra_channels_var = tk.StringVar(value=", ".join(settings.get("extra_channels", [])))
 
         self.rarity_vars = {}   # для редактирования шансов редкостей
-        self.item_tree = None   # таблица предметов
+        self.item_tree = None   # таблица предметов (видимое окно списка self.items)
+        self.items = [dict(item) for item in settings.get("items", [])]
 
         self.create_main_tab()
         self.create_rarities_tab()
         self.create_items_tab()
+        self.create_stats_tab()
 
         # Нижняя панель с кнопками
         bottom = tk.Frame(self.root, bg="#2c1c47", height=70)
@@ -466,7 +1325,7 @@ class App:
 
         ttk.Button(bottom, text="Сохранить настройки", command=self.save_settings, style="Accent.TButton").pack(side="left", padx=8)
         ttk.Button(bottom, text="Запустить сервер", command=self.run_only, style="Accent.TButton").pack(side="left", padx=8)
-        ttk.Button(bottom, text="GitHub", command=lambda: webbrowser.open("https://github.com/RIPPER666YT/RICASE")).pack(side="left", padx=8)
+        ttk.Button(bottom, text="GitHub", command=self.open_github).pack(side="left", padx=8)
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.root.mainloop()
@@ -520,31 +1379,31 @@ class App:
                   background=[("active", accent_dark), ("pressed", accent_darker)],
                   foreground=[("active", select_fg), ("pressed", select_fg)])
 
+    def open_github(self):
+        import webbrowser
+        webbrowser.open("https://github.com/RIPPER666YT/RICASE")
+
     def on_close(self):
         """Подтверждение выхода из программы"""
         if messagebox.askokcancel("Выход", "Закрыть RICASE?"):
             self.root.destroy()
 
     def reset_inventory(self):
-        """Удаляет файл инвентаря полностью"""
+        """Очищает инвентарь всех пользователей"""
         if messagebox.askyesno("Сброс инвентаря", "Удалить ВЕСЬ инвентарь пользователей?"):
-            if os.path.exists(INVENTORY_FILE):
-                try:
-                    os.remove(INVENTORY_FILE)
-                    messagebox.showinfo("Успех", "Инвентарь сброшен")
-                except Exception as e:
-                    messagebox.showerror("Ошибка", f"Не удалось удалить файл\n{e}")
-            else:
-                messagebox.showinfo("Информация", "Инвентарь и так пуст")
+            try:
+                for ch in all_channels():
+                    ch.inventory_store.clear()
+                messagebox.showinfo("Успех", "Инвентарь сброшен")
+            except Exception as e:
+                messagebox.showerror("Ошибка", f"Не удалось очистить инвентарь\n{e}")
 
     def reset_cooldowns(self):
         """Сбрасывает все кулдауны (все смогут открыть сразу)"""
         if messagebox.askyesno("Сброс кулдаунов", "Сбросить кулдаун ВСЕМ пользователям?"):
-            global last_open_time
-            last_open_time.clear()
-            if os.path.exists(COOLDOWNS_FILE):
+            for ch in all_channels():
                 try:
-                    os.remove(COOLDOWNS_FILE)
+                    ch.reset_cooldowns()
                 except:
                     pass
             messagebox.showinfo("Готово", "Все кулдауны сброшены")
@@ -555,11 +1414,11 @@ class App:
             try:
                 if os.path.exists(SETTINGS_FILE):
                     os.remove(SETTINGS_FILE)
-                global settings
-                settings = load_settings()
+                set_settings(load_settings())
                 self.channel_var.set(settings["channel"])
                 self.token_var.set(settings["oauth_token"])
                 self.open_browser_var.set(settings["open_browser_on_start"])
+                self.extra_channels_var.set(", ".join(settings.get("extra_channels", [])))
 
                 # Обновляем таблицу редкостей
                 for key, var_info in self.rarity_vars.items():
@@ -567,13 +1426,9 @@ class App:
                     var_info["chance"].set(chance)
                     self.rarity_tree.set(var_info["tree_id"], "chance", f"{chance:.1f}")
 
-                # Обновляем таблицу предметов
-                self.item_tree.delete(*self.item_tree.get_children())
-                for item in settings.get("items", []):
-                    r_key = item.get("rarity", "common")
-                    r_name = settings["rarities"].get(r_key, {}).get("name", r_key)
-                    url = item.get("image_url", "")
-                    self.item_tree.insert("", "end", values=(item.get("name", ""), r_name, url))
+                # Обновляем список предметов
+                self.items = [dict(item) for item in settings.get("items", [])]
+                self.apply_item_filter()
 
                 messagebox.showinfo("Готово", "Настройки сброшены к дефолтным")
             except Exception as e:
@@ -598,9 +1453,12 @@ class App:
         self.eye_btn = ttk.Button(token_frame, text="👁", width=3, command=self.toggle_token_visibility)
         self.eye_btn.pack(side="right", padx=(8,0))
 
+        ttk.Label(container, text="Дополнительные каналы (через запятую, оверлей: /c/<канал>/)", style="Header.TLabel").grid(row=4, column=0, sticky="w", pady=(24,4))
+        ttk.Entry(container, textvariable=self.extra_channels_var, width=42, font=("Segoe UI", 11)).grid(row=5, column=0, sticky="ew")
+
         # Чекбокс "Открывать браузер при старте"
         check_frame = tk.Frame(container, bg="#2c1c47")
-        check_frame.grid(row=4, column=0, sticky="w", pady=(28,0))
+        check_frame.grid(row=6, column=0, sticky="w", pady=(28,0))
         self.check_canvas = tk.Canvas(check_frame, width=24, height=24, bg="#2c1c47", highlightthickness=0)
         self.check_canvas.pack(side="left", padx=(0,8))
         self.check_rect = self.check_canvas.create_rectangle(2,2,22,22, fill="#3a285a", outline="#4a3570", width=2)
@@ -626,7 +1484,7 @@ class App:
 
         # Кнопки сброса
         btn_frame = tk.Frame(container, bg="#2c1c47")
-        btn_frame.grid(row=5, column=0, sticky="w", pady=(32,0))
+        btn_frame.grid(row=7, column=0, sticky="w", pady=(32,0))
         ttk.Button(btn_frame, text="Сброс инвентаря", command=self.reset_inventory).pack(side="left", padx=6)
         ttk.Button(btn_frame, text="Сброс настроек", command=self.reset_to_default).pack(side="left", padx=6)
         ttk.Button(btn_frame, text="Сброс кулдаунов", command=self.reset_cooldowns).pack(side="left", padx=6)
@@ -666,6 +1524,15 @@ class App:
 
         self.rarity_tree.bind("<Double-1>", self.on_double_click_rarity)
 
+        # Симуляция: сколько открытий нужно зрителю, чтобы собрать коллекцию с этими шансами
+        btnf = tk.Frame(tab, bg="#2c1c47")
+        btnf.pack(pady=(0, 16))
+        self.simulate_button = ttk.Button(btnf, text="Симуляция сбора коллекции", command=self.run_simulation)
+        self.simulate_button.pack(side="left", padx=8)
+        self.simulate_status_var = tk.StringVar(value="")
+        ttk.Label(btnf, textvariable=self.simulate_status_var,
+                  font=("Segoe UI", 9), foreground="#a78bdb").pack(side="left", padx=8)
+
     def on_double_click_rarity(self, event):
         """Редактирование шанса редкости двойным кликом"""
         tree = event.widget
@@ -700,14 +1567,111 @@ class App:
         entry.bind("<Return>", save)
         entry.bind("<FocusOut>", save)
 
+    def run_simulation(self):
+        """Запускает симуляцию с шансами и предметами из интерфейса (в фоне, окно не замирает)"""
+        if not self.check_rarities_sum():
+            messagebox.showwarning("Некорректные шансы", "Сумма шансов должна быть ровно 100%")
+            return
+        data = self.settings_from_form()
+        self.simulate_button.state(["disabled"])
+        self.simulate_status_var.set("Считаю...")
+        self._simulation = {}
+
+        def work():
+            try:
+                self._simulation["result"] = simulate(data, cooldown_seconds=COOLDOWN_SECONDS)
+            except Exception as e:
+                self._simulation["error"] = e
+
+        threading.Thread(target=work, daemon=True).start()
+        self.root.after(100, self.poll_simulation)
+
+    def poll_simulation(self):
+        if not self._simulation:
+            self.root.after(100, self.poll_simulation)
+            return
+        self.simulate_button.state(["!disabled"])
+        self.simulate_status_var.set("")
+        if "error" in self._simulation:
+            messagebox.showerror("Ошибка симуляции", str(self._simulation["error"]))
+            return
+        self.show_simulation(self._simulation["result"])
+
+    def show_simulation(self, result):
+        """Окно с результатом симуляции: открытия до сбора каждой редкости и всей коллекции"""
+        win = tk.Toplevel(self.root)
+        win.title("Симуляция сбора коллекции")
+        win.configure(bg="#2c1c47")
+        win.geometry("980x520")
+
+        opens = f"{result['opens_simulated']:,}".replace(",", " ")
+        ttk.Label(win, text=(
+            f"{result['viewers']} зрителей, {opens} открытий за {result['seconds']:.1f} с"
+            f" ({'NumPy' if result['engine'] == 'numpy' else 'без NumPy — меньше зрителей'}). "
+            f"Часы — если открывать каждый раз, как проходит кулдаун."
+        ), font=("Segoe UI", 10), foreground="#a78bdb", wraplength=920).pack(pady=(12, 4))
+
+        columns = ("name", "items", "chance", "mean", "p50", "p90", "p99", "hours", "incomplete")
+        tree = ttk.Treeview(win, columns=columns, show="headings", height=9)
+        for col, title, width in (("name", "Редкость", 180), ("items", "Предметов", 90),
+                                  ("chance", "Шанс %", 80), ("mean", "Открытий (ср.)", 120),
+                                  ("p50", "Медиана", 80), ("p90", "90%", 80), ("p99", "99%", 80),
+                                  ("hours", "Часов (ср.)", 100), ("incomplete", "Не собрали %", 110)):
+            tree.heading(col, text=title)
+            tree.column(col, width=width, anchor="w" if col == "name" else "center")
+        tree.pack(padx=20, pady=8, fill="both", expand=True)
+
+        def cell(value):
+            return "—" if value is None else value
+
+        total_items = sum(row["items"] for row in result["rarities"])
+        rows = result["rarities"] + [{"name": "Вся коллекция", "items": total_items, "chance_pct": 100.0,
+                                      **result["full_set"]}]
+        for row in rows:
+            tree.insert("", "end", values=(
+                row["name"], row["items"], f"{row['chance_pct']:.2f}", cell(row["mean"]), cell(row["p50"]),
+                cell(row["p90"]), cell(row["p99"]), cell(row["hours_mean"]), f"{row['incomplete_pct']:.1f}",
+            ))
+
+        lines = []
+        if result["unreachable"]:
+            lines.append("Не выпадут никогда (шанс 0): " + ", ".join(result["unreachable"]))
+        if result["duplicates"]:
+            lines.append("Повторы среди первых N открытий: " + ", ".join(
+                f"{d['opens']} → {d['rate_pct']:.0f}%" for d in result["duplicates"]))
+        ttk.Label(win, text="\n".join(lines), font=("Segoe UI", 10), wraplength=920).pack(pady=(4, 16))
+
     def create_items_tab(self):
-        """Вкладка «Предметы» — список всех возможных дропов"""
+        """
+        Вкладка «Предметы» — список всех возможных дропов.
+        Предметы лежат в self.items, а таблица показывает только видимые
+        строки и перерисовывает их при прокрутке: окно открывается сразу
+        и с тысячами скинов.
+        """
         tab = ttk.Frame(self.notebook)
         self.notebook.add(tab, text="Предметы")
 
         ttk.Label(tab, text="Двойной клик по ячейке для редактирования", 
                   font=("Segoe UI", 10), foreground="#a78bdb").pack(pady=(12,4))
 
+        # Поиск и фильтр по редкости
+        filters = tk.Frame(tab, bg="#2c1c47")
+        filters.pack(fill="x", padx=30, pady=(4, 0))
+        ttk.Label(filters, text="Поиск:").pack(side="left", padx=(0, 6))
+        self.item_search_var = tk.StringVar(value="")
+        ttk.Entry(filters, textvariable=self.item_search_var, width=32).pack(side="left", padx=(0, 16))
+        ttk.Label(filters, text="Редкость:").pack(side="left", padx=(0, 6))
+        self.rarity_key_by_name = {v["name"]: k for k, v in settings["rarities"].items()}
+        self.item_rarity_filter_var = tk.StringVar(value=ALL_RARITIES)
+        ttk.Combobox(filters, textvariable=self.item_rarity_filter_var, state="readonly", width=16,
+                     values=[ALL_RARITIES, *self.rarity_key_by_name]).pack(side="left", padx=(0, 16))
+        self.item_count_var = tk.StringVar(value="")
+        ttk.Label(filters, textvariable=self.item_count_var,
+                  font=("Segoe UI", 9), foreground="#a78bdb").pack(side="left")
+        self._item_filter_job = None
+        self.item_search_var.trace_add("write", lambda *a: self._schedule_item_filter())
+        self.item_rarity_filter_var.trace_add("write", lambda *a: self.apply_item_filter())
+
         frame = tk.Frame(tab, bg="#2c1c47")
         frame.pack(fill="both", expand=True, padx=30, pady=(10,0))
 
@@ -720,34 +1684,354 @@ class App:
         self.item_tree.column("image_url", width=500, anchor="w")
         self.item_tree.pack(side="left", fill="both", expand=True)
 
-        scroll = ttk.Scrollbar(frame, orient="vertical", command=self.item_tree.yview)
-        scroll.pack(side="right", fill="y")
-        self.item_tree.configure(yscrollcommand=scroll.set)
+        # Прокрутка своя: таблица хранит только видимые строки
+        self.item_scroll = ttk.Scrollbar(frame, orient="vertical", command=self._items_yview)
+        self.item_scroll.pack(side="right", fill="y")
 
-        # Заполняем таблицу текущими предметами
-        for item in settings.get("items", []):
-            r_key = item.get("rarity", "common")
-            r_name = settings["rarities"].get(r_key, {}).get("name", r_key)
-            url = item.get("image_url", "")
-            self.item_tree.insert("", "end", values=(item.get("name", ""), r_name, url))
+        self.item_view = []         # индексы self.items, прошедшие фильтр
+        self.item_offset = 0        # первая видимая позиция в item_view
+        self.item_rows = []         # iid строк таблицы, сверху вниз
+        self.item_selected = set()  # индексы выделенных предметов
+        self._failed_images = {}
+        self._resize_item_rows(ITEM_ROWS_INITIAL)
+
+        # Состояние кеша картинок: строки с нескачавшейся картинкой подсвечиваются
+        self.item_tree.tag_configure("image_failed", foreground="#ff6b6b")
+        self.image_status_var = tk.StringVar(value="")
+        ttk.Label(tab, textvariable=self.image_status_var,
+                  font=("Segoe UI", 9), foreground="#a78bdb").pack(pady=(8, 0))
 
         # Кнопки управления предметами
         btnf = tk.Frame(tab, bg="#2c1c47")
-        btnf.pack(pady=16)
+        btnf.pack(pady=(16, 4))
         ttk.Button(btnf, text="Добавить", command=self.add_item).pack(side="left", padx=8)
         ttk.Button(btnf, text="Удалить", command=self.delete_item).pack(side="left", padx=8)
+        ttk.Button(btnf, text="Скачать картинки заново", command=image_cache.retry_failed).pack(side="left", padx=8)
+        self.catalog_buttons = [
+            ttk.Button(btnf, text="Импорт CSV/JSON", command=self.import_items),
+            ttk.Button(btnf, text="Экспорт", command=self.export_items),
+        ]
+        for button in self.catalog_buttons:
+            button.pack(side="left", padx=8)
+
+        # Импорт и экспорт идут в фоне, здесь — прогресс
+        progressf = tk.Frame(tab, bg="#2c1c47")
+        progressf.pack(pady=(0, 12))
+        self.catalog_progress = ttk.Progressbar(progressf, length=260, maximum=1.0)
+        self.catalog_progress.pack(side="left", padx=8)
+        self.catalog_status_var = tk.StringVar(value="")
+        ttk.Label(progressf, textvariable=self.catalog_status_var,
+                  font=("Segoe UI", 9), foreground="#a78bdb").pack(side="left", padx=8)
 
         self.item_tree.bind("<Double-1>", self.edit_item)
+        self.item_tree.bind("<Configure>", self._on_items_resize)
+        self.item_tree.bind("<<TreeviewSelect>>", self._on_items_select)
+        for sequence, step in (("<MouseWheel>", None), ("<Button-4>", -3), ("<Button-5>", 3)):
+            self.item_tree.bind(sequence, lambda e, step=step: self._on_items_wheel(e, step))
+        self.item_tree.bind("<Up>", lambda e: self._move_item_selection(-1))
+        self.item_tree.bind("<Down>", lambda e: self._move_item_selection(1))
+
+        self.apply_item_filter()
+        self.refresh_image_status()
+
+    # ------------------------------------------------------------------
+    #   Список предметов: фильтр и отрисовка видимых строк
+    # ------------------------------------------------------------------
+
+    def _schedule_item_filter(self):
+        """Поиск применяется, когда перестали печатать, а не на каждую букву"""
+        if self._item_filter_job is not None:
+            self.root.after_cancel(self._item_filter_job)
+        self._item_filter_job = self.root.after(ITEM_FILTER_DELAY_MS, self.apply_item_filter)
+
+    def apply_item_filter(self):
+        """Пересобирает item_view по строке поиска и редкости и рисует начало списка"""
+        self._item_filter_job = None
+        query = self.item_search_var.get().strip().lower()
+        r_key = self.rarity_key_by_name.get(self.item_rarity_filter_var.get())
+        self.item_view = [
+            i for i, item in enumerate(self.items)
+            if (not query or query in item.get("name", "").lower())
+            and (r_key is None or item.get("rarity") == r_key)
+        ]
+        self.item_offset = 0
+        self.render_items()
+
+    def _resize_item_rows(self, count):
+        """Столько строк в таблице, сколько помещается по высоте"""
+        self.item_tree.delete(*self.item_tree.get_children())
+        self.item_rows = [self.item_tree.insert("", "end", values=("", "", "")) for _ in range(count)]
+
+    def _on_items_resize(self, event):
+        count = max(1, (event.height - ITEM_HEADER_HEIGHT) // ITEM_ROW_HEIGHT)
+        if count != len(self.item_rows):
+            self._resize_item_rows(count)
+            self._scroll_items_to(self.item_offset)
+
+    def render_items(self):
+        """Переписывает значения видимых строк; лишние строки прячет"""
+        tree = self.item_tree
+        rarities = settings["rarities"]
+        selected = []
+        for r, iid in enumerate(self.item_rows):
+            pos = self.item_offset + r
+            if pos >= len(self.item_view):
+                tree.detach(iid)
+                continue
+            index = self.item_view[pos]
+            item = self.items[index]
+            r_key = item.get("rarity", "common")
+            url = item.get("image_url", "")
+            tree.move(iid, "", r)
+            tree.item(iid, values=(item.get("name", ""), rarities.get(r_key, {}).get("name", r_key), url),
+                      tags=("image_failed",) if url.strip() in self._failed_images else ())
+            if index in self.item_selected:
+                selected.append(iid)
+        tree.selection_set(selected)
+
+        total = len(self.item_view)
+        if total:
+            self.item_scroll.set(self.item_offset / total, min(1.0, (self.item_offset + len(self.item_rows)) / total))
+        else:
+            self.item_scroll.set(0.0, 1.0)
+        self.item_count_var.set(f"Показано {total} из {len(self.items)}")
+
+    def _scroll_items_to(self, offset):
+        self.item_offset = max(0, min(offset, len(self.item_view) - len(self.item_rows)))
+        self.render_items()
+
+    def _items_yview(self, *args):
+        """Команда полосы прокрутки: ("moveto", доля) или ("scroll", n, "units"/"pages")"""
+        if args[0] == "moveto":
+            self._scroll_items_to(int(float(args[1]) * len(self.item_view)))
+        else:
+            step = len(self.item_rows) if args[2] == "pages" else 1
+            self._scroll_items_to(self.item_offset + int(args[1]) * step)
+
+    def _on_items_wheel(self, event, step):
+        if step is None:                    # Windows и macOS: delta кратна 120 или ±1
+            step = -3 if event.delta > 0 else 3
+        self._scroll_items_to(self.item_offset + step)
+        return "break"
+
+    def _on_items_select(self, event):
+        # Пустое выделение приходит и после прокрутки, когда выделенный
+        # предмет ушёл за край — выделение при этом не сбрасываем
+        indexes = {index for index in map(self._item_index, self.item_tree.selection()) if index is not None}
+        if indexes:
+            self.item_selected = indexes
+
+    def _move_item_selection(self, step):
+        """Стрелки вверх/вниз по всему списку, а не только по видимым строкам"""
+        if not self.item_view:
+            return "break"
+        positions = [self.item_view.index(i) for i in self.item_selected if i in self.item_view]
+        pos = min(max(0, (positions[0] + step) if positions else 0), len(self.item_view) - 1)
+        self.item_selected = {self.item_view[pos]}
+        if pos < self.item_offset:
+            self._scroll_items_to(pos)
+        elif pos >= self.item_offset + len(self.item_rows):
+            self._scroll_items_to(pos - len(self.item_rows) + 1)
+        else:
+            self.render_items()
+        self.item_tree.focus(self.item_rows[pos - self.item_offset])
+        return "break"
+
+    def _item_index(self, iid):
+        """Индекс в self.items для строки таблицы (None — пустая строка)"""
+        pos = self.item_offset + self.item_rows.index(iid)
+        return self.item_view[pos] if pos < len(self.item_view) else None
+
+    def refresh_image_status(self):
+        """Раз в 3 секунды показывает, сколько картинок скачано, и отмечает ошибки"""
+        status = image_cache.status()
+        failed = status["failed"]
+        text = f"Картинки: {status['cached']} из {status['total']} в кеше"
+        if status["pending"]:
+            text += f", скачивается {status['pending']}"
+        if failed:
+            text += f", не скачались {len(failed)} (выделены красным, подробности — в консоли)"
+        if not status["resize"]:
+            text += " · установи Pillow, чтобы картинки уменьшались"
+        self.image_status_var.set(text)
+
+        if failed != self._failed_images:
+            self._failed_images = failed
+            self.render_items()
+        self.root.after(3000, self.refresh_image_status)
+
+    # ------------------------------------------------------------------
+    #   Импорт и экспорт каталога (в фоне, с прогрессом)
+    # ------------------------------------------------------------------
+
+    def import_items(self):
+        """Загружает предметы из CSV или JSON (в том числе из чужого settings.json)"""
+        path = filedialog.askopenfilename(
+            title="Импорт предметов", filetypes=[("CSV или JSON", "*.csv *.json"), ("Все файлы", "*.*")])
+        if not path:
+            return
+        replace = messagebox.askyesnocancel(
+            "Импорт предметов", "Заменить текущий список предметов?\n\nДа — заменить, Нет — добавить в конец")
+        if replace is None:
+            return
+        rarities = settings["rarities"]
+
+        def done(result):
+            items, report = result
+            self.items = items if replace else self.items + items
+            self.item_selected = set()
+            self.apply_item_filter()
+            text = f"Импортировано предметов: {len(items)}"
+            if report["skipped"]:
+                text += f", без названия пропущено: {report['skipped']}"
+            if report["unknown_rarity"]:
+                text += f", с неизвестной редкостью (стали «{rarities['common']['name']}»): {report['unknown_rarity']}"
+            self.catalog_status_var.set(text + ". Не забудь сохранить настройки")
+
+        self.run_catalog_task("Импорт", lambda progress: load_items(path, rarities, progress), done)
+
+    def export_items(self):
+        """Сохраняет все предметы (без учёта фильтра) в CSV или JSON"""
+        path = filedialog.asksaveasfilename(
+            title="Экспорт предметов", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON", "*.json")])
+        if not path:
+            return
+        items = self.form_items()
+
+        def done(count):
+            self.catalog_status_var.set(f"Экспортировано предметов: {count} → {os.path.basename(path)}")
+
+        self.run_catalog_task("Экспорт", lambda progress: dump_items(path, items, progress), done)
+
+    def run_catalog_task(self, title, work, done):
+        """work(progress) выполняется в фоне, done(результат) — снова в окне"""
+        for button in self.catalog_buttons:
+            button.state(["disabled"])
+        self.catalog_status_var.set(f"{title}...")
+        self.catalog_progress["value"] = 0
+        self._catalog_task = {"title": title, "done": done, "progress": 0.0}
+
+        def progress(count, total):
+            self._catalog_task["progress"] = count / total if total else 1.0
+
+        def run():
+            try:
+                self._catalog_task["result"] = work(progress)
+            except Exception as e:
+                self._catalog_task["error"] = e
+
+        threading.Thread(target=run, daemon=True).start()
+        self.root.after(100, self.poll_catalog_task)
+
+    def poll_catalog_task(self):
+        task = self._catalog_task
+        self.catalog_progress["value"] = task["progress"]
+        if "result" not in task and "error" not in task:
+            self.root.after(100, self.poll_catalog_task)
+            return
+        for button in self.catalog_buttons:
+            button.state(["!disabled"])
+        if "error" in task:
+            self.catalog_progress["value"] = 0
+            self.catalog_status_var.set("")
+            messagebox.showerror(f"{task['title']} не удался", str(task["error"]))
+            return
+        self.catalog_progress["value"] = 1.0
+        task["done"](task["result"])
+
+    def create_stats_tab(self):
+        """Вкладка «Статистика» — что выпадает на самом деле против настроенных шансов"""
+        tab = ttk.Frame(self.notebook)
+        self.notebook.add(tab, text="Статистика")
+
+        ttk.Label(tab, text="Выпадения с последнего изменения шансов. Красным — редкости,\n"
+                            "чей настроенный шанс не попадает в 95% интервал наблюдаемой доли",
+                  font=("Segoe UI", 10), foreground="#a78bdb").pack(pady=(12, 4))
+
+        controls = tk.Frame(tab, bg="#2c1c47")
+        controls.pack(pady=(4, 0))
+        ttk.Label(controls, text="Канал:").pack(side="left", padx=(0, 6))
+        self.stats_channel_var = tk.StringVar(value=primary_channel.name)
+        self.stats_channel_box = ttk.Combobox(controls, textvariable=self.stats_channel_var,
+                                              state="readonly", width=22)
+        self.stats_channel_box.pack(side="left", padx=(0, 16))
+        ttk.Label(controls, text="Период:").pack(side="left", padx=(0, 6))
+        self.stats_window_labels = {"Всё время": "all", "24 часа": "24h", "1 час": "1h"}
+        self.stats_window_var = tk.StringVar(value="Всё время")
+        ttk.Combobox(controls, textvariable=self.stats_window_var, values=list(self.stats_window_labels),
+                     state="readonly", width=12).pack(side="left")
+        self.stats_channel_box.bind("<<ComboboxSelected>>", lambda e: self.refresh_stats(reschedule=False))
+        self.stats_window_var.trace_add("write", lambda *a: self.refresh_stats(reschedule=False))
+
+        columns = ("name", "chance", "observed", "share", "interval", "duplicates")
+        self.stats_tree = ttk.Treeview(tab, columns=columns, show="headings", height=8)
+        for col, title, width in (("name", "Редкость", 200), ("chance", "Шанс %", 100),
+                                  ("observed", "Выпало", 100), ("share", "Доля %", 100),
+                                  ("interval", "95% интервал", 180), ("duplicates", "Повторы", 100)):
+            self.stats_tree.heading(col, text=title)
+            self.stats_tree.column(col, width=width, anchor="w" if col == "name" else "center")
+        self.stats_tree.tag_configure("off", foreground="#ff6b6b")
+        self.stats_tree.pack(padx=30, pady=10, fill="both", expand=True)
+
+        self.stats_verdict_var = tk.StringVar(value="")
+        ttk.Label(tab, textvariable=self.stats_verdict_var, wraplength=860,
+                  font=("Segoe UI", 11, "bold")).pack(pady=(4, 0))
+
+        btnf = tk.Frame(tab, bg="#2c1c47")
+        btnf.pack(pady=16)
+        ttk.Button(btnf, text="Сбросить статистику", command=self.reset_stats).pack(side="left", padx=8)
+
+        self.refresh_stats()
+
+    def refresh_stats(self, reschedule=True):
+        """Перерисовывает таблицу статистики (раз в 5 секунд и при смене канала/периода)"""
+        names = [ch.name for ch in all_channels()]
+        self.stats_channel_box.configure(values=names)
+        ch = get_channel(self.stats_channel_var.get()) or primary_channel
+        report = ch.drop_stats.report(self.stats_window_labels.get(self.stats_window_var.get(), "all"))
+
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        for row in report["rarities"]:
+            share = "—" if row["observed_pct"] is None else f"{row['observed_pct']:.2f}"
+            interval = "—" if not report["total"] else f"{row['ci_low_pct']:.2f} – {row['ci_high_pct']:.2f}"
+            self.stats_tree.insert("", "end", values=(
+                row["name"], f"{row['chance_pct']:.2f}", row["observed"], share, interval,
+                row.get("duplicates", "—"),
+            ), tags=() if row["within_ci"] else ("off",))
+
+        test = report["test"]
+        text = f"Открытий: {report['total']}. {test['message']}"
+        if test["chi2"] is not None:
+            text += f"\nхи-квадрат = {test['chi2']:.2f}, степеней свободы: {test['df']}"
+        self.stats_verdict_var.set(text)
+        if reschedule:
+            self.root.after(5000, self.refresh_stats)
+
+    def reset_stats(self):
+        """Обнуляет статистику выбранного канала"""
+        ch = get_channel(self.stats_channel_var.get()) or primary_channel
+        if messagebox.askyesno("Сброс статистики", f"Обнулить статистику дропа канала #{ch.name}?"):
+            ch.drop_stats.reset()
+            self.refresh_stats(reschedule=False)
 
     def add_item(self):
-        """Добавляет пустую строку для нового предмета"""
-        self.item_tree.insert("", "end", values=(f"Новый предмет {len(self.item_tree.get_children())+1}", "Обычный", ""))
+        """Добавляет новый предмет в конец списка (фильтр сбрасывается, чтобы его было видно)"""
+        self.items.append({"name": f"Новый предмет {len(self.items) + 1}", "rarity": "common"})
+        self.item_selected = {len(self.items) - 1}
+        self.item_search_var.set("")
+        self.item_rarity_filter_var.set(ALL_RARITIES)
+        self.apply_item_filter()
+        self._scroll_items_to(len(self.item_view))
 
     def delete_item(self):
-        """Удаляет выделенную строку предмета"""
-        sel = self.item_tree.selection()
-        if sel:
-            self.item_tree.delete(sel)
+        """Удаляет выделенные предметы"""
+        if self.item_selected:
+            self.items = [item for i, item in enumerate(self.items) if i not in self.item_selected]
+            self.item_selected = set()
+            offset = self.item_offset
+            self.apply_item_filter()
+            self._scroll_items_to(offset)
 
     def edit_item(self, event):
         """Редактирование ячеек таблицы предметов по двойному клику"""
@@ -756,6 +2040,10 @@ class App:
         col = tree.identify_column(event.x)
         if not item or col not in ("#1", "#2", "#3"):
             return
+        index = self._item_index(item)
+        if index is None:
+            return
+        data = self.items[index]
 
         bbox = tree.bbox(item, column=col)
         if not bbox:
@@ -771,6 +2059,7 @@ class App:
 
             def save(e=None):
                 new_name = entry.get().strip() or "Без названия"
+                data["name"] = new_name
                 tree.set(item, "name", new_name)
                 entry.destroy()
 
@@ -780,7 +2069,7 @@ class App:
 
         if col == "#2":  # Редкость (выпадающий список)
             current = values[1]
-            names = [settings["rarities"][k]["name"] for k in settings["rarities"]]
+            names = list(self.rarity_key_by_name)
             popup = tk.Toplevel(self.root)
             popup.wm_overrideredirect(True)
             popup.configure(bg="#3a285a")
@@ -800,6 +2089,7 @@ class App:
             def apply(e=None):
                 s = lb.curselection()
                 if s:
+                    data["rarity"] = self.rarity_key_by_name[lb.get(s[0])]
                     tree.set(item, "rarity", lb.get(s[0]))
                 popup.destroy()
 
@@ -817,6 +2107,7 @@ class App:
 
         def save(e=None):
             new_url = entry.get().strip()
+            data["image_url"] = new_url
             tree.set(item, "image_url", new_url)
             entry.destroy()
 
@@ -828,10 +2119,47 @@ class App:
         total = sum(v["chance"].get() for v in self.rarity_vars.values())
         return abs(total - 100.0) < 0.01
 
+    def settings_from_form(self):
+        """Настройки из полей интерфейса (ещё не сохранённые)"""
+        # Ключи, которых нет в интерфейсе (storage, chat_rate_limit и т.п.), сохраняем как есть
+        extra_channels = [normalize_channel(c) for c in self.extra_channels_var.get().split(",")]
+        new_settings = dict(settings)
+        new_settings.update({
+            "channel": self.channel_var.get().strip(),
+            "oauth_token": self.token_var.get().strip(),
+            "open_browser_on_start": self.open_browser_var.get(),
+            "extra_channels": [c for c in extra_channels if c],
+            "rarities": {},
+            "items": []
+        })
+
+        # Редкости
+        for key, var_info in self.rarity_vars.items():
+            new_settings["rarities"][key] = {
+                "name": settings["rarities"][key]["name"],
+                "color": settings["rarities"][key]["color"],
+                "chance": round(var_info["chance"].get(), 2)
+            }
+
+        new_settings["items"] = self.form_items()
+        return new_settings
+
+    def form_items(self):
+        """Предметы из списка в виде settings.json (редкость уже хранится ключом)"""
+        items = []
+        for data in self.items:
+            name = data.get("name", "").strip()
+            if not name:
+                continue
+            item = {"name": name, "rarity": data.get("rarity", "common")}
+            url = data.get("image_url", "").strip()
+            if url:
+                item["image_url"] = url
+            items.append(item)
+        return items
+
     def save_settings(self):
         """Собирает все данные из интерфейса и сохраняет в settings.json"""
-        global settings
-
         if not self.check_rarities_sum():
             total = sum(v["chance"].get() for v in self.rarity_vars.values())
             messagebox.showwarning(
@@ -841,37 +2169,9 @@ class App:
             return
 
         try:
-            new_settings = {
-                "channel": self.channel_var.get().strip(),
-                "oauth_token": self.token_var.get().strip(),
-                "open_browser_on_start": self.open_browser_var.get(),
-                "rarities": {},
-                "items": []
-            }
-
-            # Сохраняем редкости
-            for key, var_info in self.rarity_vars.items():
-                new_settings["rarities"][key] = {
-                    "name": settings["rarities"][key]["name"],
-                    "color": settings["rarities"][key]["color"],
-                    "chance": round(var_info["chance"].get(), 2)
-                }
-
-            # Сохраняем предметы из таблицы
-            for iid in self.item_tree.get_children():
-                name, rname, url = self.item_tree.item(iid, "values")
-                name = name.strip()
-                if not name:
-                    continue
-                # Находим ключ редкости по имени
-                r_key = next((k for k, v in settings["rarities"].items() if v["name"] == rname), "common")
-                item = {"name": name, "rarity": r_key}
-                if url.strip():
-                    item["image_url"] = url.strip()
-                new_settings["items"].append(item)
-
+            new_settings = self.settings_from_form()
             if save_settings(new_settings):
-                settings = new_settings
+                set_settings(new_settings)
                 messagebox.showinfo("Готово", "Настройки сохранены")
             else:
                 messagebox.showerror("Ошибка", "Не удалось сохранить файл настроек")
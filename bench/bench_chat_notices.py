@@ -0,0 +1,101 @@
+"""
+Ответы в чат, когда толпа зрителей на кулдауне спамит !open.
+
+Сервер и слушатель чата запускаются во временной папке на поддельном
+Twitch (bench/fake_twitch.py) с настоящим лимитом отправки (20 сообщений
+за 30 секунд). Всем --users зрителям заранее ставится кулдаун, потом
+каждый пишет !open --repeat раз. Считается, сколько строк ушло в чат,
+сколько зрителей в них упомянуто и как быстро слушатель разобрал поток.
+
+    python bench/bench_chat_notices.py [--users 200] [--repeat 3] [--wait 10]
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_twitch import FakeTwitchServer, privmsg_line  # noqa: E402
+
+CHANNEL = "benchchan"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3, help="сколько раз каждый пишет !open")
+    parser.add_argument("--wait", type=float, default=10, help="сколько секунд ждать ответов")
+    args = parser.parse_args()
+
+    fake = FakeTwitchServer().start()
+    workdir = tempfile.mkdtemp(prefix="ricase-notices-")
+    os.chdir(workdir)
+    try:
+        import app as ricase                      # noqa: E402 — создаёт настройки по умолчанию в workdir
+
+        data = ricase.load_settings()
+        data.update({
+            "channel": CHANNEL,
+            "oauth_token": "oauth:bench",
+            "bot_username": "benchbot",
+            "open_browser_on_start": False,
+            "irc_host": fake.host,
+            "irc_port": fake.port,
+        })
+        ricase.set_settings(data)
+
+        ch = ricase.primary_channel
+        users = [(f"viewer{i}", 1000 + i) for i in range(args.users)]
+        now = time.time()
+        for nick, user_id in users:
+            ch.record_cooldown(ricase.cooldown_key(nick, user_id), now - random.uniform(0, 3000))
+
+        threading.Thread(target=ricase.irc_listener, daemon=True).start()
+        if not fake.wait_for_listener(CHANNEL):
+            raise RuntimeError("IRC-слушатель не зашёл в канал")
+
+        lines = [
+            privmsg_line(CHANNEL, nick, user_id, "!open", int(time.time() * 1000))
+            for _ in range(args.repeat) for nick, user_id in users
+        ]
+        commands_before = _cooldown_commands(ricase)
+        started = time.monotonic()
+        fake.send_lines(CHANNEL, lines)
+        while _cooldown_commands(ricase) - commands_before < len(lines) and time.monotonic() - started < 30:
+            time.sleep(0.005)
+        parsed_sec = time.monotonic() - started
+
+        time.sleep(max(0.0, args.wait - parsed_sec))
+        replies = [text for channel, text, at in fake.chat_replies if at - started <= args.wait]
+        mentioned = {m for text in replies for m in re.findall(r"@(\w+)", text)}
+        stats = ricase.chat_notices.stats()
+
+        print(f"команд !open на кулдауне:   {len(lines)} ({args.users} зрителей × {args.repeat})")
+        print(f"слушатель разобрал поток за: {parsed_sec * 1000:.0f} мс")
+        print(f"строк в чат за {args.wait:.0f} с:          {len(replies)}")
+        print(f"упомянуто зрителей:          {len(mentioned)} из {args.users}")
+        print(f"самая длинная строка:        {max((len(t) for t in replies), default=0)} символов")
+        print(f"ждут отправки:               {stats['pending']} (отставание {stats['lag_sec']:.1f} с)")
+        print(f"отброшено устаревших:        {stats['stale']}, повторов: {stats['repeats']}, из-за полной очереди: {stats['dropped']}")
+        print(f"без склейки было бы строк:   {len(lines)} (в очередь влезло бы {ricase.chat_writer.max_queue})")
+    finally:
+        fake.close()
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _cooldown_commands(ricase):
+    return sum(
+        value for _, labels, value in ricase.OPEN_COMMANDS.samples() if dict(labels).get("result") == "cooldown"
+    )
+
+
+if __name__ == "__main__":
+    main()
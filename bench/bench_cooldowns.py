@@ -0,0 +1,89 @@
+"""
+Память и скорость таблицы кулдаунов на большом канале.
+
+Модель: каждый час приходят --per-hour новых зрителей и открывают кейс,
+время идёт по модельным часам (--hours часов стрима). Сравниваются
+CooldownTable (dict с ленивым истечением) и старый вариант — обычный dict,
+в котором остаются все, кто когда-либо открывал.
+
+    python bench/bench_cooldowns.py [--hours 24] [--per-hour 20000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cooldowns import CooldownTable  # noqa: E402
+
+TTL = 3600
+
+
+def run_table(hours, per_hour, start):
+    table = CooldownTable(TTL)
+    table.load({}, now=start)
+    step = 3600 / per_hour
+    ops = 0
+    started = time.perf_counter()
+    for h in range(hours):
+        for i in range(per_hour):
+            now = start + h * 3600 + i * step
+            key = f"id:{h * per_hour + i}"
+            if table.get(key, now) is None:
+                table.set(key, now)
+            ops += 2
+    elapsed = time.perf_counter() - started
+    return table, elapsed / ops
+
+
+def run_dict(hours, per_hour, start):
+    table = {}
+    step = 3600 / per_hour
+    ops = 0
+    started = time.perf_counter()
+    for h in range(hours):
+        for i in range(per_hour):
+            now = start + h * 3600 + i * step
+            key = f"id:{h * per_hour + i}"
+            opened_at = table.get(key)
+            if opened_at is None or now - opened_at >= TTL:
+                table[key] = now
+            ops += 2
+    elapsed = time.perf_counter() - started
+    return table, elapsed / ops
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    table, per_op = fn(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return table, per_op, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--per-hour", type=int, default=20000)
+    args = parser.parse_args()
+
+    start = time.time()
+    # Скорость — без tracemalloc (он замедляет каждое выделение памяти)
+    _, table_op = run_table(args.hours, args.per_hour, start)
+    _, dict_op = run_dict(args.hours, args.per_hour, start)
+    table, _, table_mem = measure(run_table, args.hours, args.per_hour, start)
+    plain, _, dict_mem = measure(run_dict, args.hours, args.per_hour, start)
+
+    print(f"открытий:                {args.hours * args.per_hour} ({args.per_hour} в час, {args.hours} ч)")
+    print(f"таблица, записей:        {len(table)} (удалено истёкших: {table.expired})")
+    print(f"таблица, память:         {table_mem / 1024 / 1024:.1f} МБ")
+    print(f"таблица, на операцию:    {table_op * 1e9:.0f} нс")
+    print(f"dict, записей:           {len(plain)}")
+    print(f"dict, память:            {dict_mem / 1024 / 1024:.1f} МБ")
+    print(f"dict, на операцию:       {dict_op * 1e9:.0f} нс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Микро-бенчмарк выбора дропа: старый путь (подсчёт предметов по редкостям,
+линейный проход по шансам и фильтрация всех предметов на каждое открытие)
+против скомпилированной таблицы DropTable.
+
+    python bench/bench_droptable.py [--items 10000] [--opens 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from droptable import DropTable  # noqa: E402
+
+RARITIES = {
+    "common":     {"name": "Обычный",      "chance": 48.0},
+    "rare":       {"name": "Редкий",       "chance": 28.0},
+    "epic":       {"name": "Эпический",    "chance": 15.0},
+    "legendary":  {"name": "Легендарный",  "chance": 6.5},
+    "godlike":    {"name": "Божественный", "chance": 2.0},
+    "impossible": {"name": "Невозможный",  "chance": 0.5},
+}
+
+
+def make_settings(n_items):
+    keys = list(RARITIES)
+    items = [{"name": f"Item {i}", "rarity": keys[i % len(keys)], "image_url": ""} for i in range(n_items)]
+    return {"rarities": RARITIES, "items": items}
+
+
+def legacy_open(settings):
+    """Копия логики get_weighted_rarity + фильтра из api_open до DropTable"""
+    rarities = settings["rarities"]
+    all_items = settings["items"]
+    rarity_counts = {}
+    for item in all_items:
+        r = item.get("rarity")
+        if r:
+            rarity_counts[r] = rarity_counts.get(r, 0) + 1
+    valid = [(k, v["chance"]) for k, v in rarities.items()
+             if v.get("chance", 0) > 0 and rarity_counts.get(k, 0) > 0]
+    total = sum(w for _, w in valid)
+    rnd = random.uniform(0, total)
+    cumulative = 0
+    key = valid[-1][0]
+    for k, w in valid:
+        cumulative += w
+        if rnd <= cumulative:
+            key = k
+            break
+    items = [i for i in all_items if i.get("rarity") == key] or all_items
+    return random.choice(items)
+
+
+def compiled_open(table):
+    key = table.pick_rarity()
+    return table.pick_item(key)
+
+
+def measure(fn, arg, opens):
+    start = time.perf_counter()
+    for _ in range(opens):
+        fn(arg)
+    return (time.perf_counter() - start) / opens * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--opens", type=int, default=20000)
+    args = parser.parse_args()
+
+    settings = make_settings(args.items)
+
+    start = time.perf_counter()
+    table = DropTable(settings)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    legacy_opens = max(1, args.opens // 20)   # старый путь слишком медленный для полного прогона
+    legacy_us = measure(legacy_open, settings, legacy_opens)
+    compiled_us = measure(compiled_open, table, args.opens)
+
+    print(f"предметов в каталоге:     {args.items}")
+    print(f"сборка DropTable:         {build_ms:.2f} мс (один раз на сохранение настроек)")
+    print(f"старый путь, на открытие: {legacy_us:.1f} мкс")
+    print(f"DropTable, на открытие:   {compiled_us:.2f} мкс")
+    print(f"ускорение:                x{legacy_us / compiled_us:.0f}")
+
+
+if __name__ == "__main__":
+    main()
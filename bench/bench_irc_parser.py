@@ -0,0 +1,83 @@
+"""
+Бенчмарк разбора чата: IrcLineReader + parse_irc_line на записанном логе.
+
+Лог — сырой поток IRC (строки с \\r\\n, как их присылает Twitch с тегами).
+Без --log генерируется синтетический лог с тегами IRCv3, PING и !open.
+Поток режется на куски случайной длины, как при recv(), чтобы проверить
+склейку строк на границах.
+
+    python bench/bench_irc_parser.py [--log chat.log] [--messages 200000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twitch_irc import IrcLineReader, parse_irc_line  # noqa: E402
+
+WORDS = ["!open", "gg", "привет", "Kappa", "LUL", "кейс!", "!open", "wp", "PogChamp ну давай"]
+
+
+def synthesize_log(n, seed=1):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        if i % 500 == 0:
+            lines.append("PING :tmi.twitch.tv")
+            continue
+        uid = rng.randint(1, 50000)
+        nick = f"viewer{uid}"
+        tags = (
+            f"@badge-info=;badges=;color=#1E90FF;display-name={nick};emotes=;"
+            f"first-msg=0;flags=;id={rng.getrandbits(64):x};mod=0;room-id=123456;"
+            f"subscriber=0;tmi-sent-ts={1700000000000 + i};turbo=0;user-id={uid};user-type="
+        )
+        lines.append(f"{tags} :{nick}!{nick}@{nick}.tmi.twitch.tv PRIVMSG #channel :{rng.choice(WORDS)}")
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+def split_chunks(data, rng):
+    chunks, pos = [], 0
+    while pos < len(data):
+        size = rng.randint(64, 4096)
+        chunks.append(data[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--log", help="файл с сырым логом IRC")
+    parser.add_argument("--messages", type=int, default=200000)
+    args = parser.parse_args()
+
+    if args.log:
+        with open(args.log, "rb") as f:
+            data = f.read()
+    else:
+        data = synthesize_log(args.messages)
+    chunks = split_chunks(data, random.Random(2))
+
+    reader = IrcLineReader()
+    parsed = opens = pings = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        for line in reader.feed(chunk):
+            msg = parse_irc_line(line)
+            parsed += 1
+            if msg.command == "PING":
+                pings += 1
+            elif msg.command == "PRIVMSG" and msg.text == "!open" and msg.tags.get("user-id"):
+                opens += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"байт: {len(data)}, кусков recv: {len(chunks)}")
+    print(f"строк разобрано: {parsed} (PING: {pings}, !open: {opens})")
+    print(f"время: {elapsed:.3f} с → {parsed / elapsed:,.0f} сообщений/с")
+
+
+if __name__ == "__main__":
+    main()
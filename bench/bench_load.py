@@ -0,0 +1,359 @@
+"""
+Нагрузочный бенчмарк всего сервера на локальном поддельном чате Twitch.
+
+Сервер RICASE запускается во временной папке (настоящий многопоточный
+Flask и IRC-слушатель), чат подключается к FakeTwitchServer из
+bench/fake_twitch.py. Генератор шлёт поток !open (и обычных сообщений)
+с PING и разрезанными строками, а несколько «оверлеев» параллельно
+забирают очередь через /api/get_pending и открывают кейсы через /api/open.
+
+Результат — JSON (stdout или --out): пропускная способность, p50/p95/p99
+задержек и пиковая память. --compare старый.json печатает разницу
+с прошлым прогоном, чтобы ловить регрессии между версиями.
+
+    python bench/bench_load.py [--messages 20000] [--users 5000] [--rate 0]
+                               [--overlays 4] [--log chat.log] [--out result.json]
+                               [--compare baseline.json] [--tracemalloc]
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_twitch import FakeTwitchServer, load_log, privmsg_line  # noqa: E402
+
+try:
+    import resource
+except ImportError:      # Windows
+    resource = None
+
+CHANNEL = "benchchan"
+CHAT_WORDS = ["gg", "привет", "Kappa", "LUL", "кейс!", "wp", "PogChamp ну давай"]
+
+
+# =============================================================================
+#   Статистика
+# =============================================================================
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    data = sorted(samples_ms)
+
+    def pick(q):
+        return round(data[min(len(data) - 1, int(q * len(data)))], 3)
+
+    return {"count": len(data), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99),
+            "max": round(data[-1], 3)}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+# =============================================================================
+#   Генератор чата
+# =============================================================================
+
+def synthesize_chat(n, users, open_share, ping_every, seed):
+    """[(строка, пользователь или None)] — !open и обычные сообщения вперемешку"""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        if ping_every and i % ping_every == 0:
+            lines.append(("PING :tmi.twitch.tv", None))
+        uid = rng.randint(1, users)
+        text = "!open" if rng.random() < open_share else rng.choice(CHAT_WORDS)
+        line = privmsg_line(CHANNEL, f"viewer{uid}", uid, text, 1700000000000 + i)
+        lines.append((line, f"viewer{uid}" if text == "!open" else None))
+    return lines
+
+
+def flood(server, chat, rate, packet, seed, first_seen):
+    """Шлёт чат пакетами по `packet` строк; rate — строк в секунду (0 — без ограничения)"""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    for start in range(0, len(chat), packet):
+        chunk = chat[start:start + packet]
+        now = time.perf_counter()
+        for _, user in chunk:
+            if user is not None:
+                first_seen.setdefault(user, now)
+        server.send_lines(CHANNEL, [line for line, _ in chunk], rng=rng)
+        if rate:
+            ahead = (start + len(chunk)) / rate - (time.perf_counter() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+    return time.perf_counter() - started
+
+
+# =============================================================================
+#   «Оверлеи»: забирают очередь и открывают кейсы
+# =============================================================================
+
+class OverlayWorker(threading.Thread):
+    def __init__(self, port, stop, first_seen):
+        super().__init__(daemon=True)
+        self.port = port
+        self.stop = stop
+        self.first_seen = first_seen
+        self.pending_ms = []
+        self.open_ms = []
+        self.end_to_end_ms = []
+        self.opened = 0
+        self.errors = 0
+        self.idle_since = time.perf_counter()
+
+    def _request(self, conn, method, path, body=None):
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        started = time.perf_counter()
+        conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+        resp = conn.getresponse()
+        data = json.loads(resp.read())
+        return resp.status, data, (time.perf_counter() - started) * 1000
+
+    def run(self):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        while not self.stop.is_set():
+            try:
+                _, entry, ms = self._request(conn, "GET", "/api/get_pending")
+                self.pending_ms.append(ms)
+                if not entry.get("success"):
+                    time.sleep(0.005)
+                    continue
+                self.idle_since = time.perf_counter()
+                status, data, ms = self._request(
+                    conn, "POST", "/api/open",
+                    {"username": entry["username"], "user_id": entry["user_id"]}
+                )
+                self.open_ms.append(ms)
+                if status == 200 and data.get("success"):
+                    self.opened += 1
+                    seen = self.first_seen.get(entry["username"])
+                    if seen is not None:
+                        self.end_to_end_ms.append((time.perf_counter() - seen) * 1000)
+                elif status != 429:
+                    self.errors += 1
+            except (OSError, http.client.HTTPException, ValueError):
+                self.errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        conn.close()
+
+
+# =============================================================================
+#   Прогон
+# =============================================================================
+
+def run(args):
+    fake = FakeTwitchServer().start()
+    workdir = tempfile.mkdtemp(prefix="ricase-bench-")
+    shutil.copytree(os.path.join(ROOT, "static"), os.path.join(workdir, "static"))
+    os.chdir(workdir)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    import app as ricase                          # noqa: E402 — создаёт настройки по умолчанию в workdir
+    from werkzeug.serving import make_server      # noqa: E402
+
+    # Переключаем сервер на поддельный чат и тестовый канал
+    data = ricase.load_settings()
+    data.update({
+        "channel": CHANNEL,
+        "extra_channels": [],
+        "oauth_token": "oauth:bench",
+        "bot_username": "benchbot",
+        "open_browser_on_start": False,
+        "irc_host": fake.host,
+        "irc_port": fake.port,
+        "queue_max_depth": args.users + 1,
+        "chat_rate_limit": 100000,               # лимит Twitch здесь не меряем
+    })
+    ricase.set_settings(data)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, ricase.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    threading.Thread(target=ricase.irc_listener, daemon=True).start()
+    if not fake.wait_for_listener(CHANNEL):
+        raise RuntimeError("IRC-слушатель не зашёл в канал")
+
+    if args.log:
+        chat = [(line, None) for line in load_log(args.log, CHANNEL)]
+        for i, (line, _) in enumerate(chat):
+            if " PRIVMSG " in line and line.rstrip().endswith(":!open"):
+                chat[i] = (line, line.split(" :", 2)[1].split("!", 1)[0].lstrip(":"))
+    else:
+        chat = synthesize_chat(args.messages, args.users, args.open_share, args.ping_every, args.seed)
+    expected = {user for _, user in chat if user is not None}
+
+    stop = threading.Event()
+    first_seen = {}
+    workers = [OverlayWorker(server.server_port, stop, first_seen) for _ in range(args.overlays)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+
+    flood_sec = flood(fake, chat, args.rate, args.packet, args.seed, first_seen)
+
+    # Ждём, пока оверлеи разберут очередь (или пока не выйдет время)
+    deadline = time.perf_counter() + args.drain_timeout
+    while time.perf_counter() < deadline:
+        opened = sum(w.opened for w in workers)
+        if opened >= len(expected):
+            break
+        if time.perf_counter() - max(w.idle_since for w in workers) > 3:
+            break
+        time.sleep(0.05)
+    total_sec = time.perf_counter() - started
+    stop.set()
+    for w in workers:
+        w.join(timeout=5)
+
+    pings = sum(1 for line, _ in chat if line.startswith("PING"))
+    pongs = fake.wait_for_pongs(pings, timeout=5)
+    opened = sum(w.opened for w in workers)
+    python_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+
+    result = {
+        "bench": "load",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": sys.platform,
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "chat": {
+            "lines": len(chat),
+            "open_commands": sum(1 for _, user in chat if user is not None),
+            "distinct_users": len(expected),
+            "pings": pings,
+            "pongs": pongs,
+            "bot_replies": len(fake.chat_replies),
+            "flood_sec": round(flood_sec, 3),
+            "lines_per_sec": round(len(chat) / flood_sec, 1) if flood_sec else None,
+        },
+        "opens": {
+            "opened": opened,
+            "lost": len(expected) - opened,
+            "errors": sum(w.errors for w in workers),
+            "total_sec": round(total_sec, 3),
+            "opens_per_sec": round(opened / total_sec, 1) if total_sec else None,
+        },
+        "latency_ms": {
+            "get_pending": percentiles([ms for w in workers for ms in w.pending_ms]),
+            "open": percentiles([ms for w in workers for ms in w.open_ms]),
+            "chat_to_open": percentiles([ms for w in workers for ms in w.end_to_end_ms]),
+        },
+        "memory": {
+            "peak_rss_mb": peak_rss_mb(),
+            "python_peak_mb": round(python_peak / 1024 / 1024, 1) if python_peak is not None else None,
+        },
+        "queue": ricase.primary_channel.queue.stats(),
+    }
+
+    server.shutdown()
+    fake.close()
+    ricase.primary_channel.inventory_store.close()
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+# =============================================================================
+#   Сравнение с прошлым прогоном
+# =============================================================================
+
+COMPARE_KEYS = [
+    ("chat", "lines_per_sec", True),
+    ("opens", "opens_per_sec", True),
+    ("latency_ms.get_pending", "p50", False),
+    ("latency_ms.get_pending", "p99", False),
+    ("latency_ms.open", "p50", False),
+    ("latency_ms.open", "p95", False),
+    ("latency_ms.open", "p99", False),
+    ("latency_ms.chat_to_open", "p95", False),
+    ("memory", "peak_rss_mb", False),
+    ("memory", "python_peak_mb", False),
+]
+
+
+def _dig(result, path):
+    for part in path.split("."):
+        result = (result or {}).get(part)
+    return result
+
+
+def compare(old, new):
+    print(f"сравнение: {old.get('revision')} → {new.get('revision')}", file=sys.stderr)
+    for section, key, higher_is_better in COMPARE_KEYS:
+        a, b = (_dig(old, section) or {}).get(key), (_dig(new, section) or {}).get(key)
+        if not a or b is None:
+            continue
+        change = (b - a) / a * 100
+        worse = change < 0 if higher_is_better else change > 0
+        mark = "хуже" if worse and abs(change) > 5 else ""
+        print(f"  {section + '.' + key:<32} {a:>10} → {b:<10} {change:+6.1f}% {mark}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=20000, help="строк чата (без --log)")
+    parser.add_argument("--users", type=int, default=5000, help="разных зрителей (без --log)")
+    parser.add_argument("--open-share", type=float, default=0.5, help="доля сообщений !open")
+    parser.add_argument("--ping-every", type=int, default=1000, help="PING каждые N строк (0 — без PING)")
+    parser.add_argument("--rate", type=float, default=0, help="строк чата в секунду (0 — без ограничения)")
+    parser.add_argument("--packet", type=int, default=50, help="строк в одном пакете")
+    parser.add_argument("--overlays", type=int, default=4, help="параллельных оверлеев")
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log", help="сырой лог чата Twitch вместо синтетического")
+    parser.add_argument("--tracemalloc", action="store_true", help="считать пик памяти Python (медленнее)")
+    parser.add_argument("--out", help="куда записать JSON (по умолчанию stdout)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    # Вывод сервера — в stderr, чтобы в stdout был только JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run(args)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
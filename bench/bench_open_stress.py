@@ -0,0 +1,165 @@
+"""
+Нагрузочная проверка /api/open: тысячи параллельных запросов к настоящему
+многопоточному серверу во временной папке.
+
+  1. Кулдаун: каждый зритель шлёт несколько запросов одновременно —
+     успешным должен быть ровно один, остальные получают 429.
+  2. Инвентарь: кулдаун выключен, все запросы успешны — каждый новый
+     предмет из ответов должен оказаться в инвентаре, без потерь.
+  3. После сброса на диск (как при выходе) журнал кулдаунов содержит
+     всех зрителей из шага 1, а база — все предметы из шага 2.
+
+    python bench/bench_open_stress.py [--users 200] [--repeat 10] [--workers 64] [--no-lock]
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class NoLocks:
+    """Подмена StripedLock для --no-lock: показывает, что ломается без блокировок"""
+
+    def hold(self, key):
+        return contextlib.nullcontext()
+
+
+def post_open(port, username, user_id):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        body = json.dumps({"username": username, "user_id": user_id})
+        conn.request("POST", "/api/open", body, {"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read())
+    finally:
+        conn.close()
+
+
+def fire(port, requests, workers):
+    """Отправляет все запросы сразу из пула потоков, возвращает [(запрос, статус, ответ)]"""
+    start = threading.Barrier(workers)
+
+    def one(req):
+        with contextlib.suppress(threading.BrokenBarrierError):
+            start.wait(timeout=0.5)     # первые запросы стартуют одновременно
+        return (req, *post_open(port, *req))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(one, requests))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=10, help="запросов на одного зрителя")
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--no-lock", action="store_true", help="отключить блокировки по зрителям")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ricase-stress-")
+    shutil.copytree(os.path.join(ROOT, "static"), os.path.join(workdir, "static"))
+    os.chdir(workdir)
+
+    import app as ricase                          # noqa: E402 — читает файлы из текущей папки
+    from storage import CooldownJournal, SqliteInventoryStore   # noqa: E402
+    from werkzeug.serving import make_server      # noqa: E402
+
+    ch = ricase.primary_channel
+    if args.no_lock:
+        ch.user_locks = NoLocks()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, ricase.app, threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    users = [(f"viewer{i}", str(1000 + i)) for i in range(args.users)]
+    requests = users * args.repeat
+    random.shuffle(requests)
+    total = len(requests)
+    errors = 0
+
+    # --- 1. Кулдаун: ровно одно открытие на зрителя ---
+    started = time.perf_counter()
+    results = fire(port, requests, args.workers)
+    elapsed = time.perf_counter() - started
+
+    successes = {}
+    for (username, _), status, data in results:
+        if status == 200 and data.get("success"):
+            successes[username] = successes.get(username, 0) + 1
+        elif status != 429:
+            errors += 1
+    doubled = sum(1 for n in successes.values() if n > 1)
+    missing = args.users - len(successes)
+
+    print(f"запросов:                 {total} ({args.users} зрителей × {args.repeat}), потоков {args.workers}")
+    print(f"блокировки по зрителям:   {'выключены' if args.no_lock else 'включены'}")
+    print(f"шаг 1, время:             {elapsed:.2f} с ({total / elapsed:.0f} запросов/с)")
+    print(f"шаг 1, двойных открытий:  {doubled}")
+    print(f"шаг 1, без открытия:      {missing}")
+
+    # --- 2. Инвентарь: все запросы успешны, ни один новый предмет не потерян ---
+    ricase.COOLDOWN_SECONDS = 0
+    ch.inventory_store.clear()
+    results = fire(port, requests, args.workers)
+
+    new_drops = {}
+    for (username, _), status, data in results:
+        if status != 200 or not data.get("success"):
+            errors += 1
+            continue
+        if not data["already_have"]:
+            new_drops.setdefault(username, []).append(data["item"]["name"])
+
+    duplicated = lost = 0
+    for username, names in new_drops.items():
+        stored = [item["name"] for item in ch.inventory_store.get_items(username)]
+        duplicated += len(names) - len(set(names))
+        lost += len(set(names) - set(stored))
+        lost += len(stored) - len(set(names))     # в инвентаре больше, чем отдано в ответах
+
+    print(f"шаг 2, новых предметов:   {sum(len(n) for n in new_drops.values())}")
+    print(f"шаг 2, выдано дважды:     {duplicated}")
+    print(f"шаг 2, расхождений:       {lost}")
+
+    # --- 3. Кулдауны и инвентарь переживают перезапуск ---
+    server.shutdown()
+    ricase.persistence.flush()                    # то же, что atexit при выходе
+    journal = CooldownJournal(
+        ricase.COOLDOWNS_FILE, ricase.COOLDOWNS_JOURNAL, ttl_seconds=3600
+    ).load()
+    lost_cooldowns = sum(1 for username, user_id in users if f"id:{user_id}" not in journal)
+    reopened = SqliteInventoryStore(ricase.INVENTORY_DB)
+    lost_on_disk = sum(
+        len(set(names) - {item["name"] for item in reopened.get_items(username)})
+        for username, names in new_drops.items()
+    )
+    reopened.close()
+    print(f"шаг 3, потеряно кулдаунов: {lost_cooldowns}")
+    print(f"шаг 3, потеряно дропов:    {lost_on_disk}")
+    print(f"ошибок сервера:           {errors}")
+
+    ok = not (doubled or missing or duplicated or lost or lost_cooldowns or lost_on_disk or errors)
+    print("ИТОГ:", "всё сходится" if ok else "НАЙДЕНЫ ПОТЕРИ")
+
+    ch.inventory_store.close()
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
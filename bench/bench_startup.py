@@ -0,0 +1,98 @@
+"""
+Время от запуска `python -m ricase serve` до первого обслуженного запроса.
+
+Сервер запускается несколько раз в отдельном процессе во временной папке,
+скрипт опрашивает /api/queue, пока не получит ответ. Заодно проверяется,
+что tkinter при запуске без окна не загружается.
+
+    python bench/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def one_run(workdir):
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "ricase", "serve", "--host", "127.0.0.1", "--port", str(port),
+         "--data-dir", workdir, "--config", os.path.join(workdir, "settings.json")],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8",
+    )
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError("сервер завершился:\n" + proc.stdout.read())
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/queue", timeout=1) as resp:
+                    resp.read()
+                    break
+            except OSError:
+                time.sleep(0.005)
+        return (time.perf_counter() - started) * 1000
+    finally:
+        proc.terminate()
+        output = proc.communicate(timeout=10)[0]
+        if "tkinter загружен" in output:
+            print("ВНИМАНИЕ: tkinter загружается при запуске без окна")
+
+
+def import_time_ms(module):
+    code = (
+        "import time, sys; t = time.perf_counter(); import " + module +
+        "; print((time.perf_counter() - t) * 1000, 'tkinter' in sys.modules)"
+    )
+    workdir = tempfile.mkdtemp(prefix="ricase-import-")
+    try:
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=workdir, capture_output=True, text=True,
+            env={**os.environ, "PYTHONPATH": ROOT, "RICASE_CONFIG": os.path.join(workdir, "settings.json")},
+        ).stdout.split()
+        return float(out[-2]), out[-1] == "True"
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    times = []
+    for _ in range(args.runs):
+        workdir = tempfile.mkdtemp(prefix="ricase-startup-")
+        # Слушатель чата стучится в закрытый локальный порт, а не в Twitch
+        with open(os.path.join(workdir, "settings.json"), "w", encoding="utf-8") as f:
+            json.dump({"channel": "bench", "irc_host": "127.0.0.1", "irc_port": 9,
+                       "open_browser_on_start": False}, f)
+        try:
+            times.append(one_run(workdir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    app_ms, tk_loaded = import_time_ms("app")
+    print(f"запусков:                    {args.runs}")
+    print(f"до первого запроса, медиана: {statistics.median(times):.0f} мс")
+    print(f"до первого запроса, лучший:  {min(times):.0f} мс")
+    print(f"import app:                  {app_ms:.0f} мс (tkinter {'загружен' if tk_loaded else 'не загружен'})")
+
+
+if __name__ == "__main__":
+    main()
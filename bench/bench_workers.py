@@ -0,0 +1,145 @@
+"""
+Пропускная способность /api/open: один процесс против --workers N.
+
+Для каждого режима `python -m ricase serve` запускается в новой временной
+папке с настройками по умолчанию, но без канала (к Twitch не подключается),
+затем --clients процессов-клиентов --duration секунд открывают кейсы
+по keep-alive соединению (у каждого запроса свой зритель, так что кулдаун
+не мешает). Считаются успешные открытия в секунду и задержки. Рост с числом
+обработчиков упирается в ядра процессора: на одном ядре его не будет.
+
+    python bench/bench_workers.py [--workers 1,2,4,8] [--clients 8] [--duration 5]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_settings():
+    """Настройки по умолчанию без канала и дополнительных каналов"""
+    scratch = tempfile.mkdtemp(prefix="ricase-settings-")
+    os.chdir(scratch)
+    try:
+        import app as ricase                      # noqa: E402 — создаёт файлы в текущей папке
+        data = json.loads(json.dumps(ricase.DEFAULT_SETTINGS))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(scratch, ignore_errors=True)
+    data.update({"channel": "", "extra_channels": [], "oauth_token": "", "open_browser_on_start": False})
+    return data
+
+
+def start_server(workers, port, workdir, settings):
+    """Сервер в workdir с настройками settings; workers=None — обычный режим одним процессом"""
+    with open(os.path.join(workdir, "settings.json"), "w", encoding="utf-8") as f:
+        json.dump(settings, f, ensure_ascii=False)
+    cmd = [sys.executable, "-m", "ricase", "serve", "--data-dir", workdir, "--host", "127.0.0.1", "--port", str(port)]
+    if workers is not None:
+        cmd += ["--workers", str(workers)]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("сервер не запустился")
+
+
+def client(port, prefix, until, out):
+    """Открывает кейсы до момента until (по time.time); в out — [успешно, ошибок, [задержки мс]]"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    ok = errors = 0
+    latencies = []
+    n = 0
+    while time.time() < until:
+        n += 1
+        body = json.dumps({"username": f"{prefix}_{n}"})
+        started = time.perf_counter()
+        try:
+            conn.request("POST", "/api/open", body, {"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+        if resp.status == 200:
+            ok += 1
+        else:
+            errors += 1
+    out.put([ok, errors, latencies])
+
+
+def run_mode(workers, clients, duration, settings):
+    workdir = tempfile.mkdtemp(prefix="ricase-workers-")
+    port = free_port()
+    proc = start_server(workers, port, workdir, settings)
+    try:
+        # Прогрев: импорт в обработчиках и первые соединения
+        time.sleep(1.0 if workers is None else 1.0 + 0.3 * workers)
+        ctx = multiprocessing.get_context("spawn")
+        out = ctx.Queue()
+        until = time.time() + duration
+        procs = [ctx.Process(target=client, args=(port, f"c{i}", until, out)) for i in range(clients)]
+        for p in procs:
+            p.start()
+        results = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ok = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    latencies = sorted(ms for r in results for ms in r[2])
+    p50 = latencies[len(latencies) // 2] if latencies else 0.0
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0.0
+    return ok / duration, errors, p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default="1,2,4,8", help="список чисел обработчиков через запятую")
+    parser.add_argument("--clients", type=int, default=8, help="параллельных клиентов")
+    parser.add_argument("--duration", type=float, default=5.0, help="секунд на каждый режим")
+    args = parser.parse_args()
+
+    settings = bench_settings()
+    modes = [None] + [int(n) for n in args.workers.split(",") if n.strip()]
+    print(f"ядер процессора: {os.cpu_count()}, клиентов: {args.clients}, по {args.duration:.0f} с на режим")
+    for workers in modes:
+        label = "один процесс" if workers is None else f"--workers {workers}"
+        rps, errors, p50, p99 = run_mode(workers, args.clients, args.duration, settings)
+        print(f"{label:>14}: {rps:7.0f} открытий/с, p50 {p50:6.1f} мс, p99 {p99:7.1f} мс, ошибок {errors}")
+
+
+if __name__ == "__main__":
+    main()
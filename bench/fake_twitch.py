@@ -0,0 +1,191 @@
+"""
+Локальная подмена irc.chat.twitch.tv для бенчмарков.
+
+Понимает ровно то, что нужно RICASE: CAP REQ, PASS/NICK (отвечает 001),
+JOIN/PART, PING/PONG и PRIVMSG от бота. Чат «зрителей» рассылается анонимным
+подключениям (слушателю), вошедшим в канал, — синтетический или
+проигранный из записанного лога, с PING и строками, разрезанными между
+пакетами как при настоящем recv().
+
+    server = FakeTwitchServer()
+    server.start()
+    # в settings.json: "irc_host": "127.0.0.1", "irc_port": server.port
+"""
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twitch_irc import IrcLineReader, parse_irc_line  # noqa: E402
+
+_PRIVMSG_CHANNEL = re.compile(r" PRIVMSG #\S+ ")
+
+
+def privmsg_line(channel, nick, user_id, text, ts_ms):
+    """Строка PRIVMSG с тегами IRCv3, как её присылает Twitch"""
+    tags = (
+        f"@badge-info=;badges=;color=#1E90FF;display-name={nick};emotes=;"
+        f"first-msg=0;flags=;id={user_id:x}-{ts_ms};mod=0;room-id=123456;"
+        f"subscriber=0;tmi-sent-ts={ts_ms};turbo=0;user-id={user_id};user-type="
+    )
+    return f"{tags} :{nick}!{nick}@{nick}.tmi.twitch.tv PRIVMSG #{channel} :{text}"
+
+
+def load_log(path, channel):
+    """Строки записанного лога чата, с каналом, заменённым на тестовый"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return [
+            _PRIVMSG_CHANNEL.sub(f" PRIVMSG #{channel} ", line.rstrip("\r\n"), count=1)
+            for line in f
+            if line.strip()
+        ]
+
+
+class _Client:
+    def __init__(self, conn):
+        self.conn = conn
+        self.nick = ""
+        self.authorized = False         # прислал PASS — это бот, а не слушатель
+        self.channels = set()
+        self.send_lock = threading.Lock()
+
+    def send(self, data):
+        with self.send_lock:
+            self.conn.sendall(data)
+
+
+class FakeTwitchServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self._sock = socket.create_server((host, port))
+        self.host = host
+        self.port = self._sock.getsockname()[1]
+
+        self._clients = []
+        self._cond = threading.Condition()
+
+        self.pings_sent = 0
+        self.pongs = 0
+        self.chat_replies = []          # [(канал, текст, время)] — что бот написал в чат
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, name="fake-twitch", daemon=True).start()
+        return self
+
+    def close(self):
+        self._sock.close()
+        with self._cond:
+            for client in self._clients:
+                try:
+                    client.conn.close()
+                except OSError:
+                    pass
+
+    # ------------------------------------------------------------------
+    #   Приём подключений
+    # ------------------------------------------------------------------
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = _Client(conn)
+            with self._cond:
+                self._clients.append(client)
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        reader = IrcLineReader()
+        try:
+            while True:
+                data = client.conn.recv(65536)
+                if not data:
+                    break
+                for line in reader.feed(data):
+                    self._handle(client, parse_irc_line(line))
+        except OSError:
+            pass
+        finally:
+            with self._cond:
+                if client in self._clients:
+                    self._clients.remove(client)
+                self._cond.notify_all()
+
+    def _handle(self, client, msg):
+        if msg.command == "CAP":
+            client.send(f":tmi.twitch.tv CAP * ACK :{msg.text}\r\n".encode())
+        elif msg.command == "PASS":
+            client.authorized = True
+        elif msg.command == "NICK":
+            client.nick = msg.text
+            client.send(f":tmi.twitch.tv 001 {client.nick} :Welcome, GLHF!\r\n".encode())
+        elif msg.command in ("JOIN", "PART"):
+            names = {c.lstrip("#").lower() for c in msg.params[0].split(",")}
+            with self._cond:
+                if msg.command == "JOIN":
+                    client.channels |= names
+                else:
+                    client.channels -= names
+                self._cond.notify_all()
+        elif msg.command == "PING":
+            client.send(f":tmi.twitch.tv PONG tmi.twitch.tv :{msg.text}\r\n".encode())
+        elif msg.command == "PONG":
+            with self._cond:
+                self.pongs += 1
+                self._cond.notify_all()
+        elif msg.command == "PRIVMSG" and len(msg.params) >= 2:
+            with self._cond:
+                self.chat_replies.append((msg.params[0].lstrip("#"), msg.text, time.monotonic()))
+
+    # ------------------------------------------------------------------
+    #   Рассылка чата
+    # ------------------------------------------------------------------
+
+    def listeners(self, channel):
+        """Анонимные подключения (слушатели), вошедшие в канал"""
+        with self._cond:
+            return [c for c in self._clients if not c.authorized and channel in c.channels]
+
+    def wait_for_listener(self, channel, timeout=30):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while time.monotonic() < deadline:
+                if any(not c.authorized and channel in c.channels for c in self._clients):
+                    return True
+                self._cond.wait(timeout=0.1)
+        return False
+
+    def wait_for_pongs(self, count, timeout=10):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.pongs < count and time.monotonic() < deadline:
+                self._cond.wait(timeout=0.1)
+            return self.pongs
+
+    def send_lines(self, channel, lines, rng=random, split=True):
+        """
+        Отправляет строки слушателям канала одним пакетом. При split=True
+        пакет режется в случайных местах (в том числе посреди UTF-8 символа),
+        и куски уходят отдельными sendall — на приёмной стороне строки
+        будут разорваны между recv().
+        """
+        data = ("\r\n".join(lines) + "\r\n").encode("utf-8")
+        pings = sum(1 for line in lines if line.startswith("PING"))
+        with self._cond:
+            self.pings_sent += pings
+        for client in self.listeners(channel):
+            if not split or len(data) < 2:
+                client.send(data)
+                continue
+            pos = 0
+            while pos < len(data):
+                step = rng.randint(1, max(1, len(data) // 2))
+                client.send(data[pos:pos + step])
+                pos += step
@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+import os
+
+from storage import atomic_write_text
+
+# =============================================================================
+#   Импорт и экспорт каталога предметов (CSV / JSON)
+# =============================================================================
+#
+#   Каталог — список {"name", "rarity", "image_url"}, как в settings.json.
+#   В файле редкость можно писать и ключом (epic), и названием (Эпический):
+#   для перевода заранее собирается словарь название → ключ, так что разбор
+#   линейный по числу строк. Функции не трогают интерфейс и вызываются
+#   из фонового потока; progress(сделано, всего) сообщает, сколько готово.
+
+CSV_COLUMNS = ("name", "rarity", "image_url")
+# Заголовки, которые понимаем в CSV (в том числе из русской таблицы)
+HEADER_ALIASES = {
+    "name": "name", "название": "name", "предмет": "name",
+    "rarity": "rarity", "редкость": "rarity",
+    "image_url": "image_url", "image": "image_url", "url": "image_url", "картинка": "image_url",
+    "ссылка на картинку": "image_url",
+}
+PROGRESS_EVERY = 500            # строк между вызовами progress
+
+
+def rarity_lookup(rarities):
+    """{ключ или название редкости в нижнем регистре: ключ}"""
+    lookup = {}
+    for key, info in rarities.items():
+        lookup[str(info.get("name", key)).strip().lower()] = key
+    for key in rarities:
+        lookup[key.lower()] = key       # ключ важнее совпавшего названия
+    return lookup
+
+
+def load_items(path, rarities, progress=None, default_rarity="common"):
+    """
+    Читает предметы из .csv или .json. Возвращает (предметы, отчёт):
+    отчёт — сколько строк прочитано, пропущено без названия и с неизвестной
+    редкостью (такие получают default_rarity).
+    """
+    with open(path, encoding="utf-8-sig") as f:
+        text = f.read()
+    if os.path.splitext(path)[1].lower() == ".json":
+        rows = _json_rows(text)
+    else:
+        rows = _csv_rows(text)
+
+    lookup = rarity_lookup(rarities)
+    items = []
+    report = {"rows": len(rows), "skipped": 0, "unknown_rarity": 0}
+    for i, row in enumerate(rows, 1):
+        name = str(row.get("name") or "").strip()
+        if not name:
+            report["skipped"] += 1
+            continue
+        r_key = lookup.get(str(row.get("rarity") or "").strip().lower())
+        if r_key is None:
+            report["unknown_rarity"] += 1
+            r_key = default_rarity
+        item = {"name": name, "rarity": r_key}
+        url = str(row.get("image_url") or "").strip()
+        if url:
+            item["image_url"] = url
+        items.append(item)
+        if progress and i % PROGRESS_EVERY == 0:
+            progress(i, len(rows))
+    if progress:
+        progress(len(rows), len(rows))
+    return items, report
+
+
+def _json_rows(text):
+    """Список предметов или целый settings.json (берутся его items)"""
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("items", [])
+    if not isinstance(data, list):
+        raise ValueError("в JSON нет списка предметов")
+    return [row for row in data if isinstance(row, dict)]
+
+
+def _csv_rows(text):
+    """Строки CSV как словари; заголовок необязателен, разделитель — , ; или табуляция"""
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    rows = list(csv.reader(io.StringIO(text), dialect))
+    if not rows:
+        return []
+
+    header = [HEADER_ALIASES.get(cell.strip().lower()) for cell in rows[0]]
+    if "name" in header:
+        columns, rows = header, rows[1:]
+    else:
+        columns = CSV_COLUMNS
+    return [
+        {col: cell for col, cell in zip(columns, row) if col}
+        for row in rows if any(cell.strip() for cell in row)
+    ]
+
+
+def dump_items(path, items, progress=None):
+    """Записывает предметы в .csv или .json (атомарно, через временный файл)"""
+    if os.path.splitext(path)[1].lower() == ".json":
+        if progress:
+            progress(0, len(items))
+        text = json.dumps({"items": items}, ensure_ascii=False, indent=2)
+    else:
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(CSV_COLUMNS)
+        for i, item in enumerate(items, 1):
+            writer.writerow([item.get("name", ""), item.get("rarity", ""), item.get("image_url", "")])
+            if progress and i % PROGRESS_EVERY == 0:
+                progress(i, len(items))
+        text = out.getvalue()
+    atomic_write_text(path, text)
+    if progress:
+        progress(len(items), len(items))
+    return len(items)
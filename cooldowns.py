@@ -0,0 +1,89 @@
+import threading
+import time
+
+# =============================================================================
+#   Таблица кулдаунов с ленивым истечением
+# =============================================================================
+#
+#   Кулдаун старше COOLDOWN_SECONDS ничего не значит, поэтому хранить
+#   каждого, кто когда-либо писал !open, незачем. Таблица — обычный dict
+#   {ключ: время открытия}: чтение сверяет время с ttl и истёкшую запись
+#   просто не замечает, а когда словарь вдвое вырастет с прошлой чистки,
+#   запись выбрасывает всё истёкшее одним проходом. Проход по n записям
+#   случается не чаще чем раз на n/2 новых, так что в среднем get и set —
+#   одна операция со словарём, а памяти не больше двух кулдаунов зрителей.
+#
+#   Запись удаляется, только когда истекла по своему времени: если часы
+#   перевели назад, кулдауны «из будущего» доживают до своего срока.
+#
+#   get и set идут без блокировки (одна операция dict атомарна под GIL);
+#   блокировка есть только у чистки, чтобы два потока не чистили сразу.
+
+
+class CooldownTable:
+    """{ключ кулдауна: время последнего открытия}, только за последние ttl секунд"""
+
+    def __init__(self, ttl_seconds, min_purge_size=1024):
+        self.ttl = ttl_seconds
+        self.min_purge_size = min_purge_size
+        self._times = {}
+        self._purge_at = min_purge_size     # размер словаря, при котором пора чистить
+        self._purging = threading.Lock()
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._times)
+
+    def get(self, key, now=None):
+        """Время последнего открытия или None, если кулдаун давно прошёл"""
+        stamp = self._times.get(key)
+        if stamp is None or stamp + self.ttl <= (time.time() if now is None else now):
+            return None
+        return stamp
+
+    def set(self, key, timestamp):
+        self._times[key] = timestamp
+        if len(self._times) >= self._purge_at:
+            self.purge(max(time.time(), timestamp))
+
+    def purge(self, now=None):
+        """Выбрасывает истёкшие записи; если чистит другой поток — ничего не делает"""
+        if not self._purging.acquire(blocking=False):
+            return
+        try:
+            times = self._times
+            cutoff = (time.time() if now is None else now) - self.ttl
+            removed = 0
+            for key, stamp in list(times.items()):
+                if stamp > cutoff:
+                    continue
+                current = times.pop(key, None)
+                if current is not None and current > cutoff:
+                    # Зритель как раз открыл кейс снова — возвращаем, не затирая ещё более новое
+                    times.setdefault(key, current)
+                else:
+                    removed += 1
+            self.expired += removed
+            self._purge_at = max(self.min_purge_size, 2 * len(times))
+        finally:
+            self._purging.release()
+
+    def load(self, state, now=None):
+        """Заполняет таблицу из {ключ: время} (снимок и журнал), истёкшие пропускает"""
+        now = time.time() if now is None else now
+        for key, stamp in state.items():
+            if stamp + self.ttl > now:
+                self._times[key] = float(stamp)
+        self.purge(now)
+
+    def snapshot(self):
+        """Копия {ключ: время} без истёкших — для снимка cooldowns.json"""
+        cutoff = time.time() - self.ttl
+        return {key: stamp for key, stamp in list(self._times.items()) if stamp > cutoff}
+
+    def clear(self):
+        self._times = {}
+        self._purge_at = self.min_purge_size
+
+    def stats(self):
+        return {"entries": len(self._times), "expired": self.expired}
@@ -0,0 +1,330 @@
+import json
+import math
+import os
+import threading
+import time
+
+from storage import atomic_write_text
+
+# =============================================================================
+#   Статистика дропа и проверка честности шансов
+# =============================================================================
+#
+#   Каждое открытие кейса прибавляет по единице к счётчикам редкости,
+#   предмета и текущего часа — O(1) под одной блокировкой, без диска.
+#   На диск (drop_stats.json канала) счётчики пишет WriteBehind вместе
+#   с инвентарём.
+#
+#   Отчёт сравнивает, сколько выпало каждой редкости, с тем, сколько должно
+#   было выпасть по настроенным шансам: доля с 95% интервалом Уилсона для
+#   каждой редкости и критерий хи-квадрат для всех сразу. Шансы меняются —
+#   счётчики начинаются заново (старые остаются в "previous"), иначе
+#   сравнивать было бы не с чем.
+
+HOUR = 3600
+KEEP_HOURS = 7 * 24                 # сколько часовых корзин хранить
+WINDOWS = {"all": None, "24h": 24, "1h": 1}
+Z_95 = 1.959964                     # квантиль нормального распределения для 95%
+MIN_EXPECTED = 5                    # меньше ожидаемых выпадений — хи-квадрат не надёжен
+
+# Пороги p-значения хи-квадрат
+P_WARN = 0.01
+P_SUSPICIOUS = 0.001
+
+
+class DropStats:
+    def __init__(self, path, writer=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+
+        self.chances = {}               # {редкость: вероятность} — нормированные шансы, по которым идёт счёт
+        self.names = {}                 # {редкость: название для отчёта}
+        self.items_by_rarity = {}       # {редкость: [название предмета, ...]}
+        self.previous = None            # итоги до последней смены шансов
+        self._start()
+        self._load()
+
+        self._writer = writer
+        if writer is not None:
+            writer.add(self)
+
+    def _start(self, chances=None):
+        self.since = time.time()
+        self.chances = chances or {}
+        self.rarity = {}                # {редкость: выпало}
+        self.items = {}                 # {предмет: выпало}
+        self.duplicates = {}            # {редкость: выпало повторов}
+        self.hours = {}                 # {номер часа: {редкость: выпало}}
+
+    # ------------------------------------------------------------------
+    #   Файл
+    # ------------------------------------------------------------------
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.since = float(data["since"])
+            self.chances = data.get("chances", {})
+            self.rarity = data.get("rarity", {})
+            self.items = data.get("items", {})
+            self.duplicates = data.get("duplicates", {})
+            self.hours = {int(h): counts for h, counts in data.get("hours", {}).items()}
+            self.previous = data.get("previous")
+        except Exception as e:
+            print(f"Ошибка чтения {self.path}: {e}")
+            self._start()
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            text = json.dumps({
+                "since": round(self.since, 3),
+                "chances": self.chances,
+                "rarity": self.rarity,
+                "items": self.items,
+                "duplicates": self.duplicates,
+                "hours": {str(h): counts for h, counts in self.hours.items()},
+                "previous": self.previous,
+            }, ensure_ascii=False, separators=(",", ":"))
+            self._dirty = False
+        atomic_write_text(self.path, text)
+
+    # ------------------------------------------------------------------
+    #   Счёт
+    # ------------------------------------------------------------------
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.remove(self)
+        self.flush()
+
+    def configure(self, chances, rarities, items):
+        """
+        Задаёт ожидаемое распределение. chances — {редкость: шанс} тех
+        редкостей, что реально могут выпасть (DropTable.rarity_chances).
+        """
+        total = float(sum(chances.values()))
+        expected = {k: round(v / total, 9) for k, v in chances.items()} if total > 0 else {}
+        by_rarity = {}
+        for item in items:
+            by_rarity.setdefault(item.get("rarity"), []).append(item["name"])
+
+        with self._lock:
+            self.names = {k: info.get("name", k) for k, info in rarities.items()}
+            self.items_by_rarity = by_rarity
+            if expected == self.chances:
+                return
+            total_opens = sum(self.rarity.values())
+            if total_opens:
+                print(f"Шансы изменились — статистика дропа начата заново (было открытий: {total_opens})")
+                self.previous = {
+                    "since": round(self.since, 3),
+                    "until": round(time.time(), 3),
+                    "chances": self.chances,
+                    "rarity": self.rarity,
+                }
+            self._start(expected)
+            self._dirty = True
+
+    def record(self, rarity_key, item_name, duplicate):
+        """Учитывает одно открытие кейса"""
+        hour = int(time.time()) // HOUR
+        with self._lock:
+            self.rarity[rarity_key] = self.rarity.get(rarity_key, 0) + 1
+            self.items[item_name] = self.items.get(item_name, 0) + 1
+            if duplicate:
+                self.duplicates[rarity_key] = self.duplicates.get(rarity_key, 0) + 1
+            bucket = self.hours.get(hour)
+            if bucket is None:
+                bucket = self.hours[hour] = {}
+                for old in [h for h in self.hours if h <= hour - KEEP_HOURS]:
+                    del self.hours[old]
+            bucket[rarity_key] = bucket.get(rarity_key, 0) + 1
+            self._dirty = True
+
+    def reset(self):
+        """Обнуляет счётчики (шансы остаются прежними)"""
+        with self._lock:
+            self._start(self.chances)
+            self.previous = None
+            self._dirty = True
+
+    # ------------------------------------------------------------------
+    #   Отчёт
+    # ------------------------------------------------------------------
+
+    def report(self, window="all"):
+        """
+        Наблюдаемое против настроенного за окно ("all" — с последней смены
+        шансов, "24h", "1h"): по редкостям, по предметам (только "all")
+        и итоговая проверка хи-квадрат.
+        """
+        hours = WINDOWS[window]
+        with self._lock:
+            if hours is None:
+                counts = dict(self.rarity)
+            else:
+                first = int(time.time()) // HOUR - hours + 1
+                counts = {}
+                for h, bucket in self.hours.items():
+                    if h >= first:
+                        for k, n in bucket.items():
+                            counts[k] = counts.get(k, 0) + n
+            chances = dict(self.chances)
+            items = dict(self.items) if hours is None else None
+            duplicates = dict(self.duplicates)
+            names = dict(self.names)
+            items_by_rarity = {k: list(v) for k, v in self.items_by_rarity.items()}
+            since = self.since if hours is None else max(self.since, time.time() - hours * HOUR)
+            previous = self.previous
+
+        total = sum(counts.values())
+        rarities = []
+        for key in list(chances) + [k for k in counts if k not in chances]:
+            p = chances.get(key, 0.0)
+            observed = counts.get(key, 0)
+            low, high = wilson_interval(observed, total)
+            row = {
+                "key": key,
+                "name": names.get(key, key),
+                "chance_pct": round(p * 100, 4),
+                "observed": observed,
+                "observed_pct": round(observed / total * 100, 4) if total else None,
+                "expected": round(p * total, 2),
+                "ci_low_pct": round(low * 100, 4),
+                "ci_high_pct": round(high * 100, 4),
+                "within_ci": total == 0 or low <= p <= high,
+            }
+            if hours is None:
+                row["duplicates"] = duplicates.get(key, 0)
+            rarities.append(row)
+
+        result = {
+            "window": window,
+            "since": round(since, 3),
+            "total": total,
+            "rarities": rarities,
+            "test": chi_square_test(
+                [counts.get(k, 0) for k in chances],
+                [chances[k] for k in chances],
+                unexpected=total - sum(counts.get(k, 0) for k in chances),
+            ),
+        }
+        if items is not None:
+            result["items"] = _item_rows(items, chances, items_by_rarity, total)
+            result["previous"] = previous
+        return result
+
+
+def _item_rows(items, chances, items_by_rarity, total):
+    """Предметы: выпало против ожидаемого (шанс редкости поровну между её предметами)"""
+    rows = []
+    for rarity, names in items_by_rarity.items():
+        p = chances.get(rarity, 0.0) / len(names)
+        for name in names:
+            observed = items.get(name, 0)
+            rows.append({
+                "name": name,
+                "rarity": rarity,
+                "observed": observed,
+                "expected": round(p * total, 2),
+                "chance_pct": round(p * 100, 4),
+            })
+    return rows
+
+
+# =============================================================================
+#   Статистические функции (без scipy)
+# =============================================================================
+
+def wilson_interval(successes, trials, z=Z_95):
+    """95% интервал Уилсона для доли — не вылезает за [0, 1] и работает на малых числах"""
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denom = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denom
+    half = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def chi_square_test(observed, probs, unexpected=0):
+    """
+    Критерий согласия хи-квадрат: наблюдаемые частоты против вероятностей.
+    unexpected — выпадения редкостей, которых нет в настройках (должно быть 0).
+    """
+    total = sum(observed) + unexpected
+    result = {"chi2": None, "df": len(probs) - 1, "p_value": None, "min_expected": None}
+    if total == 0 or len(probs) < 2:
+        result.update(verdict="no_data", message="Открытий пока нет — проверять нечего")
+        return result
+    if unexpected:
+        result.update(verdict="suspicious",
+                      message=f"Выпали редкости, которых нет в настройках ({unexpected} раз)")
+        return result
+
+    expected = [p * total for p in probs]
+    chi2 = sum((o - e) ** 2 / e for o, e in zip(observed, expected) if e > 0)
+    p_value = chi2_sf(chi2, result["df"])
+    result.update(chi2=round(chi2, 4), p_value=p_value, min_expected=round(min(expected), 2))
+
+    if min(expected) < MIN_EXPECTED:
+        result.update(verdict="low_data", message=(
+            f"Мало открытий для вывода: самой редкой редкости ожидается {min(expected):.1f} "
+            f"выпадений, нужно хотя бы {MIN_EXPECTED}"))
+    elif p_value < P_SUSPICIOUS:
+        result.update(verdict="suspicious", message=(
+            f"Расхождение с шансами слишком велико для случайности (p = {p_value:.2g}) — "
+            "проверь настройки и таблицу дропа"))
+    elif p_value < P_WARN:
+        result.update(verdict="warn", message=(
+            f"Расхождение заметное, но может быть случайным (p = {p_value:.2g}) — понаблюдай дальше"))
+    else:
+        result.update(verdict="ok", message=f"Выпадения соответствуют шансам (p = {p_value:.2g})")
+    return result
+
+
+def chi2_sf(x, df):
+    """P(χ² ≥ x) при df степенях свободы — регуляризованная верхняя неполная гамма-функция"""
+    if x <= 0:
+        return 1.0
+    return _gamma_q(df / 2.0, x / 2.0)
+
+
+def _gamma_q(a, x, eps=1e-12, max_iter=500):
+    """Q(a, x): ряд при x < a + 1, иначе цепная дробь (Numerical Recipes, gammq)"""
+    log_front = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        term = total = 1.0 / a
+        ap = a
+        for _ in range(max_iter):
+            ap += 1
+            term *= x / ap
+            total += term
+            if abs(term) < abs(total) * eps:
+                break
+        return max(0.0, 1.0 - total * math.exp(log_front))
+
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, max_iter):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < eps:
+            break
+    return min(1.0, math.exp(log_front) * h)
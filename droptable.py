@@ -0,0 +1,160 @@
+import random
+
+# =============================================================================
+#   Скомпилированная таблица дропа
+# =============================================================================
+#
+#   Строится один раз из настроек (при загрузке и после сохранения).
+#   Выбор редкости — алиас-таблица Уолкера, выбор предмета — индекс
+#   в готовом списке предметов редкости, оба за O(1) на открытие.
+#
+#   Владение предметами хранится битовой маской (int) по устойчивым
+#   номерам предметов из хранилища. Для каждой редкости заранее собрана
+#   маска её предметов, так что «случайный предмет, которого ещё нет»
+#   не требует обхода ни инвентаря, ни каталога.
+
+
+class AliasTable:
+    """
+    Алиас-таблица Уолкера (вариант Фогеля): выбор из n исходов с
+    произвольными весами за O(1) — один случайный индекс и одно сравнение.
+    """
+
+    def __init__(self, keys, weights):
+        n = len(keys)
+        if n == 0:
+            raise ValueError("AliasTable: пустой список исходов")
+        total = float(sum(weights))
+        if total <= 0:
+            weights = [1.0] * n
+            total = float(n)
+
+        self.keys = list(keys)
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+
+        # Остатки — погрешность округления, вероятность 1
+        for i in large + small:
+            self.prob[i] = 1.0
+            self.alias[i] = i
+
+    def sample(self, rng=random):
+        i = int(rng.random() * len(self.keys))
+        if rng.random() < self.prob[i]:
+            return self.keys[i]
+        return self.keys[self.alias[i]]
+
+
+class DropTable:
+    """
+    Всё, что нужно для открытия кейса, заранее разложенное по редкостям.
+    Правило прежнее: редкости без предметов и с нулевым шансом не выпадают.
+    """
+
+    def __init__(self, settings, item_index=None):
+        rarities = settings.get("rarities", {})
+        self.all_items = list(settings.get("items", []))
+
+        self.items_by_rarity = {}
+        for item in self.all_items:
+            r = item.get("rarity")
+            if r:
+                self.items_by_rarity.setdefault(r, []).append(item)
+
+        # Номера битов владения: устойчивые из хранилища или просто по порядку
+        if item_index is None:
+            item_index = {}
+            for item in self.all_items:
+                item_index.setdefault(item["name"], len(item_index))
+        self.item_index = item_index
+        self.item_by_bit = {item_index[it["name"]]: it for it in self.all_items}
+        self.bits_by_rarity = {
+            r: [item_index[it["name"]] for it in items] for r, items in self.items_by_rarity.items()
+        }
+        self.all_bits = [item_index[it["name"]] for it in self.all_items]
+        self.mask_by_rarity = {r: _mask(bits) for r, bits in self.bits_by_rarity.items()}
+        self.all_mask = _mask(self.all_bits)
+
+        valid = [
+            (key, info["chance"])
+            for key, info in rarities.items()
+            if info.get("chance", 0) > 0 and self.items_by_rarity.get(key)
+        ]
+        self.rarity_chances = dict(valid)      # {редкость: шанс} — то, что реально может выпасть
+        self.rarity_alias = AliasTable(*zip(*valid)) if valid else None
+
+    def pick_rarity(self, rng=random):
+        """Случайная редкость с учётом шансов (O(1))"""
+        if self.rarity_alias is None:
+            return "common"
+        return self.rarity_alias.sample(rng)
+
+    def rarity_items(self, rarity_key):
+        """Предметы редкости; если их нет — все предметы"""
+        return self.items_by_rarity.get(rarity_key) or self.all_items
+
+    def pick_item(self, rarity_key, rng=random):
+        """Случайный предмет редкости (O(1))"""
+        items = self.rarity_items(rarity_key)
+        return items[int(rng.random() * len(items))]
+
+    def pick_unowned(self, rarity_key, owned_bits, rng=random, attempts=4):
+        """
+        Случайный предмет редкости, которого нет в маске owned_bits,
+        или None, если у пользователя уже есть все предметы редкости.
+        Сначала несколько случайных попыток (у большинства зрителей коллекция
+        почти пустая), потом точный выбор по маске свободных предметов.
+        Оба способа дают равномерный выбор среди недостающих предметов.
+        """
+        items = self.rarity_items(rarity_key)
+        if not items:
+            return None
+        if rarity_key in self.items_by_rarity:
+            bits, mask = self.bits_by_rarity[rarity_key], self.mask_by_rarity[rarity_key]
+        else:
+            bits, mask = self.all_bits, self.all_mask
+
+        for _ in range(attempts):
+            i = int(rng.random() * len(items))
+            if not (owned_bits >> bits[i]) & 1:
+                return items[i]
+
+        free = mask & ~owned_bits
+        count = free.bit_count()
+        if not count:
+            return None
+        return self.item_by_bit[_nth_set_bit(free, int(rng.random() * count))]
+
+
+def _mask(bits):
+    """Маска с установленными битами из списка (через bytearray — линейно)"""
+    if not bits:
+        return 0
+    buf = bytearray(max(bits) // 8 + 1)
+    for b in bits:
+        buf[b >> 3] |= 1 << (b & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _nth_set_bit(x, n):
+    """Позиция n-го (с нуля) установленного бита — двоичный поиск по bit_count"""
+    lo, hi = 0, x.bit_length()
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if (x & ((1 << mid) - 1)).bit_count() > n:
+            hi = mid
+        else:
+            lo = mid
+    return lo
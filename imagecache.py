@@ -0,0 +1,331 @@
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import threading
+import time
+import urllib.request
+
+# Pillow не обязателен: без него картинки кешируются как есть. Импортируется
+# при первом уменьшении, чтобы не замедлять запуск сервера
+HAS_PILLOW = importlib.util.find_spec("PIL") is not None
+
+# =============================================================================
+#   Кеш картинок предметов
+# =============================================================================
+#
+#   Каждая ссылка image_url из каталога скачивается один раз, уменьшается до
+#   размера плитки рулетки и хранится на диске. Оверлей берёт картинки
+#   с локального адреса /img/<ключ> вместо того, чтобы OBS заново качал и
+#   декодировал полноразмерные файлы на каждом кейсе.
+#
+#   Файлы названы по хешу содержимого (одинаковые картинки хранятся один раз),
+#   общий размер ограничен — давно не запрошенные файлы удаляются первыми.
+#   Отдаются только ссылки из каталога, так что это не открытый прокси.
+#   SVG не кешируется: с адреса самой программы его скрипты выполнялись бы
+#   как её страницы — такие картинки оверлей берёт по исходной ссылке.
+#
+#   С --workers папка у процессов общая, но скачивает, удаляет старое и пишет
+#   index.json только главный процесс. Обработчики открывают кеш с
+#   readonly=True: перечитывают индекс, когда тот изменился на диске, а то,
+#   чего в нём ещё нет, отдают как отсутствующее (оверлей возьмёт ссылку).
+
+TILE_SIZE = 120                     # размер плитки рулетки в оверлее, px
+MAX_DOWNLOAD_BYTES = 10 * 1024 * 1024
+FETCH_TIMEOUT = 10
+INDEX_FILE = "index.json"
+INDEX_SAVE_INTERVAL = 60            # как часто сохранять время последнего запроса картинок
+BLOCKED_TYPES = ("image/svg+xml",)  # могут содержать скрипты
+
+
+def url_key(url):
+    """Короткий ключ ссылки для адреса /img/<ключ>"""
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+
+
+class ImageCache:
+    def __init__(self, cache_dir, max_bytes=64 * 1024 * 1024, tile_size=TILE_SIZE, readonly=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.tile_size = tile_size
+        self.readonly = readonly
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._urls = {}                 # {ключ: ссылка} — что разрешено отдавать
+        self._index = {}                # {ссылка: {"file", "size", "type", "used"}}
+        self._failures = {}             # {ссылка: текст ошибки}
+        self._fetching = {}             # {ссылка: Event} — загрузки, которые уже идут
+        self._queue = []
+        self._worker = None
+        self._dirty = False
+        self._save_lock = threading.Lock()
+        self._saved_at = time.monotonic()
+        self._index_mtime = None        # readonly: индекс с диска какой версии загружен
+        self._load_index()
+
+    # ------------------------------------------------------------------
+    #   Индекс на диске
+    # ------------------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _load_index(self):
+        try:
+            mtime = os.stat(self._path(INDEX_FILE)).st_mtime_ns
+            with open(self._path(INDEX_FILE), "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Ошибка чтения индекса кеша картинок: {e}")
+            return
+        # Записи без файла (удалили руками) и SVG из старых версий забываем
+        index = {
+            url: meta for url, meta in index.items()
+            if meta.get("type") not in BLOCKED_TYPES and os.path.exists(self._path(meta["file"]))
+        }
+        with self._lock:
+            self._index = index
+            self._index_mtime = mtime
+
+    def _reload_index(self):
+        """readonly: перечитывает индекс, если главный процесс сохранил новый"""
+        try:
+            mtime = os.stat(self._path(INDEX_FILE)).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._index_mtime:
+            self._load_index()
+
+    def _save_index(self):
+        if self.readonly:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                snapshot = json.dumps(self._index, ensure_ascii=False)
+                self._dirty = False
+                self._saved_at = time.monotonic()
+            try:
+                tmp = self._path(f"{INDEX_FILE}.{os.getpid()}.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(snapshot)
+                os.replace(tmp, self._path(INDEX_FILE))
+            except OSError as e:
+                print(f"Ошибка сохранения индекса кеша картинок: {e}")
+
+    # ------------------------------------------------------------------
+    #   Публичный интерфейс
+    # ------------------------------------------------------------------
+
+    def register(self, urls):
+        """
+        Задаёт ссылки из каталога и ставит ещё не скачанные в фоновую загрузку.
+        Возвращает {ссылка: ключ}.
+        """
+        urls = {u.strip() for u in urls if u and u.strip().startswith(("http://", "https://"))}
+        with self._lock:
+            self._urls = {url_key(u): u for u in urls}
+            if self.readonly:
+                return {u: url_key(u) for u in urls}
+            self._failures = {u: err for u, err in self._failures.items() if u in urls}
+            missing = [u for u in urls if u not in self._index and u not in self._failures]
+            self._queue = missing
+            if missing and self._worker is None:
+                self._worker = threading.Thread(target=self._prefetch, name="image-cache", daemon=True)
+                self._worker.start()
+        return {u: url_key(u) for u in urls}
+
+    def get(self, key):
+        """
+        Путь к файлу и тип содержимого для ключа или None.
+        Если картинка ещё не скачана — скачивает (один раз на ссылку);
+        readonly-кеш не скачивает, а только сверяется с индексом на диске.
+        """
+        with self._lock:
+            url = self._urls.get(key)
+        if url is None:
+            return None
+        if self.readonly:
+            self._reload_index()
+            with self._lock:
+                meta = self._index.get(url)
+            if meta is None or not os.path.exists(self._path(meta["file"])):
+                return None
+            return self._path(meta["file"]), meta["type"]
+        meta = self._fetch(url)
+        if meta is not None and not os.path.exists(self._path(meta["file"])):
+            # Файл пропал с диска (удалили руками) — скачиваем заново
+            with self._lock:
+                if self._index.get(url) is meta:
+                    del self._index[url]
+            meta = self._fetch(url)
+        if meta is None:
+            return None
+        with self._lock:
+            meta["used"] = time.time()
+            self._dirty = True
+            save = time.monotonic() - self._saved_at >= INDEX_SAVE_INTERVAL
+        if save:
+            self._save_index()
+        return self._path(meta["file"]), meta["type"]
+
+    def retry_failed(self):
+        """Забывает ошибки и пробует скачать эти картинки ещё раз"""
+        if self.readonly:
+            return
+        with self._lock:
+            urls = list(self._urls.values())
+            self._failures.clear()
+        self.register(urls)
+
+    def status(self):
+        """Сколько картинок в кеше, сколько ждут загрузки и какие не скачались"""
+        if self.readonly:
+            self._reload_index()
+        with self._lock:
+            cached = sum(1 for u in self._urls.values() if u in self._index)
+            return {
+                "total": len(self._urls),
+                "cached": cached,
+                "pending": len(self._urls) - cached - len(self._failures),
+                "failed": dict(self._failures),
+                "cache_bytes": self._disk_bytes(),
+                "max_bytes": self.max_bytes,
+                "resize": HAS_PILLOW,
+            }
+
+    # ------------------------------------------------------------------
+    #   Загрузка
+    # ------------------------------------------------------------------
+
+    def _prefetch(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._worker = None     # следующий register() запустит новый поток
+                    break
+                url = self._queue.pop()
+            self._fetch(url)
+        self._save_index()
+        status = self.status()
+        print(f"Кеш картинок: {status['cached']}/{status['total']} готово, ошибок: {len(status['failed'])}")
+
+    def _fetch(self, url):
+        """Запись индекса для ссылки: из кеша или после скачивания. None — ошибка"""
+        with self._lock:
+            meta = self._index.get(url)
+            if meta is not None:
+                return meta
+            if url in self._failures:
+                return None
+            waiting = self._fetching.get(url)
+            if waiting is None:
+                self._fetching[url] = threading.Event()
+        if waiting is not None:
+            waiting.wait(FETCH_TIMEOUT * 2)
+            with self._lock:
+                return self._index.get(url)
+
+        try:
+            data, content_type = self._download(url)
+            data, content_type = self._resize(data, content_type)
+            if len(data) > self.max_bytes:
+                # Такой файл удалил бы сам себя первой же чисткой
+                raise ValueError("картинка больше всего кеша (image_cache_mb)")
+            name = hashlib.sha256(data).hexdigest()[:24] + _extension(content_type)
+            path = self._path(name)
+            if not os.path.exists(path):
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            meta = {"file": name, "size": len(data), "type": content_type, "used": time.time()}
+            with self._lock:
+                self._index[url] = meta
+                self._dirty = True
+            self._evict()
+            return meta
+        except Exception as e:
+            with self._lock:
+                self._failures[url] = str(e)
+            print(f"Не удалось скачать картинку {url}: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._fetching.pop(url).set()
+
+    @staticmethod
+    def _download(url):
+        request = urllib.request.Request(url, headers={"User-Agent": "RICASE image cache"})
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as resp:
+            content_type = resp.headers.get_content_type()
+            data = resp.read(MAX_DOWNLOAD_BYTES + 1)
+        if len(data) > MAX_DOWNLOAD_BYTES:
+            raise ValueError("картинка больше 10 МБ")
+        if not content_type.startswith("image/"):
+            raise ValueError(f"это не картинка ({content_type})")
+        if content_type in BLOCKED_TYPES:
+            raise ValueError(f"{content_type} не кешируется")
+        return data, content_type
+
+    def _resize(self, data, content_type):
+        """Уменьшает до плитки с сохранением пропорций (PNG с прозрачностью)"""
+        if not HAS_PILLOW or content_type == "image/gif":     # GIF — чтобы не потерять анимацию
+            return data, content_type
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as img:
+            if max(img.size) <= self.tile_size and content_type == "image/png":
+                return data, content_type
+            img = img.convert("RGBA")
+            img.thumbnail((self.tile_size, self.tile_size), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, "PNG", optimize=True)
+        return out.getvalue(), "image/png"
+
+    def _disk_bytes(self):
+        """
+        Размер кеша на диске (под self._lock). Одинаковые картинки по разным
+        ссылкам лежат одним файлом — он и считается один раз.
+        """
+        return sum({m["file"]: m["size"] for m in self._index.values()}.values())
+
+    def _evict(self):
+        """Удаляет давно не запрошенные картинки, пока кеш больше лимита"""
+        with self._lock:
+            total = self._disk_bytes()
+            if total <= self.max_bytes:
+                return
+            refs = {}                   # {файл: сколько ссылок на него}
+            for m in self._index.values():
+                refs[m["file"]] = refs.get(m["file"], 0) + 1
+            by_age = sorted(self._index.items(), key=lambda kv: kv[1]["used"])
+            removed = []
+            for url, meta in by_age:
+                if total <= self.max_bytes:
+                    break
+                del self._index[url]
+                refs[meta["file"]] -= 1
+                if not refs[meta["file"]]:
+                    # Последняя ссылка на файл — только теперь место освобождается
+                    total -= meta["size"]
+                    removed.append(meta["file"])
+            self._dirty = True
+        for name in removed:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+
+
+def _extension(content_type):
+    return {
+        "image/png": ".png",
+        "image/jpeg": ".jpg",
+        "image/gif": ".gif",
+        "image/webp": ".webp",
+    }.get(content_type, ".img")
@@ -0,0 +1,26 @@
+import threading
+
+# =============================================================================
+#   Блокировки по пользователям
+# =============================================================================
+#
+#   Открытие кейса — проверка кулдауна, выбор предмета, запись в инвентарь
+#   и запись кулдауна — должно идти целиком для одного зрителя, иначе два
+#   параллельных запроса оба проходят проверку кулдауна. Отдельная блокировка
+#   на каждого зрителя копилась бы бесконечно, поэтому ключи раскладываются
+#   хешем по фиксированному набору блокировок («полосам»): разные зрители
+#   почти всегда попадают в разные полосы и не ждут друг друга.
+
+
+class StripedLock:
+    """Фиксированный набор блокировок, ключ → блокировка по хешу"""
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __len__(self):
+        return len(self._locks)
+
+    def hold(self, key):
+        """Блокировка для ключа (использовать как `with locks.hold(key):`)"""
+        return self._locks[hash(key) % len(self._locks)]
@@ -0,0 +1,245 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+# =============================================================================
+#   Метрики сервера
+# =============================================================================
+#
+#   Счётчики, гистограммы и «снимаемые» показатели (значение вычисляется
+#   функцией в момент запроса /api/metrics). Запись — одно сложение под
+#   блокировкой, так что метрики можно держать включёнными всегда.
+#   Отдаются в текстовом формате Prometheus и в JSON.
+
+# Границы корзин по умолчанию, в секундах: от 0.5 мс до 10 с
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Растущий счётчик с метками. С rate_window (сек) дополнительно помнит
+    посекундные приращения за окно — для «в секунду» в JSON.
+    """
+    kind = "counter"
+
+    def __init__(self, name, help, rate_window=None):
+        self.name = name
+        self.help = help
+        self.rate_window = rate_window
+        self._lock = threading.Lock()
+        self._values = {}
+        self._seconds = {}          # {метки: deque([секунда, приращение])}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+            if self.rate_window:
+                now = int(time.monotonic())
+                buckets = self._seconds.setdefault(key, deque())
+                if buckets and buckets[-1][0] == now:
+                    buckets[-1][1] += amount
+                else:
+                    buckets.append([now, amount])
+                    while buckets[0][0] <= now - self.rate_window:
+                        buckets.popleft()
+
+    def rate(self, **labels):
+        """Среднее приращение в секунду за последние rate_window секунд"""
+        key = _label_key(labels)
+        with self._lock:
+            buckets = self._seconds.get(key)
+            if not buckets:
+                return 0.0
+            since = int(time.monotonic()) - self.rate_window
+            return sum(n for sec, n in buckets if sec > since) / self.rate_window
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def to_json(self):
+        with self._lock:
+            keys = list(self._values)
+        out = []
+        for key in keys:
+            entry = {"labels": dict(key), "value": self._values[key]}
+            if self.rate_window:
+                entry["per_sec"] = round(self.rate(**dict(key)), 2)
+            out.append(entry)
+        return out
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (как в Prometheus) и метками"""
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}           # {метки: [счётчики корзин..., сумма, количество]}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels):
+        """Контекстный менеджер: `with HIST.time(op="x"):` — наблюдает длительность блока"""
+        return _Timer(self, labels)
+
+    def _snapshot(self):
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def samples(self):
+        out = []
+        for key, series in self._snapshot().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                out.append((self.name + "_bucket", key, cumulative, (("le", _format_value(float(bound))),)))
+            out.append((self.name + "_bucket", key, series[-1], (("le", "+Inf"),)))
+            out.append((self.name + "_sum", key, series[-2]))
+            out.append((self.name + "_count", key, series[-1]))
+        return out
+
+    def to_json(self):
+        out = []
+        for key, series in self._snapshot().items():
+            count, total = series[-1], series[-2]
+            out.append({
+                "labels": dict(key),
+                "count": count,
+                "avg_ms": round(total / count * 1000, 3) if count else 0.0,
+                "p50_ms": self._quantile(series, 0.50),
+                "p95_ms": self._quantile(series, 0.95),
+                "p99_ms": self._quantile(series, 0.99),
+            })
+        return out
+
+    def _quantile(self, series, q):
+        """Оценка квантиля по корзинам (верхняя граница корзины), в мс; None — за пределами корзин"""
+        count = series[-1]
+        if not count:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        for bound, n in zip(self.buckets, series):
+            cumulative += n
+            if cumulative >= rank:
+                return round(bound * 1000, 3)
+        return None                 # выше последней корзины
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "started")
+
+    def __init__(self, hist, labels):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Gauge:
+    """
+    Показатель, который вычисляется при запросе метрик:
+    fn() возвращает число или список ({метки}, значение).
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def _values(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"Ошибка метрики {self.name}: {e}")
+            return []
+        if isinstance(value, (int, float)):
+            return [({}, value)]
+        return value
+
+    def samples(self):
+        return [(self.name, _label_key(labels), value) for labels, value in self._values()]
+
+    def to_json(self):
+        return [{"labels": labels, "value": value} for labels, value in self._values()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, rate_window=None):
+        return self.register(Counter(name, help, rate_window))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, buckets))
+
+    def gauge(self, name, help, fn, kind="gauge"):
+        gauge = Gauge(name, help, fn)
+        gauge.kind = kind           # счётчики, которые ведёт чужой код, — тоже через функцию
+        return self.register(gauge)
+
+    def render_prometheus(self):
+        """Текстовый формат Prometheus 0.0.4"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample in metric.samples():
+                name, key, value = sample[:3]
+                extra = sample[3] if len(sample) > 3 else ()
+                lines.append(f"{name}{_format_labels(key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def render_json(self):
+        return {metric.name: metric.to_json() for metric in self._metrics}
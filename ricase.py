@@ -0,0 +1,191 @@
+"""
+Запуск RICASE из командной строки.
+
+    python -m ricase serve [--config settings.json] [--data-dir DIR]
+                           [--host 0.0.0.0] [--port 5000] [--channel имя]
+                           [--workers N]
+    python -m ricase gui
+    python -m ricase simulate [--config settings.json] [--viewers 10000]
+
+serve — только сервер и слушатель чата, без окна настроек: tkinter не
+импортируется, браузер не открывается, дисплей не нужен. Подходит для
+systemd / supervisor / docker. Каждый флаг можно задать переменной
+окружения: RICASE_CONFIG, RICASE_DATA_DIR, RICASE_HOST, RICASE_PORT,
+RICASE_CHANNEL, RICASE_WORKERS (флаг важнее переменной). По SIGHUP сервер
+перечитывает settings.json на ходу.
+
+--workers N — N процессов отвечают на HTTP на одном порту (waitress, если
+установлен), очередь и кулдауны у них общие в shared.db. Главный процесс
+слушает чат и пишет в него. --workers 0 — только чат, а HTTP отдаёт внешний
+WSGI-сервер: gunicorn -w 4 wsgi:application.
+
+simulate — сколько открытий нужно зрителю, чтобы собрать каждую редкость
+и всю коллекцию при шансах из settings.json (то же, что кнопка на вкладке
+«Редкости»).
+"""
+import time
+
+STARTED = time.perf_counter()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import signal  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+
+
+def serve(args):
+    # Путь к настройкам — до смены папки, файлы данных — в --data-dir
+    if args.config:
+        os.environ["RICASE_CONFIG"] = os.path.abspath(args.config)
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        os.chdir(args.data_dir)
+    if args.workers is not None:
+        os.environ["RICASE_SHARED_ROLE"] = "master"
+
+    import app as server
+
+    if args.channel and server.normalize_channel(args.channel) != server.primary_channel.name:
+        data = dict(server.settings)
+        data["channel"] = args.channel
+        server.set_settings(data)       # только на этот запуск, в файл не пишется
+
+    loaded_ms = (time.perf_counter() - STARTED) * 1000
+    print(f"Загрузка: {loaded_ms:.0f} мс (tkinter {'загружен' if 'tkinter' in sys.modules else 'не загружен'})")
+
+    first_request = []
+
+    @server.app.after_request
+    def report_first_request(response):
+        if not first_request:
+            first_request.append(True)
+            print(f"Первый запрос обслужен через {(time.perf_counter() - STARTED) * 1000:.0f} мс после старта")
+        return response
+
+    # systemd и docker останавливают процесс через SIGTERM — выходим штатно,
+    # чтобы atexit сбросил на диск накопленные дропы и кулдауны
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # SIGHUP (systemctl reload, kill -HUP) — перечитать settings.json без
+    # перезапуска: очередь, кулдауны и подключение к чату остаются
+    def reload_settings():
+        data = server.load_settings()
+        if args.channel:
+            data["channel"] = args.channel
+        server.set_settings(data)
+        print(f"Настройки перечитаны (версия {server.settings_version})")
+
+    if hasattr(signal, "SIGHUP"):       # на Windows сигнала нет
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=reload_settings).start())
+
+    if args.workers is not None:
+        return serve_workers(server, args)
+    try:
+        server.run_server(host=args.host, port=args.port, open_browser=False)
+    except Exception:
+        return 1
+    return 0
+
+
+def serve_workers(server, args):
+    """Главный процесс --workers: сокет, слушатель чата и процессы-обработчики"""
+    import multiprocessing
+    import socket
+
+    sock = socket.create_server((args.host, args.port), backlog=1024) if args.workers else None
+    server.run_shared_master()
+    # spawn, а не fork: в главном процессе уже работают потоки, и так же на Windows
+    ctx = multiprocessing.get_context("spawn")
+
+    def start(index):
+        proc = ctx.Process(target=worker_main, args=(sock, index), name=f"ricase-worker-{index}", daemon=True)
+        proc.start()
+        return proc
+
+    procs = [start(i) for i in range(args.workers)]
+    if args.workers:
+        engine = "waitress" if server.HAS_WAITRESS else "werkzeug (pip install waitress)"
+        print(f"\nСервер запущен → http://127.0.0.1:{args.port}/ (обработчиков: {args.workers}, {engine})")
+    else:
+        print("\nБез обработчиков: только чат, HTTP отдаёт внешний сервер (wsgi:application)")
+
+    while True:
+        time.sleep(1)
+        for i, proc in enumerate(procs):
+            if not proc.is_alive():
+                print(f"Обработчик {i} завершился (код {proc.exitcode}) → перезапуск")
+                procs[i] = start(i)
+
+
+def worker_main(sock, index):
+    """Процесс-обработчик: состояние из shared.db, HTTP на общем сокете"""
+    os.environ["RICASE_SHARED_ROLE"] = "worker"
+    import app as server
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    server.serve_worker(sock)
+
+
+def gui(args):
+    import app as server
+    server.App()
+    return 0
+
+
+def simulate(args):
+    import json
+
+    from simulator import simulate as run
+
+    with open(args.config or "settings.json", "r", encoding="utf-8") as f:
+        data = json.load(f)
+    result = run(data, viewers=args.viewers, cooldown_seconds=args.cooldown)
+
+    print(f"зрителей: {result['viewers']}, открытий: {result['opens_simulated']}, "
+          f"{result['seconds']:.1f} с ({result['engine']})")
+    print(f"{'редкость':<16}{'шанс %':>8}{'предм.':>8}{'среднее':>10}{'p50':>8}{'p90':>8}{'p99':>8}{'не собр. %':>12}")
+    total_items = sum(row["items"] for row in result["rarities"])
+    rows = result["rarities"] + [{"name": "вся коллекция", "chance_pct": 100.0, "items": total_items,
+                                  **result["full_set"]}]
+    for row in rows:
+        cells = ["—" if row[k] is None else row[k] for k in ("mean", "p50", "p90", "p99")]
+        print(f"{row['name']:<16}{row['chance_pct']:>8.2f}{row['items']:>8}"
+              f"{cells[0]:>10}{cells[1]:>8}{cells[2]:>8}{cells[3]:>8}{row['incomplete_pct']:>12.1f}")
+    if result["unreachable"]:
+        print("не выпадут никогда (шанс 0): " + ", ".join(result["unreachable"]))
+    for d in result["duplicates"]:
+        print(f"повторов среди первых {d['opens']} открытий: {d['rate_pct']:.1f}%")
+    return 0
+
+
+def main(argv=None):
+    env = os.environ.get
+    parser = argparse.ArgumentParser(prog="python -m ricase", description=__doc__.splitlines()[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="сервер без окна настроек")
+    p.add_argument("--config", default=env("RICASE_CONFIG"), help="файл настроек (settings.json)")
+    p.add_argument("--data-dir", default=env("RICASE_DATA_DIR"), help="папка для инвентаря, кулдаунов и кеша")
+    p.add_argument("--host", default=env("RICASE_HOST", "0.0.0.0"))
+    p.add_argument("--port", type=int, default=int(env("RICASE_PORT", "5000")))
+    p.add_argument("--channel", default=env("RICASE_CHANNEL"), help="основной канал вместо указанного в настройках")
+    p.add_argument("--workers", type=int, default=env("RICASE_WORKERS"),
+                   help="процессов-обработчиков HTTP с общим состоянием в shared.db (0 — только чат)")
+    p.set_defaults(func=serve)
+
+    p = sub.add_parser("gui", help="окно настроек (как app.py)")
+    p.set_defaults(func=gui)
+
+    p = sub.add_parser("simulate", help="симуляция сбора коллекции")
+    p.add_argument("--config", default=env("RICASE_CONFIG"), help="файл настроек (settings.json)")
+    p.add_argument("--viewers", type=int, default=None, help="сколько зрителей моделировать")
+    p.add_argument("--cooldown", type=int, default=3600, help="кулдаун, сек (для перевода в часы)")
+    p.set_defaults(func=simulate)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
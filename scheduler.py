@@ -0,0 +1,71 @@
+import heapq
+import itertools
+import threading
+import time
+
+# =============================================================================
+#   Отложенные задания
+# =============================================================================
+#
+#   Куча по времени срабатывания и один фоновый поток, который спит до
+#   ближайшего срока. Всё, что созрело почти одновременно (в пределах
+#   batch_window), отдаётся обработчику одним списком — так результаты
+#   пачки кейсов уходят в чат вместе.
+
+
+class DelayQueue:
+    def __init__(self, handler, batch_window=0.5, name="delay-queue"):
+        self.handler = handler          # handler([item, ...]) — вызывается в фоновом потоке
+        self.batch_window = batch_window
+        self.name = name
+
+        self._heap = []                 # [(срок по monotonic, номер, item)]
+        self._seq = itertools.count()   # при равных сроках — в порядке постановки
+        self._cond = threading.Condition()
+        self._thread = None
+
+        self.fired = 0
+        self.batches = 0
+        self.max_late_ms = 0.0
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap)
+
+    def put(self, delay, item):
+        """Отдать item обработчику через delay секунд"""
+        due = time.monotonic() + max(0.0, delay)
+        with self._cond:
+            heapq.heappush(self._heap, (due, next(self._seq), item))
+            self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            return {
+                "pending": len(self._heap),
+                "next_in_sec": round(max(0.0, self._heap[0][0] - now), 3) if self._heap else None,
+                "fired": self.fired,
+                "batches": self.batches,
+                "max_late_ms": round(self.max_late_ms, 1),
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(timeout=self._heap[0][0] - time.monotonic() if self._heap else None)
+                now = time.monotonic()
+                self.max_late_ms = max(self.max_late_ms, (now - self._heap[0][0]) * 1000)
+                batch = []
+                while self._heap and self._heap[0][0] <= now + self.batch_window:
+                    batch.append(heapq.heappop(self._heap)[2])
+                self.fired += len(batch)
+                self.batches += 1
+            try:
+                self.handler(batch)
+            except Exception as e:
+                print(f"Ошибка отложенного задания ({self.name}): {e}")
@@ -0,0 +1,439 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dropstats import DropStats
+
+# =============================================================================
+#   Общее состояние для нескольких процессов (python -m ricase serve --workers N)
+# =============================================================================
+#
+#   В обычном режиме очередь и кулдауны живут в памяти одного процесса.
+#   С несколькими процессами-обработчиками HTTP всё, что они должны видеть
+#   одинаково, лежит в одной SQLite (shared.db, журнал WAL):
+#
+#     queue     — очередь !open (номера событий для SSE — AUTOINCREMENT);
+#     cooldowns — время последнего открытия, проверка и запись одним UPSERT;
+#     cooldown_log — каждая запись кулдауна (триггером), главный процесс
+#                 дописывает их в cooldowns.journal канала — так обычный
+#                 режим после --workers видит те же кулдауны;
+#     outbox    — строки для чата: пишут обработчики, отправляет главный процесс;
+#     drops     — выпадения для статистики дропа, их забирает главный процесс;
+#     meta      — текущие настройки и их версия.
+#
+#   Главный процесс слушает чат и отправляет сообщения, обработчики только
+#   отвечают на HTTP. Инвентарь у каждого канала и так в своей SQLite —
+#   в этом режиме он пишется сразу, без кеша в памяти (SharedSqliteInventoryStore).
+#   Изменения других процессов замечаются опросом PRAGMA data_version —
+#   дешёвый вызов без чтения таблиц.
+
+ROLE_MASTER = "master"
+ROLE_WORKER = "worker"
+WATCH_INTERVAL = 0.1            # сек между проверками data_version
+PUMP_INTERVAL = 0.2             # сек между выборками outbox и drops в главном процессе
+COOLDOWN_PURGE_INTERVAL = 60    # сек между удалениями истёкших кулдаунов
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS queue (
+        id        INTEGER PRIMARY KEY AUTOINCREMENT,
+        scope     TEXT NOT NULL,
+        key       TEXT NOT NULL,
+        username  TEXT NOT NULL,
+        user_id   TEXT,
+        queued_at REAL NOT NULL,
+        UNIQUE (scope, key)
+    );
+    CREATE TABLE IF NOT EXISTS cooldowns (
+        scope TEXT NOT NULL,
+        key   TEXT NOT NULL,
+        ts    REAL NOT NULL,
+        PRIMARY KEY (scope, key)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS cooldown_log (
+        id    INTEGER PRIMARY KEY,
+        scope TEXT NOT NULL,
+        key   TEXT NOT NULL,
+        ts    REAL NOT NULL
+    );
+    CREATE TRIGGER IF NOT EXISTS cooldowns_logged_insert AFTER INSERT ON cooldowns BEGIN
+        INSERT INTO cooldown_log (scope, key, ts) VALUES (NEW.scope, NEW.key, NEW.ts);
+    END;
+    CREATE TRIGGER IF NOT EXISTS cooldowns_logged_update AFTER UPDATE OF ts ON cooldowns BEGIN
+        INSERT INTO cooldown_log (scope, key, ts) VALUES (NEW.scope, NEW.key, NEW.ts);
+    END;
+    CREATE TABLE IF NOT EXISTS outbox (
+        id      INTEGER PRIMARY KEY,
+        channel TEXT NOT NULL,
+        text    TEXT NOT NULL,
+        due     REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS drops (
+        id        INTEGER PRIMARY KEY,
+        scope     TEXT NOT NULL,
+        rarity    TEXT NOT NULL,
+        item      TEXT NOT NULL,
+        duplicate INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key   TEXT PRIMARY KEY,
+        value TEXT
+    );
+"""
+
+
+class SharedDb:
+    """Соединение процесса с shared.db и фоновый поток, замечающий чужие изменения"""
+
+    def __init__(self, path, role):
+        self.path = path
+        self.role = role
+        self._lock = threading.Lock()
+        # timeout — сколько ждать, пока другой процесс держит запись
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._listeners = []
+        self._watcher = None
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def write(self, sql, params=()):
+        """Одна команда записи; возвращает число изменённых строк"""
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def transaction(self, fn):
+        """fn(conn) внутри BEGIN IMMEDIATE — запись без гонок с другими процессами"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ------------------------------------------------------------------
+    #   Настройки и номера событий
+    # ------------------------------------------------------------------
+
+    def start_event_ids(self):
+        """
+        Номера событий очереди растут и между перезапусками, и после
+        удаления shared.db: не меньше текущего времени в мс (как у AdmissionQueue).
+        """
+        now_ms = int(time.time() * 1000)
+
+        def bump(conn):
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'queue'").fetchone()
+            if row is None:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('queue', ?)", (now_ms,))
+            elif row[0] < now_ms:
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'queue'", (now_ms,))
+
+        self.transaction(bump)
+
+    def publish_settings(self, data, version):
+        """Главный процесс кладёт действующие настройки — обработчики их подхватят"""
+        text = json.dumps(data, ensure_ascii=False)
+        self.transaction(lambda conn: conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [("settings", text), ("settings_version", str(version))]
+        ))
+
+    def settings_version(self):
+        rows = self.execute("SELECT value FROM meta WHERE key = 'settings_version'")
+        return int(rows[0][0]) if rows else 0
+
+    def settings(self):
+        """(версия, настройки) из meta или (0, None), если главный процесс их ещё не положил"""
+        rows = dict(self.execute("SELECT key, value FROM meta WHERE key IN ('settings', 'settings_version')"))
+        if "settings" not in rows:
+            return 0, None
+        return int(rows.get("settings_version", 0)), json.loads(rows["settings"])
+
+    # ------------------------------------------------------------------
+    #   Чат и статистика: обработчики пишут, главный процесс забирает
+    # ------------------------------------------------------------------
+
+    def post_chat(self, channel, text, delay=0.0):
+        self.write("INSERT INTO outbox (channel, text, due) VALUES (?, ?, ?)", (channel, text, time.time() + delay))
+
+    def take_chat(self):
+        """[(канал, текст, срок)] — всё, что накопилось, с удалением"""
+        return self.execute("DELETE FROM outbox RETURNING channel, text, due")
+
+    def record_drop(self, scope, rarity, item, duplicate):
+        self.write("INSERT INTO drops (scope, rarity, item, duplicate) VALUES (?, ?, ?, ?)",
+                   (scope, rarity, item, int(duplicate)))
+
+    def take_drops(self):
+        return self.execute("DELETE FROM drops RETURNING scope, rarity, item, duplicate")
+
+    def take_cooldowns(self):
+        """[(канал, ключ, время)] — записи кулдаунов с прошлого вызова (0 — кулдаун снят)"""
+        return self.execute("DELETE FROM cooldown_log RETURNING scope, key, ts")
+
+    # ------------------------------------------------------------------
+    #   Изменения от других процессов
+    # ------------------------------------------------------------------
+
+    def on_change(self, callback):
+        """callback() вызывается из фонового потока, когда базу изменил другой процесс"""
+        self._listeners.append(callback)
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="shared-watch", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        version = None
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            try:
+                current = self.execute("PRAGMA data_version")[0][0]
+            except sqlite3.Error as e:
+                print(f"Ошибка опроса shared.db: {e}")
+                continue
+            if current == version:
+                continue
+            version = current
+            for callback in list(self._listeners):
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Ошибка обработки изменений shared.db: {e}")
+
+
+class SharedAdmissionQueue:
+    """
+    Та же очередь допуска, что AdmissionQueue, но в shared.db: зрителей
+    ставит главный процесс (слушатель чата), а забирают обработчики.
+    Счётчики admitted/duplicates/overflowed ведёт процесс, который ставит,
+    completed и время ожидания — тот, что открывает кейс.
+    """
+
+    def __init__(self, db, scope, max_depth=500, overflow="drop"):
+        self.db = db
+        self.scope = scope              # "" — основной канал, иначе папка канала
+        self.max_depth = max_depth
+        self.overflow = overflow
+        self.cond = threading.Condition()
+        self._last_seen = 0
+
+        self.admitted = 0
+        self.duplicates = 0
+        self.overflowed = 0
+        self.completed = 0
+        self._wait_total = 0.0
+        self.max_wait = 0.0
+        db.on_change(self._changed)
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM queue WHERE scope = ?", (self.scope,))[0][0]
+
+    @property
+    def last_event_id(self):
+        row = self.db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'queue'")
+        return row[0][0] if row else 0
+
+    def admit(self, key, username, user_id=None):
+        def insert(conn):
+            if conn.execute("SELECT 1 FROM queue WHERE scope = ? AND key = ?", (self.scope, key)).fetchone():
+                return None, "duplicate"
+            depth = conn.execute("SELECT COUNT(*) FROM queue WHERE scope = ?", (self.scope,)).fetchone()[0]
+            if depth >= self.max_depth:
+                return None, "overflow"
+            now = time.time()
+            cur = conn.execute(
+                "INSERT INTO queue (scope, key, username, user_id, queued_at) VALUES (?, ?, ?, ?, ?)",
+                (self.scope, key, username, user_id, now)
+            )
+            return {"id": cur.lastrowid, "username": username, "user_id": user_id,
+                    "key": key, "queued_at": now}, None
+
+        entry, reason = self.db.transaction(insert)
+        if reason == "duplicate":
+            self.duplicates += 1
+        elif reason == "overflow":
+            self.overflowed += 1
+        else:
+            self.admitted += 1
+        return entry, reason
+
+    def notify(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    def _changed(self):
+        # Будим потоки SSE, только если появились новые зрители
+        last = self.last_event_id
+        if last != self._last_seen:
+            self._last_seen = last
+            self.notify()
+
+    def since(self, last_id):
+        rows = self.db.execute(
+            "SELECT id, username, user_id FROM queue WHERE scope = ? AND id > ? ORDER BY id",
+            (self.scope, last_id)
+        )
+        return [{"id": i, "username": u, "user_id": uid} for i, u, uid in rows]
+
+    def pop_next(self):
+        def pop(conn):
+            row = conn.execute(
+                "SELECT id, username, user_id FROM queue WHERE scope = ? ORDER BY id LIMIT 1", (self.scope,)
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM queue WHERE id = ?", (row[0],))
+            return row
+
+        row = self.db.transaction(pop)
+        return {"id": row[0], "username": row[1], "user_id": row[2]} if row else None
+
+    def complete(self, key):
+        rows = self.db.execute(
+            "DELETE FROM queue WHERE scope = ? AND key = ? RETURNING queued_at", (self.scope, key)
+        )
+        if not rows:
+            return
+        wait = time.time() - rows[0][0]
+        self.completed += 1
+        self._wait_total += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self):
+        depth, oldest = self.db.execute(
+            "SELECT COUNT(*), MIN(queued_at) FROM queue WHERE scope = ?", (self.scope,)
+        )[0]
+        return {
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "overflow_policy": self.overflow,
+            "admitted": self.admitted,
+            "duplicates": self.duplicates,
+            "overflowed": self.overflowed,
+            "completed": self.completed,
+            "oldest_wait_sec": round(time.time() - oldest, 1) if oldest else 0.0,
+            "avg_wait_sec": round(self._wait_total / self.completed, 1) if self.completed else 0.0,
+            "max_wait_sec": round(self.max_wait, 1),
+        }
+
+
+class SharedCooldowns:
+    """Кулдауны канала в shared.db — с тем же интерфейсом, что CooldownTable"""
+
+    def __init__(self, db, scope, ttl_seconds):
+        self.db = db
+        self.scope = scope
+        self.ttl = ttl_seconds
+
+    def __len__(self):
+        return self.db.execute(
+            "SELECT COUNT(*) FROM cooldowns WHERE scope = ? AND ts > ?", (self.scope, time.time() - self.ttl)
+        )[0][0]
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        rows = self.db.execute("SELECT ts FROM cooldowns WHERE scope = ? AND key = ?", (self.scope, key))
+        return rows[0][0] if rows and rows[0][0] + self.ttl > now else None
+
+    def claim(self, key, timestamp):
+        """
+        Проверка и запись кулдауна одной командой: True — кулдаун прошёл и
+        время открытия записано. Два процесса не откроют кейс одному зрителю
+        дважды: SQLite выполняет UPSERT целиком под блокировкой записи.
+        """
+        return self.db.write(
+            "INSERT INTO cooldowns (scope, key, ts) VALUES (?, ?, ?) "
+            "ON CONFLICT (scope, key) DO UPDATE SET ts = excluded.ts WHERE cooldowns.ts <= ?",
+            (self.scope, key, timestamp, timestamp - self.ttl)
+        ) > 0
+
+    def set(self, key, timestamp):
+        self.db.write(
+            "INSERT OR REPLACE INTO cooldowns (scope, key, ts) VALUES (?, ?, ?)", (self.scope, key, timestamp)
+        )
+
+    def release(self, key):
+        """Снимает только что занятый кулдаун (открытие сорвалось)"""
+        def delete(conn):
+            conn.execute("DELETE FROM cooldowns WHERE scope = ? AND key = ?", (self.scope, key))
+            conn.execute("INSERT INTO cooldown_log (scope, key, ts) VALUES (?, ?, 0)", (self.scope, key))
+
+        self.db.transaction(delete)
+
+    def load(self, state, now=None):
+        """Переносит {ключ: время} (из журнала обычного режима), не затирая более новые"""
+        cutoff = (time.time() if now is None else now) - self.ttl
+        rows = [(self.scope, k, float(v)) for k, v in state.items() if v > cutoff]
+
+        def merge(conn):
+            conn.executemany(
+                "INSERT INTO cooldowns (scope, key, ts) VALUES (?, ?, ?) "
+                "ON CONFLICT (scope, key) DO UPDATE SET ts = MAX(ts, excluded.ts)", rows
+            )
+            # Эти записи и так пришли из журнала — обратно в него не пишем
+            conn.execute("DELETE FROM cooldown_log WHERE scope = ?", (self.scope,))
+
+        self.db.transaction(merge)
+
+    def snapshot(self):
+        return dict(self.db.execute(
+            "SELECT key, ts FROM cooldowns WHERE scope = ? AND ts > ?", (self.scope, time.time() - self.ttl)
+        ))
+
+    def purge(self):
+        """Удаляет истёкшие записи; возвращает сколько"""
+        return self.db.write(
+            "DELETE FROM cooldowns WHERE scope = ? AND ts <= ?", (self.scope, time.time() - self.ttl)
+        )
+
+    def clear(self):
+        self.db.write("DELETE FROM cooldowns WHERE scope = ?", (self.scope,))
+
+    def stats(self):
+        return {"entries": len(self), "expired": 0}
+
+
+class SharedDropStats:
+    """
+    Статистика дропа в обработчике. Выпадения уходят в shared.db, считает
+    их DropStats главного процесса; отчёт читается из drop_stats.json,
+    который тот пишет раз в интервал (отставание — до секунды-двух).
+    """
+
+    def __init__(self, db, scope, path):
+        self.db = db
+        self.scope = scope
+        self.path = path
+        self._lock = threading.Lock()
+        self._view = None
+        self._mtime = None
+        self._config = None
+
+    def configure(self, chances, rarities, items):
+        with self._lock:
+            self._config = (chances, rarities, items)
+            self._view = None
+
+    def record(self, rarity_key, item_name, duplicate):
+        self.db.record_drop(self.scope, rarity_key, item_name, duplicate)
+
+    def close(self):
+        pass
+
+    def report(self, window="all"):
+        with self._lock:
+            mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+            if self._view is None or mtime != self._mtime:
+                self._view = DropStats(self.path)
+                if self._config:
+                    self._view.configure(*self._config)
+                self._mtime = mtime
+            return self._view.report(window)
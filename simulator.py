@@ -0,0 +1,202 @@
+import importlib.util
+import random
+import time
+
+from droptable import DropTable
+
+# NumPy не обязателен: без него симуляция идёт обычным циклом на меньшем
+# числе зрителей. Импортируется при первом запуске, а не при старте сервера
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+# =============================================================================
+#   Симуляция сбора коллекции
+# =============================================================================
+#
+#   Прогоняет много «зрителей» через ту же таблицу дропа, что и /api/open:
+#   редкость выбирается алиас-таблицей DropTable, а предмет — случайный
+#   из тех, которых у зрителя ещё нет (повтор — только когда редкость
+#   собрана целиком). Предметы одной редкости для этого правила равноправны,
+#   поэтому состояние зрителя — сколько предметов каждой редкости уже есть.
+#
+#   С NumPy все зрители делают очередное открытие одной векторной операцией:
+#   10 000 зрителей × тысячи открытий — миллионы открытий за секунды.
+
+DEFAULT_VIEWERS = 10000
+PYTHON_VIEWERS = 2000               # без NumPy — столько, чтобы уложиться в секунду-другую
+DEFAULT_MAX_OPENS = 20000           # дальше считаем «не собрал»
+DEFAULT_TIME_LIMIT = 10.0           # сек — GUI не должен ждать дольше
+DUPLICATE_MILESTONES = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+PERCENTILES = (50, 90, 99)
+
+
+def simulate(settings, viewers=None, max_opens=DEFAULT_MAX_OPENS, time_limit=DEFAULT_TIME_LIMIT,
+             cooldown_seconds=3600, seed=None):
+    """
+    Сколько открытий (и часов при открытии раз в кулдаун) нужно, чтобы собрать
+    каждую редкость и всю коллекцию; доля повторов по ходу сбора.
+    settings — словарь с "rarities" и "items", как в settings.json.
+    """
+    table = DropTable(settings)
+    rarities = settings.get("rarities", {})
+    keys = list(table.rarity_chances)
+    sizes = [len(table.items_by_rarity[k]) for k in keys]
+    unreachable = sorted(
+        {it.get("rarity") for it in table.all_items} - set(keys),
+        key=lambda k: str(k),
+    )
+
+    use_numpy = HAS_NUMPY
+    if viewers is None:
+        viewers = DEFAULT_VIEWERS if use_numpy else PYTHON_VIEWERS
+
+    started = time.perf_counter()
+    if not keys:
+        complete_at, duplicates, steps = [[] for _ in keys], [], 0
+        full_at = []
+    elif use_numpy:
+        complete_at, full_at, duplicates, steps = _run_numpy(
+            table, keys, sizes, viewers, max_opens, time_limit, seed)
+    else:
+        complete_at, full_at, duplicates, steps, viewers = _run_python(
+            table, keys, sizes, viewers, max_opens, time_limit, seed)
+    elapsed = time.perf_counter() - started
+
+    hours_per_open = cooldown_seconds / 3600
+    rows = []
+    for i, key in enumerate(keys):
+        rows.append({
+            "key": key,
+            "name": rarities.get(key, {}).get("name", key),
+            "items": sizes[i],
+            "chance_pct": round(table.rarity_chances[key] / sum(table.rarity_chances.values()) * 100, 4),
+            **_distribution(complete_at[i], viewers, hours_per_open),
+        })
+
+    return {
+        "engine": "numpy" if use_numpy else "python",
+        "viewers": viewers,
+        "opens_simulated": viewers * steps,
+        "steps": steps,
+        "seconds": round(elapsed, 3),
+        "hours_per_open": hours_per_open,
+        "rarities": rows,
+        "full_set": _distribution(full_at, viewers, hours_per_open),
+        "unreachable": [rarities.get(k, {}).get("name", k) for k in unreachable],
+        "duplicates": [
+            {"opens": m, "rate_pct": round(sum(duplicates[:m]) / (m * viewers) * 100, 2),
+             "at_open_pct": round(duplicates[m - 1] / viewers * 100, 2)}
+            for m in DUPLICATE_MILESTONES if m <= len(duplicates)
+        ],
+    }
+
+
+def _distribution(done_at, viewers, hours_per_open):
+    """Среднее и хвосты числа открытий; не успевшие собрать — отдельно"""
+    done = sorted(done_at)
+    result = {"incomplete_pct": round((viewers - len(done)) / viewers * 100, 2) if viewers else 0.0}
+    if not done:
+        result.update(mean=None, max=None, hours_mean=None, **{f"p{p}": None for p in PERCENTILES})
+        return result
+    # Перцентили — среди всех зрителей: если больше p% не собрали, перцентиля нет
+    for p in PERCENTILES:
+        rank = int(p / 100 * viewers)
+        result[f"p{p}"] = done[rank] if rank < len(done) else None
+    mean = sum(done) / len(done)
+    result.update(mean=round(mean, 1), max=done[-1], hours_mean=round(mean * hours_per_open, 1))
+    result["hours_p90"] = None if result["p90"] is None else round(result["p90"] * hours_per_open, 1)
+    return result
+
+
+def _run_numpy(table, keys, sizes, viewers, max_opens, time_limit, seed):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    alias = table.rarity_alias
+    position = {k: i for i, k in enumerate(keys)}
+    prob = np.array(alias.prob)
+    alias_idx = np.array([position[alias.keys[j]] for j in alias.alias], dtype=np.intp)
+    key_idx = np.array([position[k] for k in alias.keys], dtype=np.intp)
+    size = np.array(sizes, dtype=np.int32)
+    n, r_count = len(alias.keys), len(keys)
+
+    owned = np.zeros((viewers, r_count), dtype=np.int32)
+    complete_at = np.zeros((viewers, r_count), dtype=np.int64)    # 0 — ещё не собрана
+    complete_count = np.zeros(viewers, dtype=np.int32)
+    full_at = np.zeros(viewers, dtype=np.int64)
+    rows = np.arange(viewers)
+    duplicates = []
+
+    deadline = time.perf_counter() + time_limit
+    step = 0
+    while step < max_opens:
+        step += 1
+        # Тот же выбор, что AliasTable.sample: индекс столбца + монетка
+        col = (rng.random(viewers) * n).astype(np.intp)
+        r = np.where(rng.random(viewers) < prob[col], key_idx[col], alias_idx[col])
+
+        cur = owned[rows, r]
+        new = cur < size[r]
+        owned[rows, r] = cur + new
+        duplicates.append(int(viewers - new.sum()))
+
+        finished = new & (cur + 1 == size[r])
+        if finished.any():
+            who = rows[finished]
+            complete_at[who, r[finished]] = step
+            complete_count[who] += 1
+            full = who[complete_count[who] == r_count]
+            full_at[full] = step
+            if (complete_count == r_count).all():
+                break
+        if step % 64 == 0 and time.perf_counter() > deadline:
+            break
+
+    return (
+        [complete_at[:, i][complete_at[:, i] > 0].tolist() for i in range(r_count)],
+        full_at[full_at > 0].tolist(),
+        duplicates,
+        step,
+    )
+
+
+def _run_python(table, keys, sizes, viewers, max_opens, time_limit, seed):
+    rng = random.Random(seed)
+    position = {k: i for i, k in enumerate(keys)}
+    r_count = len(keys)
+    complete_at = [[] for _ in keys]
+    full_at = []
+    duplicates = [0] * max_opens
+    steps = simulated = 0
+
+    deadline = time.perf_counter() + time_limit
+    for _ in range(viewers):
+        owned = [0] * r_count
+        left = r_count
+        step = 0
+        while left and step < max_opens:
+            step += 1
+            i = position[table.rarity_alias.sample(rng)]
+            if owned[i] < sizes[i]:
+                owned[i] += 1
+                if owned[i] == sizes[i]:
+                    complete_at[i].append(step)
+                    left -= 1
+            else:
+                duplicates[step - 1] += 1
+        if not left:
+            full_at.append(step)
+        steps = max(steps, step)
+        simulated += 1
+        if time.perf_counter() > deadline:
+            break
+
+    # Собравшие всё дальше получают только повторы
+    finished = 0
+    by_step = {}
+    for step in full_at:
+        by_step[step] = by_step.get(step, 0) + 1
+    for s in range(steps):
+        duplicates[s] += finished
+        finished += by_step.get(s + 1, 0)
+
+    return complete_at, full_at, duplicates[:steps], steps, simulated
@@ -0,0 +1,810 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# =============================================================================
+#   Хранилища инвентаря
+# =============================================================================
+#
+#   Хранилище отвечает на два вопроса: какие предметы уже есть у зрителя
+#   и «запиши новый дроп». Сейчас есть две реализации:
+#     • SqliteInventoryStore — по умолчанию, SQLite в режиме WAL,
+#       стоимость одного открытия не зависит от количества зрителей;
+#     • JsonInventoryStore  — старый формат inventory.json целиком в памяти.
+#   Выбирается ключом "storage" в settings.json ("sqlite" / "json").
+#
+#   Запись отложенная: открытие кейса меняет только память, а на диск
+#   изменения пачками сбрасывает фоновый поток WriteBehind — раз в секунду,
+#   сразу при большом числе изменений и при выходе из программы.
+#
+#   Маски владения недавних зрителей держатся в памяти (MaskCache), но не
+#   больше MASK_CACHE_USERS: на большом канале за месяц !open пишут сотни
+#   тысяч человек, а кейсы подряд открывают одни и те же.
+
+MASK_CACHE_USERS = 20000        # зрителей, чьи маски владения помним
+
+
+# =============================================================================
+#   Отложенная запись
+# =============================================================================
+
+class WriteBehind:
+    """
+    Фоновый поток, который сбрасывает накопленные изменения хранилищ на диск.
+    Хранилище (sink) — любой объект с методом flush(); оно само решает,
+    что у него накопилось, и вызывает poke(), если пора сбросить раньше срока.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._sinks = []
+        self._cond = threading.Condition()
+        self._poked = False
+        self._thread = None
+        self._flush_lock = threading.Lock()     # фоновый сброс и flush() при выходе не пересекаются
+
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def add(self, sink):
+        with self._cond:
+            self._sinks.append(sink)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def remove(self, sink):
+        with self._cond:
+            if sink in self._sinks:
+                self._sinks.remove(sink)
+
+    def poke(self):
+        """Просит сбросить изменения сейчас, не дожидаясь интервала"""
+        with self._cond:
+            self._poked = True
+            self._cond.notify_all()
+
+    def flush(self):
+        """Синхронно сбрасывает всё накопленное (при выходе и перед чтением с диска)"""
+        with self._cond:
+            sinks = list(self._sinks)
+        with self._flush_lock:
+            started = time.perf_counter()
+            for sink in sinks:
+                try:
+                    sink.flush()
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Ошибка записи на диск ({type(sink).__name__}): {e}")
+            ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.last_flush_ms = ms
+            self.max_flush_ms = max(self.max_flush_ms, ms)
+
+    def stats(self):
+        return {
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._poked:
+                    self._cond.wait(timeout=self.interval)
+                self._poked = False
+            self.flush()
+
+
+def atomic_write_text(path, text):
+    """
+    Записывает файл целиком или не трогает вовсе: временный файл → fsync →
+    переименование поверх старого. Сбой питания оставляет старую или новую
+    версию, но не обрезанный файл.
+    """
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class MaskCache:
+    """
+    {username: маска владения} для последних max_users зрителей; давно не
+    открывавшие вытесняются. Блокировок нет — вызывать под блокировкой хранилища.
+    """
+
+    def __init__(self, max_users=MASK_CACHE_USERS):
+        self.max_users = max_users
+        self._masks = OrderedDict()
+
+    def __len__(self):
+        return len(self._masks)
+
+    def get(self, username):
+        bits = self._masks.get(username)
+        if bits is not None:
+            self._masks.move_to_end(username)
+        return bits
+
+    def put(self, username, bits):
+        self._masks[username] = bits
+        self._masks.move_to_end(username)
+        if len(self._masks) > self.max_users:
+            self._masks.popitem(last=False)
+
+    def clear(self):
+        self._masks.clear()
+
+
+class InventoryStore:
+    """
+    Базовый интерфейс хранилища инвентаря.
+
+    Кроме списков предметов хранилище ведёт устойчивую нумерацию предметов
+    (название → номер бита, номера не меняются при правке каталога) и для
+    каждого зрителя битовую маску «что уже есть» по этим номерам.
+    """
+
+    def __init__(self):
+        self._item_ids = {}
+
+    def item_indices(self, names):
+        """Номера битов для названий предметов; новым названиям выдаются новые номера"""
+        for name in names:
+            if name not in self._item_ids:
+                self._item_ids[name] = len(self._item_ids)
+        return {name: self._item_ids[name] for name in names}
+
+    def owned_bits(self, username):
+        """Битовая маска предметов пользователя (int, бит i — предмет с номером i)"""
+        bits = 0
+        for name in self.owned_names(username):
+            idx = self._item_ids.get(name)
+            if idx is not None:
+                bits |= 1 << idx
+        return bits
+
+    def owned_names(self, username):
+        """Множество названий предметов, которые уже есть у пользователя"""
+        raise NotImplementedError
+
+    def get_items(self, username):
+        """Список предметов пользователя в порядке получения"""
+        raise NotImplementedError
+
+    def record_drop(self, username, item):
+        """
+        Атомарно записывает предмет пользователю.
+        Возвращает True, если предмет новый, и False, если он уже был.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """Удаляет инвентарь всех пользователей"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Записывает на диск то, что накопилось в памяти (для WriteBehind)"""
+
+    def pending_count(self):
+        """Сколько дропов ещё не записано на диск"""
+        return 0
+
+    def close(self):
+        pass
+
+
+class JsonInventoryStore(InventoryStore):
+    """
+    Инвентарь в одном JSON-файле (старый формат). Файл переписывается целиком,
+    поэтому с WriteBehind — не чаще раза за интервал, а не на каждый дроп.
+    """
+
+    def __init__(self, path, writer=None):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = self._load()
+        self._dirty = False
+        self._bits = MaskCache()            # маски, чтобы не перебирать инвентарь на каждое открытие
+        self._writer = writer
+        if writer is not None:
+            writer.add(self)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def item_indices(self, names):
+        with self._lock:
+            before = len(self._item_ids)
+            ids = super().item_indices(names)
+            if len(self._item_ids) != before:
+                # Предмет, получивший номер только сейчас, у кого-то уже мог быть
+                self._bits.clear()
+            return ids
+
+    def _mask(self, username):
+        """Маска из кеша или по инвентарю зрителя (под self._lock)"""
+        bits = self._bits.get(username)
+        if bits is None:
+            bits = 0
+            for it in self._data.get(username, []):
+                idx = self._item_ids.get(it["name"])
+                if idx is not None:
+                    bits |= 1 << idx
+            self._bits.put(username, bits)
+        return bits
+
+    def owned_bits(self, username):
+        with self._lock:
+            return self._mask(username)
+
+    def owned_names(self, username):
+        with self._lock:
+            return {it["name"] for it in self._data.get(username, [])}
+
+    def get_items(self, username):
+        with self._lock:
+            return list(self._data.get(username, []))
+
+    def record_drop(self, username, item):
+        with self._lock:
+            idx = self._item_ids.get(item["name"])
+            if idx is not None:
+                bits = self._mask(username)
+                if bits >> idx & 1:
+                    return False
+                self._bits.put(username, bits | (1 << idx))
+            elif any(it["name"] == item["name"] for it in self._data.get(username, [])):
+                return False
+            self._data.setdefault(username, []).append(item)
+            self._dirty = True
+        if self._writer is None:
+            self.flush()
+        return True
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            text = json.dumps(self._data, ensure_ascii=False, indent=2)
+            self._dirty = False
+        atomic_write_text(self.path, text)
+
+    def clear(self):
+        with self._lock:
+            self._data = {}
+            self._dirty = False
+            self._bits.clear()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.remove(self)
+
+
+class SqliteInventoryStore(InventoryStore):
+    """
+    Инвентарь во встроенной SQLite (журнал WAL).
+    Первичный ключ (username, item) — и индекс для проверки «уже есть»,
+    и защита от двойной записи одного предмета при параллельных запросах.
+
+    С WriteBehind дроп сначала попадает в память (маска владения и очередь
+    _pending), а в базу уходит пачкой одной транзакцией. Чтения учитывают
+    ещё не записанные дропы.
+    """
+
+    FLUSH_BATCH = 200                   # столько дропов в очереди — сбрасываем, не дожидаясь интервала
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS inventory (
+            username    TEXT NOT NULL,
+            item        TEXT NOT NULL,
+            rarity      TEXT,
+            data        TEXT NOT NULL,
+            obtained_at REAL NOT NULL,
+            PRIMARY KEY (username, item)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS item_ids (
+            name TEXT PRIMARY KEY,
+            idx  INTEGER NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS ownership (
+            username TEXT PRIMARY KEY,
+            bits     BLOB NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path, writer=None):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()       # соединение с базой
+        self._mem_lock = threading.Lock()   # маски в памяти и очередь дропов
+        self._bits = MaskCache()            # маски недавних зрителей, включая ещё не записанные дропы
+        self._pending = []                  # [(username, item, rarity, data, obtained_at, idx)]
+        # Одно соединение на процесс: Flask создаёт поток на каждый запрос,
+        # а открывать базу заново на каждый запрос дороже, чем ждать блокировку
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._item_ids = dict(self._conn.execute("SELECT name, idx FROM item_ids"))
+        self._writer = writer
+        if writer is not None:
+            writer.add(self)
+
+    def item_indices(self, names):
+        with self._lock:
+            new = [n for n in dict.fromkeys(names) if n not in self._item_ids]
+            if new:
+                # Базу может открыть и другой процесс (serve --workers): номера
+                # раздаём в транзакции, перечитав уже выданные
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._item_ids = dict(self._conn.execute("SELECT name, idx FROM item_ids"))
+                    new = [n for n in new if n not in self._item_ids]
+                    start = max(self._item_ids.values(), default=-1) + 1
+                    rows = [(name, start + i) for i, name in enumerate(new)]
+                    self._conn.executemany("INSERT INTO item_ids (name, idx) VALUES (?, ?)", rows)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._item_ids.update(rows)
+            return {name: self._item_ids[name] for name in names}
+
+    def owned_bits(self, username):
+        with self._mem_lock:
+            bits = self._bits.get(username)
+        if bits is not None:
+            return bits
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT bits FROM ownership WHERE username = ?", (username,)
+            ).fetchone()
+        bits = int.from_bytes(row[0], "little") if row else 0
+        with self._mem_lock:
+            # Пока читали базу, мог прийти дроп — его маска новее
+            cached = self._bits.get(username)
+            if cached is not None:
+                return cached
+            # Маску могли вытеснить, пока дропы зрителя ещё ждут записи
+            for row in self._pending:
+                if row[0] == username:
+                    bits |= 1 << row[5]
+            self._bits.put(username, bits)
+            return bits
+
+    def rebuild_ownership(self):
+        """Пересобирает маски владения из таблицы inventory (перенос старых данных)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT username, item FROM inventory").fetchall()
+        self.item_indices([item for _, item in rows])
+
+        masks = {}
+        for username, item in rows:
+            masks[username] = masks.get(username, 0) | (1 << self._item_ids[item])
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM ownership")
+                self._conn.executemany(
+                    "INSERT INTO ownership (username, bits) VALUES (?, ?)",
+                    [(u, _bits_to_blob(b)) for u, b in masks.items()]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        with self._mem_lock:
+            self._bits.clear()
+        return len(masks)
+
+    def _pending_rows(self, username):
+        with self._mem_lock:
+            return [row for row in self._pending if row[0] == username]
+
+    def owned_names(self, username):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item FROM inventory WHERE username = ?", (username,)
+            ).fetchall()
+        return {row[0] for row in rows} | {row[1] for row in self._pending_rows(username)}
+
+    def get_items(self, username):
+        pending = self._pending_rows(username)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item, data FROM inventory WHERE username = ? ORDER BY obtained_at",
+                (username,)
+            ).fetchall()
+        # Дроп мог записаться между двумя чтениями — одинаковые имена не дублируем
+        names = {row[0] for row in rows}
+        rows += [(row[1], row[3]) for row in pending if row[1] not in names]
+        return [json.loads(data) for _, data in rows]
+
+    def record_drop(self, username, item):
+        idx = self.item_indices([item["name"]])[item["name"]]
+        bits = self.owned_bits(username)        # подгружает маску из базы, если её ещё нет в памяти
+        with self._mem_lock:
+            cached = self._bits.get(username)
+            if cached is not None:
+                bits = cached
+            if bits >> idx & 1:
+                return False
+            self._bits.put(username, bits | (1 << idx))
+            self._pending.append((username, item["name"], item.get("rarity"),
+                                  json.dumps(item, ensure_ascii=False), time.time(), idx))
+            backlog = len(self._pending)
+        if self._writer is None:
+            self.flush()
+        elif backlog >= self.FLUSH_BATCH:
+            self._writer.poke()
+        return True
+
+    def pending_count(self):
+        with self._mem_lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Записывает накопленные дропы одной транзакцией"""
+        with self._lock:
+            with self._mem_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            added = {}
+            for username, _, _, _, _, idx in batch:
+                added[username] = added.get(username, 0) | (1 << idx)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO inventory (username, item, rarity, data, obtained_at) "
+                    "VALUES (?, ?, ?, ?, ?)", [row[:5] for row in batch]
+                )
+                # В базу — маска из базы плюс эта пачка, а не маска из памяти:
+                # там могут быть дропы следующей пачки, которых ещё нет в inventory
+                for username, bits in added.items():
+                    row = self._conn.execute(
+                        "SELECT bits FROM ownership WHERE username = ?", (username,)
+                    ).fetchone()
+                    if row:
+                        bits |= int.from_bytes(row[0], "little")
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO ownership (username, bits) VALUES (?, ?)",
+                        (username, _bits_to_blob(bits))
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                with self._mem_lock:
+                    self._pending[:0] = batch     # попробуем в следующий раз
+                raise
+
+    def clear(self):
+        with self._lock:
+            with self._mem_lock:
+                self._pending = []
+                self._bits.clear()
+            self._conn.execute("DELETE FROM inventory")
+            self._conn.execute("DELETE FROM ownership")
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value))
+            )
+
+    def import_inventories(self, inventory):
+        """Загружает {username: [item, ...]} одной транзакцией"""
+        now = time.time()
+        rows = [
+            (username, it["name"], it.get("rarity"), json.dumps(it, ensure_ascii=False), now + i * 1e-6)
+            for username, items in inventory.items()
+            for i, it in enumerate(items)
+            if isinstance(it, dict) and it.get("name")
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO inventory (username, item, rarity, data, obtained_at) "
+                    "VALUES (?, ?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.remove(self)
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+class SharedSqliteInventoryStore(SqliteInventoryStore):
+    """
+    Инвентарь, который пишут сразу несколько процессов (serve --workers N).
+    Маски владения в памяти не кешируются, каждый дроп записывается сразу
+    своей транзакцией: зритель может открыть следующий кейс в другом
+    процессе, и тот должен видеть всё, что у зрителя уже есть.
+    """
+
+    def __init__(self, path, writer=None):
+        super().__init__(path, writer=None)     # отложенной записи нет
+
+    def owned_bits(self, username):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT bits FROM ownership WHERE username = ?", (username,)
+            ).fetchone()
+        return int.from_bytes(row[0], "little") if row else 0
+
+    def record_drop(self, username, item):
+        idx = self.item_indices([item["name"]])[item["name"]]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                added = self._conn.execute(
+                    "INSERT OR IGNORE INTO inventory (username, item, rarity, data, obtained_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (username, item["name"], item.get("rarity"), json.dumps(item, ensure_ascii=False), time.time())
+                ).rowcount > 0
+                if added:
+                    row = self._conn.execute(
+                        "SELECT bits FROM ownership WHERE username = ?", (username,)
+                    ).fetchone()
+                    bits = (int.from_bytes(row[0], "little") if row else 0) | (1 << idx)
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO ownership (username, bits) VALUES (?, ?)",
+                        (username, _bits_to_blob(bits))
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return added
+
+
+def _bits_to_blob(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+def migrate_json_inventory(json_path, store):
+    """
+    Однократный перенос inventory.json в SQLite.
+    После успешного импорта файл переименовывается в *.migrated,
+    чтобы повторный запуск не импортировал его снова.
+    """
+    if not os.path.exists(json_path) or store.get_meta("json_migrated"):
+        return 0
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            inventory = json.load(f)
+    except Exception as e:
+        print(f"Не удалось прочитать {json_path} для переноса: {e}")
+        return 0
+
+    count = store.import_inventories(inventory)
+    store.set_meta("json_migrated", time.time())
+    os.replace(json_path, json_path + ".migrated")
+    print(f"Инвентарь перенесён из {json_path} в SQLite (предметов: {count})")
+    return count
+
+
+def open_inventory_store(backend, json_path, db_path, writer=None, shared=False):
+    """
+    Создаёт хранилище нужного типа ("sqlite" по умолчанию или "json").
+    writer — WriteBehind для отложенной записи; без него каждый дроп пишется сразу.
+    shared — базу пишут несколько процессов (только SQLite, без кеша в памяти).
+    """
+    if backend == "json" and not shared:
+        return JsonInventoryStore(json_path, writer)
+    if backend == "json":
+        print("Несколько процессов не могут делить inventory.json → инвентарь хранится в SQLite")
+    store = (SharedSqliteInventoryStore if shared else SqliteInventoryStore)(db_path, writer)
+    migrate_json_inventory(json_path, store)
+    if not store.get_meta("ownership_built"):
+        users = store.rebuild_ownership()
+        store.set_meta("ownership_built", time.time())
+        print(f"Собраны битовые маски владения (зрителей: {users})")
+    return store
+
+
+# =============================================================================
+#   Журнал кулдаунов
+# =============================================================================
+#
+#   Каждое открытие дописывает в журнал одну короткую строку вместо
+#   перезаписи всего cooldowns.json. При старте снимок cooldowns.json
+#   и журнал проигрываются по порядку. Когда журнал перерастает порог,
+#   фоновый поток сжимает его: пишет свежий снимок без истёкших записей
+#   и начинает журнал заново. С WriteBehind строки копятся в памяти и
+#   дописываются пачкой (write + fsync) раз в интервал.
+
+
+class CooldownJournal:
+    def __init__(self, snapshot_path, journal_path, ttl_seconds, max_journal_bytes=256 * 1024, writer=None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.rotated_path = journal_path + ".old"
+        self.ttl_seconds = ttl_seconds
+        self.max_journal_bytes = max_journal_bytes
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._compacting = False
+        self._compacted = threading.Condition(self._lock)   # сжатие закончилось
+        self._buffer = []               # строки, ещё не записанные в файл
+        self._writer = writer
+        if writer is not None:
+            writer.add(self)
+
+    # ------------------------------------------------------------------
+    #   Загрузка
+    # ------------------------------------------------------------------
+
+    def load(self):
+        """Восстанавливает {username: timestamp} из снимка и журнала, без истёкших записей"""
+        state = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    state = {k: float(v) for k, v in json.load(f).items()}
+            except Exception as e:
+                print(f"Ошибка чтения {self.snapshot_path}: {e}")
+
+        # .old остаётся, только если сжатие прервалось — он старше текущего журнала
+        for path in (self.rotated_path, self.journal_path):
+            self._replay(path, state)
+
+        cutoff = time.time() - self.ttl_seconds
+        return {k: v for k, v in state.items() if v > cutoff}
+
+    @staticmethod
+    def _replay(path, state):
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    state[record["u"]] = float(record["t"])
+                except (ValueError, KeyError, TypeError):
+                    continue    # недописанная строка после сбоя — пропускаем
+
+    # ------------------------------------------------------------------
+    #   Запись
+    # ------------------------------------------------------------------
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.journal_path, "a", encoding="utf-8")
+            self._size = self._file.tell()
+
+    def append(self, username, timestamp, snapshot):
+        """
+        Дописывает одну запись. `snapshot` — функция, возвращающая копию
+        текущего состояния; вызывается только при сжатии журнала.
+        """
+        line = json.dumps({"u": username, "t": round(timestamp, 3)}, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._writer is None:
+                self._open()
+                self._file.write(line)
+                self._file.flush()
+            else:
+                self._buffer.append(line)
+            self._size += len(line.encode("utf-8"))
+            need_compact = self._size >= self.max_journal_bytes and not self._compacting
+            if need_compact:
+                self._compacting = True
+        if need_compact:
+            threading.Thread(target=self._compact, args=(snapshot,), name="cooldown-compact", daemon=True).start()
+
+    def _write_buffer(self):
+        """Дописывает накопленные строки в журнал (вызывать под self._lock)"""
+        if not self._buffer:
+            return
+        self._open()
+        self._file.write("".join(self._buffer))
+        self._buffer = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def flush(self):
+        with self._lock:
+            self._write_buffer()
+
+    def compact(self, snapshot):
+        """
+        Пишет свежий снимок без истёкших записей и очищает журнал.
+        Если журнал уже сжимается в фоне — дожидается и сжимает ещё раз:
+        два сжатия сразу переименовали бы журнал в .old дважды, и более
+        медленное записало бы старый снимок.
+        """
+        with self._lock:
+            while self._compacting:
+                self._compacted.wait()
+            self._compacting = True
+        self._compact(snapshot)
+
+    def _compact(self, snapshot):
+        """Само сжатие; вызывающий уже поставил self._compacting"""
+        try:
+            with self._lock:
+                # Переименовываем журнал и снимаем состояние под одной блокировкой:
+                # всё из .old уже есть в снимке, новые записи пойдут в новый журнал
+                self._write_buffer()
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                if os.path.exists(self.journal_path):
+                    os.replace(self.journal_path, self.rotated_path)
+                self._size = 0
+                state = snapshot()
+
+            cutoff = time.time() - self.ttl_seconds
+            fresh = {k: v for k, v in state.items() if v > cutoff}
+            atomic_write_text(self.snapshot_path, json.dumps(fresh, ensure_ascii=False))
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+        except Exception as e:
+            print(f"Ошибка сжатия журнала кулдаунов: {e}")
+        finally:
+            with self._lock:
+                self._compacting = False
+                self._compacted.notify_all()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.remove(self)
+        with self._lock:
+            self._write_buffer()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def reset(self):
+        """Удаляет снимок и журнал (сброс всех кулдаунов)"""
+        with self._lock:
+            self._buffer = []
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._size = 0
+            for path in (self.snapshot_path, self.journal_path, self.rotated_path):
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,65 @@
+"""
+Список каналов в set_settings: перестановка основного и дополнительного.
+
+app при импорте создаёт рабочие файлы в текущей папке, поэтому импортируется
+из временной папки.
+"""
+import importlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="module")
+def ricase(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("ricase")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        module = importlib.import_module("app")
+        yield module
+    finally:
+        module.persistence.flush()
+        os.chdir(cwd)
+
+
+def settings_for(ricase, channel, extra):
+    data = dict(ricase.DEFAULT_SETTINGS)
+    data.update({"channel": channel, "extra_channels": extra, "oauth_token": ""})
+    return data
+
+
+def test_swap_primary_and_extra_channel(ricase):
+    ricase.set_settings(settings_for(ricase, "aaa", ["bbb"]))
+    primary = ricase.primary_channel
+    extra = ricase.get_channel("bbb")
+    assert extra is not primary
+
+    ricase.set_settings(settings_for(ricase, "bbb", ["aaa"]))
+
+    assert ricase.primary_channel is primary
+    assert ricase.get_channel("bbb") is primary
+    moved = ricase.get_channel("aaa")
+    assert moved is not primary
+    assert moved.data_dir == os.path.join(ricase.CHANNELS_DIR, "aaa")
+    assert moved.queue is not primary.queue
+    assert moved.cooldowns is not primary.cooldowns
+    assert sorted(ch.name for ch in ricase.all_channels()) == ["aaa", "bbb"]
+
+
+def test_extra_channel_reads_own_settings_with_absolute_config(ricase, tmp_path, monkeypatch):
+    # --config экспортирует абсолютный путь к основному файлу
+    monkeypatch.setattr(ricase, "SETTINGS_FILE", str(tmp_path / "main.json"))
+    own_dir = os.path.join(ricase.CHANNELS_DIR, "ccc")
+    os.makedirs(own_dir, exist_ok=True)
+    with open(os.path.join(own_dir, "settings.json"), "w", encoding="utf-8") as f:
+        f.write('{"queue_max_depth": 7}')
+
+    ricase.set_settings(settings_for(ricase, "aaa", ["ccc"]))
+
+    assert ricase.get_channel("ccc").settings["queue_max_depth"] == 7
+    assert ricase.primary_channel.settings.get("queue_max_depth") != 7
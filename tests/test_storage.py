@@ -0,0 +1,51 @@
+"""Журнал кулдаунов: сжатие в фоне и из save_cooldowns одновременно"""
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storage import CooldownJournal  # noqa: E402
+
+
+def test_concurrent_compactions_keep_every_cooldown(tmp_path):
+    journal = CooldownJournal(
+        str(tmp_path / "cooldowns.json"), str(tmp_path / "cooldowns.journal"), 3600, max_journal_bytes=200
+    )
+    state = {}
+    lock = threading.Lock()
+    delays = iter([0.05, 0.0] * 50)
+
+    class SlowSnapshot(dict):
+        """Снимок, который долго обходится уже после снятия — сжатия пересекаются"""
+        def items(self):
+            time.sleep(next(delays, 0.0))
+            return super().items()
+
+    def snapshot():
+        with lock:
+            return SlowSnapshot(state)
+
+    def record(key):
+        stamp = time.time()
+        with lock:
+            state[key] = stamp
+        journal.append(key, stamp, snapshot)
+
+    savers = []
+    for i in range(200):
+        record(f"u{i}")
+        if i % 20 == 0:
+            saver = threading.Thread(target=journal.compact, args=(snapshot,))
+            saver.start()
+            savers.append(saver)
+    for saver in savers:
+        saver.join()
+    while journal._compacting:
+        time.sleep(0.01)
+    journal.close()
+
+    reopened = CooldownJournal(str(tmp_path / "cooldowns.json"), str(tmp_path / "cooldowns.journal"), 3600)
+    assert set(reopened.load()) == set(state)
@@ -0,0 +1,513 @@
+import select
+import socket
+import threading
+import time
+from collections import deque
+
+# =============================================================================
+#   Разбор IRC-протокола
+# =============================================================================
+#
+#   IrcLineReader склеивает строки, разорванные между вызовами recv(),
+#   parse_irc_line разбирает одну строку вместе с тегами IRCv3
+#   (@badge-info=...;display-name=...;user-id=... :nick!nick@... PRIVMSG #chan :text)
+
+MAX_LINE_BYTES = 64 * 1024      # строка длиннее без \r\n — мусор, выбрасываем
+
+_TAG_ESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+
+def _unescape_tag(value):
+    if "\\" not in value:
+        return value
+    out = []
+    chars = iter(value)
+    for ch in chars:
+        if ch == "\\":
+            nxt = next(chars, "")
+            out.append(_TAG_ESCAPES.get(nxt, nxt))
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+class IrcMessage:
+    """Одна разобранная строка IRC"""
+    __slots__ = ("tags", "prefix", "command", "params")
+
+    def __init__(self, tags, prefix, command, params):
+        self.tags = tags
+        self.prefix = prefix
+        self.command = command
+        self.params = params
+
+    @property
+    def nick(self):
+        """Ник отправителя из префикса nick!user@host"""
+        return self.prefix.split("!", 1)[0]
+
+    @property
+    def text(self):
+        """Последний параметр (текст сообщения для PRIVMSG, токен для PING)"""
+        return self.params[-1] if self.params else ""
+
+    def __repr__(self):
+        return f"IrcMessage({self.command!r}, prefix={self.prefix!r}, params={self.params!r}, tags={self.tags!r})"
+
+
+def parse_irc_line(line):
+    """Разбирает строку IRC (без \r\n) в IrcMessage"""
+    tags = {}
+    if line.startswith("@"):
+        raw_tags, _, line = line[1:].partition(" ")
+        for pair in raw_tags.split(";"):
+            key, _, value = pair.partition("=")
+            tags[key] = _unescape_tag(value)
+        line = line.lstrip(" ")
+
+    prefix = ""
+    if line.startswith(":"):
+        prefix, _, line = line[1:].partition(" ")
+        line = line.lstrip(" ")
+
+    trailing = None
+    if line.startswith(":"):
+        line, trailing = "", line[1:]
+    else:
+        line, sep, rest = line.partition(" :")
+        if sep:
+            trailing = rest
+
+    params = line.split()
+    command = params.pop(0).upper() if params else ""
+    if trailing is not None:
+        params.append(trailing)
+    return IrcMessage(tags, prefix, command, params)
+
+
+class IrcLineReader:
+    """
+    Инкрементальная нарезка потока байт на строки IRC.
+    Неполная строка в конце пачки остаётся в буфере до следующего recv(),
+    декодирование — после нарезки, чтобы не ломать разрезанные UTF-8 символы.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, data):
+        """Добавляет прочитанные байты и возвращает список готовых строк"""
+        buffer = self._buffer + data if self._buffer else data
+        if b"\n" not in data:
+            self._buffer = buffer if len(buffer) <= MAX_LINE_BYTES else b""
+            return []
+        *lines, self._buffer = buffer.split(b"\n")
+        return [
+            line.rstrip(b"\r").decode("utf-8", errors="replace")
+            for line in lines
+            if line.strip()
+        ]
+
+
+# =============================================================================
+#   Постоянное исходящее подключение к чату Twitch
+# =============================================================================
+
+TWITCH_IRC_HOST = "irc.chat.twitch.tv"
+TWITCH_IRC_PORT = 6667
+
+# Лимиты Twitch на отправку: 20 сообщений за 30 секунд для обычного
+# аккаунта, 100 — если бот модератор или сам стример
+CHAT_RATE_LIMIT = 20
+CHAT_RATE_WINDOW = 30.0
+
+
+class SendWindow:
+    """
+    Скользящее окно отправок: не больше `capacity` сообщений за любые
+    `window` секунд. Помнит время последних `capacity` отправок; следующая
+    возможна, когда самая старая из них выйдет из окна. Так Twitch не
+    увидит лишнего сообщения ни в одном 30-секундном отрезке, даже сразу
+    после всплеска.
+    """
+
+    def __init__(self, capacity, window):
+        self.capacity = int(capacity)
+        self.window = float(window)
+        self._sent = deque()            # monotonic-время отправок за последнее окно
+
+    def _expire(self, now):
+        while self._sent and self._sent[0] <= now - self.window:
+            self._sent.popleft()
+
+    def wait_time(self):
+        """Сколько секунд ждать до следующей отправки (0 — можно отправлять)"""
+        now = time.monotonic()
+        self._expire(now)
+        if len(self._sent) < self.capacity:
+            return 0.0
+        return self._sent[len(self._sent) - self.capacity] + self.window - now
+
+    def take(self):
+        now = time.monotonic()
+        self._expire(now)
+        self._sent.append(now)
+
+
+class ChatWriter:
+    """
+    Одно долгоживущее авторизованное подключение для отправки сообщений в чат.
+    Сообщения складываются в ограниченную очередь и отправляются фоновым
+    потоком с учётом лимита Twitch. При обрыве поток сам переподключается,
+    неотправленное сообщение остаётся первым в очереди.
+    """
+
+    def __init__(self, host=TWITCH_IRC_HOST, port=TWITCH_IRC_PORT,
+                 max_queue=200, rate_limit=CHAT_RATE_LIMIT, rate_window=CHAT_RATE_WINDOW):
+        self.host = host
+        self.port = port
+        self.max_queue = max_queue
+        self.limiter = SendWindow(rate_limit, rate_window)
+
+        self._queue = deque()                 # [(канал, сообщение, время постановки в очередь)]
+        self._cond = threading.Condition()
+        self._thread = None
+        self._sock = None
+        self._reader = IrcLineReader()
+        self._pending_lines = []
+
+        self._token = ""
+        self._nick = ""
+        self._config_version = 0              # растёт при смене токена/ника → переподключение
+        self._joined = set()                  # каналы, в которые уже зашли на этом подключении
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.connected = False
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self._latency_total_ms = 0.0
+
+    # ------------------------------------------------------------------
+    #   Публичный интерфейс
+    # ------------------------------------------------------------------
+
+    def configure(self, token, nick):
+        """Задаёт учётные данные; при изменении подключение будет пересоздано"""
+        with self._cond:
+            if (token, nick) != (self._token, self._nick):
+                self._token, self._nick = token, nick
+                self._config_version += 1
+                self._cond.notify_all()
+
+    def set_server(self, host, port, rate_limit):
+        """
+        Адрес сервера чата и лимит отправки из настроек. Смена адреса —
+        переподключение; лимит меняется на ходу, отправки за последнее окно
+        при этом учитываются.
+        """
+        with self._cond:
+            if (host, port) != (self.host, self.port):
+                self.host, self.port = host, port
+                self._config_version += 1
+            self.limiter.capacity = int(rate_limit)
+            self._cond.notify_all()
+
+    def send(self, message, channel):
+        """
+        Ставит сообщение в очередь на отправку в канал.
+        message может быть функцией без аргументов: тогда текст собирается
+        в момент отправки (None — отправлять нечего). Так ChatNotices
+        склеивает ответы, накопившиеся, пока сообщение ждало очереди.
+        Возвращает False, если очередь переполнена (сообщение отброшено).
+        """
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return False
+            self._queue.append((channel, message, time.monotonic()))
+            self._cond.notify_all()
+        self._ensure_started()
+        return True
+
+    def stats(self):
+        """Счётчики отправки для диагностики"""
+        with self._cond:
+            return {
+                "connected": self.connected,
+                "queued": len(self._queue),
+                "sent": self.sent,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "reconnects": self.reconnects,
+                "last_latency_ms": round(self.last_latency_ms, 1),
+                "avg_latency_ms": round(self._latency_total_ms / self.sent, 1) if self.sent else 0.0,
+                "max_latency_ms": round(self.max_latency_ms, 1),
+            }
+
+    # ------------------------------------------------------------------
+    #   Фоновый поток
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+            self._thread.start()
+
+    def _connect(self, token, nick):
+        """Подключается и проходит авторизацию, дожидаясь ответа сервера"""
+        sock = socket.create_connection((self.host, self.port), timeout=10)
+        sock.sendall(f"PASS {token}\r\nNICK {nick}\r\n".encode("utf-8"))
+        self._joined = set()
+
+        self._reader = IrcLineReader()
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("сервер закрыл соединение при авторизации")
+            lines = self._reader.feed(chunk)
+            for i, line in enumerate(lines):
+                msg = parse_irc_line(line)
+                if msg.command == "NOTICE" and "auth" in msg.text.lower():
+                    raise PermissionError(f"Twitch отклонил OAuth-токен: {msg.text}")
+                if msg.command == "001":
+                    self._pending_lines = lines[i + 1:]   # в той же пачке может прийти PING
+                    sock.settimeout(10)
+                    return sock
+        raise TimeoutError("нет ответа на авторизацию")
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self.connected = False
+
+    def _answer_pings(self):
+        """Читает входящие строки без блокировки и отвечает на PING"""
+        while True:
+            for line in self._pending_lines:
+                msg = parse_irc_line(line)
+                if msg.command == "PING":
+                    self._sock.sendall(f"PONG :{msg.text}\r\n".encode("utf-8"))
+            self._pending_lines = []
+
+            ready, _, _ = select.select([self._sock], [], [], 0)
+            if not ready:
+                return
+            chunk = self._sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("сервер закрыл соединение")
+            self._pending_lines = self._reader.feed(chunk)
+
+    def _run(self):
+        backoff = 1
+        connected_version = None
+        while True:
+            with self._cond:
+                while not self._queue and self._sock is None:
+                    self._cond.wait()
+                token, nick = self._token, self._nick
+                version = self._config_version
+
+            try:
+                if self._sock is not None and version != connected_version:
+                    self._close()
+                if self._sock is None:
+                    if not token:
+                        with self._cond:
+                            dropped = list(self._queue)
+                            self.failed += len(dropped)
+                            self._queue.clear()
+                        # Отложенные сообщения собираем и выбрасываем: так их
+                        # источник (ChatNotices) узнаёт, что место освободилось
+                        for _, message, _ in dropped:
+                            if callable(message):
+                                message()
+                        continue
+                    if connected_version is not None:
+                        self.reconnects += 1
+                    self._sock = self._connect(token, nick)
+                    connected_version = version
+                    self.connected = True
+                    backoff = 1
+                    print("[CHAT] Подключено к чату для отправки сообщений")
+
+                self._answer_pings()
+
+                with self._cond:
+                    if not self._queue:
+                        self._cond.wait(timeout=1)
+                    if not self._queue:
+                        continue
+                    channel, message, queued_at = self._queue[0]
+
+                delay = self.limiter.wait_time()
+                if delay > 0:
+                    time.sleep(min(delay, 1))
+                    continue
+
+                if callable(message):
+                    # Собранный текст запоминаем: при обрыве отправим его же, а не соберём заново
+                    message = message()
+                    with self._cond:
+                        if message is None:
+                            self._queue.popleft()
+                            continue
+                        self._queue[0] = (channel, message, queued_at)
+
+                if channel not in self._joined:
+                    self._sock.sendall(f"JOIN #{channel}\r\n".encode("utf-8"))
+                    self._joined.add(channel)
+                self._sock.sendall(f"PRIVMSG #{channel} :{message}\r\n".encode("utf-8"))
+                self.limiter.take()
+                latency_ms = (time.monotonic() - queued_at) * 1000
+                with self._cond:
+                    self._queue.popleft()
+                    self.sent += 1
+                    self.last_latency_ms = latency_ms
+                    self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+                    self._latency_total_ms += latency_ms
+                print(f"[CHAT] Отправлено: {message}")
+
+            except Exception as e:
+                print(f"Ошибка отправки в чат: {e} → переподключение через {backoff} сек")
+                self._close()
+                with self._cond:
+                    if self._queue:
+                        self.failed += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+
+# =============================================================================
+#   Склеенные ответы зрителям
+# =============================================================================
+#
+#   Когда 200 зрителей на кулдауне пишут !open, отвечать каждому отдельной
+#   строкой бессмысленно: лимит Twitch — 20 сообщений за 30 секунд, и
+#   последние ответы ушли бы через пять минут. Однотипные ответы копятся
+#   по каналу и уходят одной строкой с несколькими @упоминаниями.
+
+MAX_MESSAGE_CHARS = 500         # Twitch не принимает PRIVMSG длиннее
+NOTICE_MAX_AGE = 30.0           # ответ старше этого уже не нужен, сек
+NOTICE_REPEAT_SEC = 60.0        # зрителю, которому уже ответили, повторно не отвечаем столько секунд
+
+
+class ChatNotices:
+    """
+    Однотипные ответы зрителям («подожди ещё…», «очередь переполнена»).
+    На канал и вид ответа в очереди ChatWriter стоит одно место; текст
+    собирается в момент отправки из всего, что накопилось, — чем сильнее
+    отстаёт чат, тем больше упоминаний в одной строке.
+    """
+
+    def __init__(self, writer, render, max_age=NOTICE_MAX_AGE, max_chars=MAX_MESSAGE_CHARS,
+                 repeat_sec=NOTICE_REPEAT_SEC):
+        self.writer = writer
+        self.render = render            # render(вид, [(ник, until), ...]) → текст сообщения
+        self.max_age = max_age
+        self.max_chars = max_chars
+        self.repeat_sec = repeat_sec
+
+        self._lock = threading.Lock()
+        self._pending = {}              # {(канал, вид): {ник: (until, время постановки)}}
+        self._answered = {}             # {(канал, вид, ник): когда ответили} — по возрастанию времени
+
+        self.notices = 0                # сколько ответов поставлено
+        self.messages = 0               # сколько строк ушло в ChatWriter
+        self.mentions = 0               # сколько ответов в них вошло
+        self.stale = 0                  # отброшено: устарели или кулдаун уже прошёл
+        self.repeats = 0                # не поставлено: этому зрителю только что ответили
+        self.dropped = 0                # отброшено: очередь ChatWriter переполнена
+
+    def notify(self, channel, kind, username, until=None):
+        """
+        Ставит ответ зрителю. until — time.time(), после которого ответ теряет
+        смысл (конец кулдауна). Повтор от того же зрителя заменяет прежний.
+        Не блокирует: только запись в память.
+        """
+        key = (channel, kind)
+        with self._lock:
+            self.notices += 1
+            if (channel, kind, username) in self._answered:
+                self._forget_answered(time.monotonic())
+                if (channel, kind, username) in self._answered:
+                    self.repeats += 1
+                    return
+            group = self._pending.get(key)
+            scheduled = group is not None
+            if group is None:
+                group = self._pending[key] = {}
+            group.pop(username, None)
+            group[username] = (until, time.monotonic())
+        if not scheduled:
+            self._schedule(key)
+
+    def _schedule(self, key):
+        if not self.writer.send(lambda: self._build(key), key[0]):
+            with self._lock:
+                self.dropped += len(self._pending.pop(key, {}))
+
+    def _build(self, key):
+        """Текст из накопившихся ответов (вызывает ChatWriter перед отправкой)"""
+        now, wall = time.monotonic(), time.time()
+        text = None
+        with self._lock:
+            group = self._pending.get(key, {})
+            taken = []
+            for username, (until, queued_at) in list(group.items()):
+                if now - queued_at > self.max_age or (until is not None and until <= wall):
+                    del group[username]
+                    self.stale += 1
+                    continue
+                candidate = self.render(key[1], taken + [(username, until)])
+                if len(candidate) > self.max_chars and taken:
+                    break
+                taken.append((username, until))
+                text = candidate
+                del group[username]
+            if taken:
+                self.messages += 1
+                self.mentions += len(taken)
+                self._forget_answered(now)
+                for username, _ in taken:
+                    self._answered[key + (username,)] = now
+            more = bool(group)
+            if not more:
+                self._pending.pop(key, None)
+        if more:
+            self._schedule(key)         # остаток — следующей строкой
+        return text
+
+    def _forget_answered(self, now):
+        """Убирает старые отметки «уже ответили» — с начала, там самые старые (под self._lock)"""
+        answered = self._answered
+        while answered:
+            first = next(iter(answered))
+            if now - answered[first] < self.repeat_sec:
+                break
+            del answered[first]
+
+    def stats(self):
+        """Сколько ответов ждут и насколько отстаёт отправка"""
+        now = time.monotonic()
+        with self._lock:
+            waiting = [queued_at for group in self._pending.values() for _, queued_at in group.values()]
+            return {
+                "pending": len(waiting),
+                "lag_sec": round(now - min(waiting), 3) if waiting else 0.0,
+                "notices": self.notices,
+                "messages": self.messages,
+                "mentions": self.mentions,
+                "stale": self.stale,
+                "repeats": self.repeats,
+                "dropped": self.dropped,
+            }
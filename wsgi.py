@@ -0,0 +1,17 @@
+"""
+Точка входа для внешнего WSGI-сервера (gunicorn, waitress-serve, uwsgi).
+
+Каждый процесс сервера — обработчик с общим состоянием в shared.db. Чат
+слушает и пишет отдельный главный процесс, его нужно запустить рядом
+с той же рабочей папкой:
+
+    python -m ricase serve --workers 0 --data-dir /var/lib/ricase
+    gunicorn --chdir /var/lib/ricase --pythonpath /opt/ricase -w 4 -k gthread --threads 16 -b 0.0.0.0:5000 wsgi:application
+
+(/opt/ricase — папка с программой; рабочая папка та же, что --data-dir.)
+"""
+import os
+
+os.environ.setdefault("RICASE_SHARED_ROLE", "worker")
+
+from app import app as application  # noqa: E402,F401